@@ -0,0 +1 @@
+"""Benchmarks for the claims-to-quality analyzer."""
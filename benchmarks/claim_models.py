@@ -0,0 +1,145 @@
+"""
+Compare memory per claim and construction rate of the Claim model, ClaimRecord and ClaimBatch.
+
+Usage:
+    python -m benchmarks.claim_models --num-claims 20000 --lines-per-claim 4
+"""
+import argparse
+import datetime
+import gc
+import json
+import time
+import tracemalloc
+
+from claims_to_quality.analyzer.models.claim import Claim
+from claims_to_quality.analyzer.models.claim_batch import ClaimBatch
+from claims_to_quality.analyzer.models.claim_record import ClaimLineRecord, ClaimRecord
+
+
+def _build_claim_values(num_claims, lines_per_claim):
+    """Build typed claim values shaped like the output of the Teradata type converter."""
+    start = datetime.date(2018, 1, 1)
+    claims = []
+    for index in range(num_claims):
+        from_dt = start + datetime.timedelta(days=index % 365)
+        claims.append({
+            'splt_clm_id': 'splt_clm_id_{}'.format(index),
+            'bene_sk': 'bene_sk_{}'.format(index % 1000),
+            'clm_rndrg_prvdr_npi_num': '0123456789',
+            'clm_rndrg_prvdr_tax_num': '012345678',
+            'clm_ptnt_birth_dt': datetime.date(1940 + index % 40, 1 + index % 12, 1),
+            'clm_bene_sex_cd': str(1 + index % 2),
+            'clm_from_dt': from_dt,
+            'clm_thru_dt': from_dt,
+            'dx_codes': ['E119', 'I10', 'Z0000'],
+            'claim_lines': [
+                {
+                    'clm_line_num': line_number,
+                    'clm_line_hcpcs_cd': '99213' if line_number else 'G8482',
+                    'mdfr_cds': ['25'],
+                    'clm_pos_code': '11',
+                    'clm_line_from_dt': from_dt,
+                    'clm_line_thru_dt': from_dt,
+                }
+                for line_number in range(lines_per_claim)
+            ],
+        })
+    return claims
+
+
+def _build_claim_models(claim_values):
+    return [Claim(values) for values in claim_values]
+
+
+def _build_claim_records(claim_values):
+    # Copy list values so that both builders own the same amount of data, as in claim_reader.
+    return [
+        ClaimRecord(
+            dx_codes=list(values['dx_codes']),
+            claim_lines=[
+                ClaimLineRecord(**dict(line, mdfr_cds=list(line['mdfr_cds'])))
+                for line in values['claim_lines']
+            ],
+            **{
+                key: value for key, value in values.items()
+                if key not in ('claim_lines', 'dx_codes')
+            }
+        )
+        for values in claim_values
+    ]
+
+
+def _build_claim_batch(claim_values):
+    # Group by a synthetic provider, 100 claims each, as in a batch of providers.
+    claims = _build_claim_records(claim_values)
+    return ClaimBatch(
+        (('tin', str(start)), claims[start:start + 100]) for start in range(0, len(claims), 100)
+    )
+
+
+def _measure_retained_batch(claim_values):
+    """Return the bytes per claim retained by a ClaimBatch once the records are released."""
+    gc.collect()
+    tracemalloc.start()
+    batch = _build_claim_batch(claim_values)
+    gc.collect()
+    retained, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del batch
+    return {'bytes_per_claim': round(retained / len(claim_values))}
+
+
+def _measure(builder, claim_values):
+    """Return (claims per second, bytes per claim) for the given builder."""
+    gc.collect()
+    start_time = time.perf_counter()
+    claims = builder(claim_values)
+    elapsed = time.perf_counter() - start_time
+    del claims
+
+    gc.collect()
+    tracemalloc.start()
+    claims = builder(claim_values)
+    allocated, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del claims
+
+    return {
+        'claims_per_second': round(len(claim_values) / elapsed),
+        'bytes_per_claim': round(allocated / len(claim_values)),
+    }
+
+
+def run(num_claims, lines_per_claim):
+    """Run the comparison and return the results as a dictionary."""
+    claim_values = _build_claim_values(num_claims, lines_per_claim)
+    results = {
+        'num_claims': num_claims,
+        'lines_per_claim': lines_per_claim,
+        'claim_model': _measure(_build_claim_models, claim_values),
+        'claim_record': _measure(_build_claim_records, claim_values),
+        'claim_batch': _measure_retained_batch(claim_values),
+    }
+    results['speedup'] = round(
+        results['claim_record']['claims_per_second'] /
+        results['claim_model']['claims_per_second'], 1)
+    results['memory_ratio'] = round(
+        results['claim_model']['bytes_per_claim'] /
+        results['claim_record']['bytes_per_claim'], 1)
+    results['batch_memory_ratio'] = round(
+        results['claim_record']['bytes_per_claim'] /
+        results['claim_batch']['bytes_per_claim'], 1)
+    return results
+
+
+def _get_arguments():
+    parser = argparse.ArgumentParser(
+        description='Compare the Claim model, ClaimRecord and ClaimBatch costs.')
+    parser.add_argument('--num-claims', default=20000, type=int)
+    parser.add_argument('--lines-per-claim', default=4, type=int)
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = _get_arguments()
+    print(json.dumps(run(args.num_claims, args.lines_per_claim), indent=2))
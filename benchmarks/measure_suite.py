@@ -0,0 +1,200 @@
+"""
+Time measure calculation per calculator class, claim assembly and submission serialization.
+
+Claims are generated with benchmarks.synthetic_claims. Measures which query the IDR during
+calculation (46, 407, 415 and 416) run against a local stub returning a discharge, CT scan and
+MSSA episode for every beneficiary on the dates of their claims.
+
+Results are printed as JSON, so that they can be stored and compared across releases.
+
+Usage:
+    python -m benchmarks.measure_suite --num-providers 20 --repeat 3 > results.json
+"""
+import argparse
+import collections
+import datetime
+import json
+import platform
+import time
+
+from benchmarks import synthetic_claims
+
+from claims_to_quality.analyzer import measure_mapping
+from claims_to_quality.analyzer.datasource import claim_reader
+from claims_to_quality.analyzer.submission import qpp_measurement_set
+
+import mock
+
+EPISODE_LENGTH = datetime.timedelta(days=30)
+
+
+class LocalIDRStub(object):
+    """Replace IDR queries made during calculation with rows derived from the given claims."""
+
+    def __init__(self, claims_by_provider):
+        """Build one row per beneficiary and claim date."""
+        bene_dates = {
+            (claim.bene_sk, claim.clm_from_dt)
+            for claims in claims_by_provider.values()
+            for claim in claims
+        }
+        self.rows = [
+            {
+                'bene_sk': bene_sk,
+                'clm_line_from_dt': date,
+                'min_date': date - EPISODE_LENGTH,
+                'max_date': date + EPISODE_LENGTH,
+            }
+            for bene_sk, date in sorted(bene_dates)
+        ]
+        self.num_queries = 0
+
+    def execute(self, query, *args, **kwargs):
+        """Return the stub rows, whatever the query."""
+        self.num_queries += 1
+        return self.rows
+
+    def patch(self):
+        """Return a patcher routing teradata_methods.execute.execute to the stub."""
+        return mock.patch(
+            'claims_to_quality.lib.teradata_methods.execute.execute', side_effect=self.execute)
+
+
+def _best_time(function, repeat):
+    """Return the result and the smallest elapsed time in seconds of `repeat` calls."""
+    best_elapsed = float('inf')
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        result = function()
+        best_elapsed = min(best_elapsed, time.perf_counter() - start_time)
+    return result, best_elapsed
+
+
+def benchmark_lines_to_claim(generator, repeat):
+    """Time ClaimsDataReader._lines_to_claim over all the generated claims."""
+    columns, rows = generator.generate_rows()
+    claims_lines = synthetic_claims.group_rows_by_claim(rows)
+    reader = claim_reader.ClaimsDataReader()
+
+    _, elapsed = _best_time(
+        lambda: [reader._lines_to_claim(claim_lines, columns) for claim_lines in claims_lines],
+        repeat
+    )
+    return {
+        'num_claims': len(claims_lines),
+        'num_lines': len(rows),
+        'seconds': elapsed,
+        'claims_per_second': round(len(claims_lines) / elapsed),
+    }
+
+
+def benchmark_measure_classes(claims_by_provider, year, repeat):
+    """
+    Time the execute method of the calculators of each class, over all providers.
+
+    Returns:
+        (results by class name, measure results by provider) tuple.
+    """
+    calculators = measure_mapping.get_measure_calculators(
+        sorted(measure_mapping.get_all_measure_ids(year)), year=year)
+    calculators_by_class = collections.defaultdict(dict)
+    for measure_number, calculator in calculators.items():
+        calculators_by_class[type(calculator).__name__][measure_number] = calculator
+
+    num_claims = sum(len(claims) for claims in claims_by_provider.values())
+    stub = LocalIDRStub(claims_by_provider)
+    class_results = {}
+    measure_results_by_provider = collections.defaultdict(dict)
+
+    with stub.patch():
+        for class_name, class_calculators in sorted(calculators_by_class.items()):
+            def execute_class():
+                results = {}
+                for provider, claims in claims_by_provider.items():
+                    for measure_number, calculator in class_calculators.items():
+                        # Measure 46 caches discharge dates across providers within a batch.
+                        if hasattr(calculator, 'clear_discharge_date_cache'):
+                            calculator.clear_discharge_date_cache()
+                        results[provider, measure_number] = calculator.execute(claims)
+                return results
+
+            results, elapsed = _best_time(execute_class, repeat)
+            for (provider, measure_number), measure_results in results.items():
+                measure_results_by_provider[provider][measure_number] = (
+                    calculators[measure_number], measure_results)
+
+            class_results[class_name] = {
+                'measures': sorted(class_calculators),
+                'seconds': elapsed,
+                'claims_per_second': round(num_claims * len(class_calculators) / elapsed),
+            }
+
+    return class_results, measure_results_by_provider
+
+
+def benchmark_to_json(measure_results_by_provider, year, repeat):
+    """Time MeasurementSet.to_json for every provider."""
+    measurement_sets = []
+    for (tin, npi), measure_results in sorted(measure_results_by_provider.items()):
+        measurement_set = qpp_measurement_set.MeasurementSet(
+            tin=tin,
+            npi=npi,
+            performance_start=datetime.date(year, 1, 1),
+            performance_end=datetime.date(year, 12, 31)
+        )
+        for measure_number, (calculator, results) in sorted(measure_results.items()):
+            if calculator.has_multiple_strata:
+                measurement_set.add_measure_with_multiple_strata(measure_number, results)
+            else:
+                measurement_set.add_measure(measure_number, results)
+        measurement_sets.append(measurement_set)
+
+    _, elapsed = _best_time(
+        lambda: [measurement_set.to_json() for measurement_set in measurement_sets], repeat)
+    return {
+        'num_measurement_sets': len(measurement_sets),
+        'num_measurements': sum(
+            len(measurement_set.data['measurements']) for measurement_set in measurement_sets),
+        'seconds': elapsed,
+    }
+
+
+def run(generator, repeat=3):
+    """Run the benchmark suite and return the results as a dictionary."""
+    claims_by_provider = generator.generate_claims_by_provider()
+    class_results, measure_results_by_provider = benchmark_measure_classes(
+        claims_by_provider, generator.year, repeat)
+
+    return {
+        'python_version': platform.python_version(),
+        'repeat': repeat,
+        'generator': generator.get_parameters(),
+        'lines_to_claim': benchmark_lines_to_claim(generator, repeat),
+        'measure_classes': class_results,
+        'to_json': benchmark_to_json(measure_results_by_provider, generator.year, repeat),
+    }
+
+
+def _get_arguments():
+    parser = argparse.ArgumentParser(description='Run the measure calculation benchmark suite.')
+    parser.add_argument('--seed', default=0, type=int)
+    parser.add_argument('--num-providers', default=10, type=int)
+    parser.add_argument('--beneficiaries-per-provider', default=50, type=int)
+    parser.add_argument('--claims-per-beneficiary', default=3, type=int)
+    parser.add_argument('--lines-per-claim', default=3, type=int)
+    parser.add_argument('--qdc-rate', default=0.5, type=float)
+    parser.add_argument('--repeat', default=3, type=int)
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = _get_arguments()
+    generator = synthetic_claims.SyntheticClaimsGenerator(
+        seed=args.seed,
+        num_providers=args.num_providers,
+        beneficiaries_per_provider=args.beneficiaries_per_provider,
+        claims_per_beneficiary=args.claims_per_beneficiary,
+        lines_per_claim=args.lines_per_claim,
+        qdc_rate=args.qdc_rate,
+    )
+    print(json.dumps(run(generator, repeat=args.repeat), indent=2, sort_keys=True))
@@ -0,0 +1,235 @@
+"""
+Seeded generator of synthetic claim lines drawing realistic codes from the single source JSON.
+
+Each beneficiary is given claims eligible for one randomly chosen measure: the claim lines use
+the measure's encounter codes, with compatible modifiers and places of service, and the claims
+use the measure's diagnosis codes, age and sex criteria. A proportion of the claims (the QDC
+rate) also have a line for each quality data code of one of the measure's performance options.
+
+Rows are Teradata rows with the columns of the claims query, so that they can be given to
+ClaimsDataReader as if they had been read from the IDR.
+
+Usage:
+    python -m benchmarks.synthetic_claims --num-providers 2 --output claims.csv
+"""
+import argparse
+import collections
+import datetime
+import random
+
+from claims_to_quality.analyzer import measure_mapping
+from claims_to_quality.analyzer.datasource import claim_reader, measure_reader
+from claims_to_quality.config import config
+from claims_to_quality.lib.teradata_methods import row_handling
+
+COLUMNS = (
+    ['bene_sk', 'splt_clm_id', 'clm_line_num', 'clm_line_rndrg_prvdr_npi_num',
+     'clm_rndrg_prvdr_tax_num', 'clm_ptnt_birth_dt', 'clm_bene_sex_cd', 'clm_from_dt',
+     'clm_line_from_dt', 'clm_thru_dt', 'clm_line_thru_dt', 'clm_pos_cd', 'clm_line_hcpcs_cd'] +
+    claim_reader.ClaimsDataReader.MODIFIER_CODE_COLUMNS +
+    claim_reader.ClaimsDataReader.DX_CODE_COLUMNS
+)
+
+# Codes that are not mentioned in any measure, used to pad claims.
+FILLER_PROCEDURE_CODES = ['36415', '80053', '85025', '93000', '71046']
+FILLER_DIAGNOSIS_CODES = ['Z0000', 'R079', 'M545', 'J069', 'R51']
+DEFAULT_PLACES_OF_SERVICE = ['11', '22', '21']
+SEX_CODES = {'M': '1', 'F': '2'}
+
+MeasureCodes = collections.namedtuple(
+    'MeasureCodes', ['measure_number', 'eligibility_options', 'performance_options'])
+
+
+class SyntheticClaimsGenerator(object):
+    """Generate reproducible synthetic claim lines for a set of measures."""
+
+    def __init__(
+            self,
+            seed=0,
+            num_providers=10,
+            beneficiaries_per_provider=50,
+            claims_per_beneficiary=3,
+            lines_per_claim=3,
+            qdc_rate=0.5,
+            measure_numbers=None,
+            year=None):
+        """
+        Create a SyntheticClaimsGenerator.
+
+        Args:
+            seed (int): Seed of the random number generator.
+            num_providers (int): Number of (TIN, NPI) pairs.
+            beneficiaries_per_provider (int): Number of beneficiaries seen by each provider.
+            claims_per_beneficiary (int): Number of claims per beneficiary and provider.
+            lines_per_claim (int): Minimum number of lines per claim, including encounter lines.
+            qdc_rate (float): Proportion of claims with quality data codes.
+            measure_numbers (list(str)): Measures to draw codes from (default: all measures
+                supported for the year).
+            year (int): Measures year (default: config).
+        """
+        self.seed = seed
+        self.num_providers = num_providers
+        self.beneficiaries_per_provider = beneficiaries_per_provider
+        self.claims_per_beneficiary = claims_per_beneficiary
+        self.lines_per_claim = lines_per_claim
+        self.qdc_rate = qdc_rate
+        self.year = year or config.get('calculation.measures_year')
+        self.measures = _load_measure_codes(self.year, measure_numbers)
+
+    def get_parameters(self):
+        """Return the generator parameters as a JSON-serializable dictionary."""
+        return {
+            'seed': self.seed,
+            'num_providers': self.num_providers,
+            'beneficiaries_per_provider': self.beneficiaries_per_provider,
+            'claims_per_beneficiary': self.claims_per_beneficiary,
+            'lines_per_claim': self.lines_per_claim,
+            'qdc_rate': self.qdc_rate,
+            'year': self.year,
+            'num_measures': len(self.measures),
+        }
+
+    def generate_rows(self):
+        """
+        Generate the claim lines of all providers.
+
+        Returns:
+            (columns, rows) as returned by the claims query, sorted by TIN, NPI and claim ID.
+        """
+        rng = random.Random(self.seed)
+        values = []
+        for provider_index in range(self.num_providers):
+            tin = '{:09d}'.format(100000000 + provider_index)
+            npi = '{:010d}'.format(1000000000 + provider_index)
+            for beneficiary_index in range(self.beneficiaries_per_provider):
+                bene_sk = 'bene_{}_{}'.format(provider_index, beneficiary_index)
+                values.extend(self._generate_beneficiary_lines(rng, tin, npi, bene_sk))
+
+        values.sort(key=lambda row: (row[4], row[3], row[1], row[2]))
+        columns = {column: index for index, column in enumerate(COLUMNS)}
+        return columns, row_handling.convert_list_of_lists_to_teradata_rows(values, COLUMNS)
+
+    def generate_claims_by_provider(self, reader=None):
+        """Return a dictionary of (tin, npi) --> list of claim records."""
+        reader = reader or claim_reader.ClaimsDataReader()
+        columns, rows = self.generate_rows()
+        claims_by_provider = collections.defaultdict(list)
+        for claim_lines in group_rows_by_claim(rows):
+            claim = reader._lines_to_claim(claim_lines, columns)
+            claims_by_provider[
+                (claim.clm_rndrg_prvdr_tax_num, claim.clm_rndrg_prvdr_npi_num)
+            ].append(claim)
+        return dict(claims_by_provider)
+
+    def _generate_beneficiary_lines(self, rng, tin, npi, bene_sk):
+        measure = rng.choice(self.measures)
+        option = rng.choice(measure.eligibility_options)
+
+        min_age = int(option.get('minAge') or 18)
+        max_age = int(option.get('maxAge') or max(min_age, 90))
+        birth_date = datetime.date(self.year - rng.randint(min_age, max_age) - 1, 1, 1)
+        sex_code = SEX_CODES.get(option.get('sexCode')) or rng.choice(['1', '2'])
+
+        rows = []
+        for claim_index in range(self.claims_per_beneficiary):
+            claim_date = datetime.date(self.year, 1, 1) + datetime.timedelta(
+                days=rng.randrange(365))
+            line_codes = [_draw_line_code(rng, rng.choice(option['procedureCodes']))]
+            if option.get('additionalProcedureCodes'):
+                line_codes.append(
+                    _draw_line_code(rng, rng.choice(option['additionalProcedureCodes'])))
+            if measure.performance_options and rng.random() < self.qdc_rate:
+                performance_option = rng.choice(measure.performance_options)
+                line_codes.extend(
+                    _draw_line_code(rng, code) for code in performance_option['qualityCodes'])
+            while len(line_codes) < self.lines_per_claim:
+                line_codes.append((rng.choice(FILLER_PROCEDURE_CODES), [], None))
+
+            diagnosis_codes = [
+                rng.choice(option[column]).replace('.', '')
+                for column in ('diagnosisCodes', 'additionalDiagnosisCodes') if option.get(column)
+            ]
+            diagnosis_codes.append(rng.choice(FILLER_DIAGNOSIS_CODES))
+            diagnosis_codes = (diagnosis_codes + [''] * 12)[:12]
+
+            claim_id = '{}_{}'.format(bene_sk, claim_index)
+            place_of_service = rng.choice(DEFAULT_PLACES_OF_SERVICE)
+            for line_number, (code, modifiers, line_place_of_service) in enumerate(line_codes):
+                rows.append(
+                    [bene_sk, claim_id, line_number + 1, npi, tin, birth_date, sex_code,
+                     claim_date, claim_date, claim_date, claim_date,
+                     line_place_of_service or place_of_service, code] +
+                    (modifiers + [''] * 5)[:5] +
+                    diagnosis_codes
+                )
+        return rows
+
+
+def group_rows_by_claim(rows):
+    """Group rows sorted by claim ID into lists of lines of the same claim."""
+    claims_lines = []
+    for row in rows:
+        if claims_lines and claims_lines[-1][0]['splt_clm_id'] == row['splt_clm_id']:
+            claims_lines[-1].append(row)
+        else:
+            claims_lines.append([row])
+    return claims_lines
+
+
+def _draw_line_code(rng, measure_code):
+    """Return (code, modifiers, place of service) for a line matching the given measure code."""
+    modifiers = [rng.choice(measure_code['modifiers'])] if measure_code.get('modifiers') else []
+    places_of_service = measure_code.get('placesOfService')
+    place_of_service = rng.choice(places_of_service) if places_of_service else None
+    if not place_of_service and measure_code.get('placesOfServiceExclusions'):
+        place_of_service = next(
+            pos for pos in DEFAULT_PLACES_OF_SERVICE
+            if pos not in measure_code['placesOfServiceExclusions']
+        )
+    return measure_code['code'], modifiers, place_of_service
+
+
+def _load_measure_codes(year, measure_numbers=None):
+    """Return the codes of the measures with eligibility options based on procedure codes."""
+    single_source = measure_reader.load_single_source(
+        config.get('assets.qpp_single_source_json')[year])
+    measures = []
+    for measure_number in sorted(measure_numbers or measure_mapping.get_all_measure_ids(year)):
+        measure_json = single_source[measure_number]
+        eligibility_options = [
+            option for option in measure_json.get('eligibilityOptions', [])
+            if option.get('procedureCodes')
+        ]
+        if eligibility_options:
+            measures.append(MeasureCodes(
+                measure_number=measure_number,
+                eligibility_options=eligibility_options,
+                performance_options=measure_json['performanceOptions'],
+            ))
+    return measures
+
+
+def _get_arguments():
+    parser = argparse.ArgumentParser(description='Generate synthetic claim lines as a CSV file.')
+    parser.add_argument('--seed', default=0, type=int)
+    parser.add_argument('--num-providers', default=10, type=int)
+    parser.add_argument('--beneficiaries-per-provider', default=50, type=int)
+    parser.add_argument('--claims-per-beneficiary', default=3, type=int)
+    parser.add_argument('--lines-per-claim', default=3, type=int)
+    parser.add_argument('--qdc-rate', default=0.5, type=float)
+    parser.add_argument('--output', required=True)
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = _get_arguments()
+    generator = SyntheticClaimsGenerator(
+        seed=args.seed,
+        num_providers=args.num_providers,
+        beneficiaries_per_provider=args.beneficiaries_per_provider,
+        claims_per_beneficiary=args.claims_per_beneficiary,
+        lines_per_claim=args.lines_per_claim,
+        qdc_rate=args.qdc_rate,
+    )
+    _, rows = generator.generate_rows()
+    row_handling.to_csv(rows, args.output, anonymize=False)
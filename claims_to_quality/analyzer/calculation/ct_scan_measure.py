@@ -1,6 +1,12 @@
 """Processes a provider's claims to assess whether they meet CT Scan criteria."""
+import collections
+
 from claims_to_quality.analyzer.calculation.qpp_measure import QPPMeasure
+from claims_to_quality.analyzer.datasource import lookup_cache
+from claims_to_quality.analyzer.models import claim_batch
 from claims_to_quality.analyzer.processing import claim_filtering
+from claims_to_quality.config import config
+from claims_to_quality.lib import newrelic_application
 from claims_to_quality.lib.connectors import idr_queries
 from claims_to_quality.lib.helpers.decorators import override
 from claims_to_quality.lib.qpp_logging import logging_config
@@ -20,8 +26,16 @@ class CTScanMeasure(QPPMeasure):
         codes, as usual.
         2. If there is, then check the IDR to see if the beneficiary received a CT scan on any of
         the same dates of service.
+
+    The CT scans of a whole batch of providers can be queried at once for both measures (see
+    get_batch_ct_scan_dates), in which case only the beneficiaries and dates missing from the
+    batch results are queried during calculation.
     """
 
+    # Quality codes are checked across all of the provider's claims.
+    uses_all_claims = True
+    shardable_by_beneficiary = False
+
     def __init__(self, *args, **kwargs):
         """Initialize CT Scan Measure instance."""
         super(CTScanMeasure, self).__init__(*args, **kwargs)
@@ -32,6 +46,9 @@ class CTScanMeasure(QPPMeasure):
             for eligibility_option in self.eligibility_options
             for procedure_code in eligibility_option.procedure_codes
         ]
+        self.clear_ct_scan_cache()
+        # CT scans found in previous batches (see lookup_cache.py).
+        self.lookup_cache = lookup_cache.get_lookup_cache()
 
     @newrelic.agent.function_trace(name='execute-ct-scan-measure', group='Task')
     @override
@@ -46,14 +63,12 @@ class CTScanMeasure(QPPMeasure):
         For CT Scan best practice measures, this means instances for which CT scans were performed
         (perhaps by a different provider) on the same day.
         """
-        bene_date_set = {
-            (claim.bene_sk, claim_line.clm_line_from_dt)
-            for claim in claims
-            for claim_line in claim.claim_lines
-            if claim_line.clm_line_hcpcs_cd in self.procedure_codes
-        }
-
-        ct_scan_benes_and_dates = self._get_ct_scan_beneficiaries_and_dates(bene_date_set)
+        missing_bene_date_set = self._get_bene_date_set(claims) - self.queried_benes_and_dates
+        if missing_bene_date_set:
+            self.ct_scan_benes_and_dates.update(
+                self._get_cached_ct_scan_beneficiaries_and_dates(missing_bene_date_set))
+            self.queried_benes_and_dates.update(missing_bene_date_set)
+        ct_scan_benes_and_dates = self.ct_scan_benes_and_dates
 
         return [
             claim for claim in claims
@@ -66,17 +81,82 @@ class CTScanMeasure(QPPMeasure):
             )
         ]
 
+    def _get_bene_date_set(self, claims):
+        """Return the (beneficiary, date) pairs of the claim lines with measure procedure codes."""
+        return {
+            (claim.bene_sk, claim_line.clm_line_from_dt)
+            for claim in claims
+            for claim_line in claim.claim_lines
+            if claim_line.clm_line_hcpcs_cd in self.procedure_codes
+        }
+
     @override
     def filter_by_eligibility_criteria(self, claims):
         """Return a list of eligible claims based on measure criteria."""
+        prefilter_claims = self._prefilter_by_eligibility_criteria(claims)
+        return CTScanMeasure._filter_by_ct_scan(self, prefilter_claims)
+
+    def _prefilter_by_eligibility_criteria(self, claims):
+        """Return the eligible claims, before checking for CT scans."""
         quality_codes = self.measure_definition.get_measure_quality_codes()
 
         if not claim_filtering.do_any_claims_have_quality_codes(
                 claims_data=claims, quality_codes=quality_codes):
             return []
 
-        prefilter_claims = super(CTScanMeasure, self).filter_by_eligibility_criteria(claims)
-        return CTScanMeasure._filter_by_ct_scan(self, prefilter_claims)
+        return super(CTScanMeasure, self).filter_by_eligibility_criteria(claims)
+
+    def clear_ct_scan_cache(self):
+        """Clear the cache of CT scans to prevent it from growing too large."""
+        self.queried_benes_and_dates = set()
+        self.ct_scan_benes_and_dates = set()
+
+    def _get_cached_ct_scan_beneficiaries_and_dates(self, bene_date_set):
+        """
+        Return the CT scans for the given beneficiaries on the given dates, using the lookup cache.
+
+        The cache holds the CT scan dates of each beneficiary from the first date queried on.
+        """
+        if self.lookup_cache is None:
+            return set(self._get_ct_scan_beneficiaries_and_dates(bene_date_set))
+
+        window = (config.get('calculation.end_date'),)
+        dates_by_beneficiary = collections.defaultdict(set)
+        for bene_sk, date in bene_date_set:
+            dates_by_beneficiary[bene_sk].add(date)
+
+        cached_ct_scans = self.lookup_cache.get_many(
+            'ct_scan_dates', dates_by_beneficiary, window)
+        ct_scan_benes_and_dates = set()
+        missing_bene_date_set = set()
+        for bene_sk, dates in dates_by_beneficiary.items():
+            first_date_queried, ct_scan_dates = cached_ct_scans.get(bene_sk, (None, None))
+            if first_date_queried is not None and min(dates) >= first_date_queried:
+                ct_scan_benes_and_dates.update(
+                    (bene_sk, date) for date in dates if date in ct_scan_dates)
+            else:
+                missing_bene_date_set.update((bene_sk, date) for date in dates)
+
+        if not missing_bene_date_set:
+            return ct_scan_benes_and_dates
+
+        queried_ct_scans = set(self._get_ct_scan_beneficiaries_and_dates(missing_bene_date_set))
+        ct_scan_benes_and_dates.update(queried_ct_scans)
+
+        # The query returns the CT scans from the first date queried to the end date.
+        first_date_queried = min(date for _, date in missing_bene_date_set)
+        ct_scan_dates_by_beneficiary = collections.defaultdict(set)
+        for bene_sk, date in queried_ct_scans:
+            ct_scan_dates_by_beneficiary[bene_sk].add(date)
+        self.lookup_cache.set_many(
+            'ct_scan_dates',
+            {
+                bene_sk: (first_date_queried, frozenset(ct_scan_dates_by_beneficiary[bene_sk]))
+                for bene_sk, _ in missing_bene_date_set
+            },
+            window
+        )
+        return ct_scan_benes_and_dates
 
     @newrelic.agent.function_trace(name='get-ct-scan-dates-by-beneficiary', group='Task')
     def _get_ct_scan_beneficiaries_and_dates(self, bene_date_set):
@@ -92,3 +172,39 @@ class CTScanMeasure(QPPMeasure):
         return {
             (row['bene_sk'], row['clm_line_from_dt']) for row in rows
         }
+
+
+@newrelic.agent.background_task(
+    newrelic_application.get(), name='get-batch-ct-scan-dates', group='Task')
+def get_batch_ct_scan_dates(ct_scan_calculators, batch_claims_data):
+    """
+    Query the IDR once for the CT scans relevant to measures 415 and 416 for a batch of providers.
+
+    The beneficiaries and dates of the eligible claims of all providers are queried together, and
+    the results are shared by the calculators for use during calculation.
+    """
+    if not ct_scan_calculators:
+        return
+
+    logger.info(
+        'Finding CT scan dates for batch of {} providers'.format(len(batch_claims_data)))
+    bene_date_set = set()
+    if isinstance(batch_claims_data, claim_batch.ClaimBatch):
+        # Only the candidate claims of providers with quality codes are materialized.
+        for calculator in ct_scan_calculators:
+            eligible_claims_by_provider = calculator.filter_claim_batch_by_eligibility_criteria(
+                batch_claims_data, mask=calculator._get_batch_quality_code_mask(batch_claims_data))
+            for claims in eligible_claims_by_provider.values():
+                bene_date_set.update(calculator._get_bene_date_set(claims))
+    else:
+        for claims in batch_claims_data.values():
+            for calculator in ct_scan_calculators:
+                bene_date_set.update(calculator._get_bene_date_set(
+                    calculator._prefilter_by_eligibility_criteria(claims)))
+
+    ct_scan_benes_and_dates = ct_scan_calculators[0]._get_cached_ct_scan_beneficiaries_and_dates(
+        bene_date_set)
+    # Reset the calculators' caches with the results of the new batch, shared by all of them.
+    for calculator in ct_scan_calculators:
+        calculator.queried_benes_and_dates = bene_date_set
+        calculator.ct_scan_benes_and_dates = ct_scan_benes_and_dates
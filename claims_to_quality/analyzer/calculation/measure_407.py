@@ -2,8 +2,11 @@
 import collections
 
 from claims_to_quality.analyzer.calculation.qpp_measure import QPPMeasure
+from claims_to_quality.analyzer.datasource import lookup_cache
+from claims_to_quality.analyzer.models import claim_batch
 from claims_to_quality.analyzer.processing import claim_filtering
 from claims_to_quality.config import config
+from claims_to_quality.lib import newrelic_application
 from claims_to_quality.lib.connectors import idr_queries
 from claims_to_quality.lib.helpers.date_handling import DateRange
 from claims_to_quality.lib.helpers.decorators import override
@@ -45,8 +48,15 @@ class Measure407(QPPMeasure):
     2. This measure is not part of an EMA cluster
     3. Claim line level dates should be used for this measure.
 
+    The MSSA episodes of a whole batch of providers can be queried at once (see
+    get_batch_mssa_date_ranges), in which case only the beneficiaries missing from the batch
+    results are queried during calculation.
     """
 
+    # Quality codes are checked across all of the provider's claims.
+    uses_all_claims = True
+    shardable_by_beneficiary = False
+
     def __init__(self, *args, **kwargs):
         """Instantiate a MSSA Measure407, grouping by beneficiary ID and idk."""
         super(Measure407, self).__init__(*args, **kwargs)
@@ -54,6 +64,9 @@ class Measure407(QPPMeasure):
             procedure_code.code for eligibility_option in self.eligibility_options
             for procedure_code in eligibility_option.procedure_codes
         }
+        self.clear_mssa_date_range_cache()
+        # MSSA episodes found in previous batches (see lookup_cache.py).
+        self.lookup_cache = lookup_cache.get_lookup_cache()
 
     @newrelic.agent.function_trace(name='execute-measure-407', group='Task')
     @override
@@ -61,6 +74,40 @@ class Measure407(QPPMeasure):
         """Execute Measure 407 calculation."""
         return super(Measure407, self).execute(claims)
 
+    @newrelic.agent.background_task(
+        newrelic_application.get(), name='get-batch-mssa-date-ranges', group='Task')
+    def get_batch_mssa_date_ranges(self, batch_claims_data):
+        """
+        Query the IDR for the MSSA episodes relevant to Measure 407 for a batch of providers.
+
+        The merged episode date ranges are stored in the Measure407 calculator object for use
+        during calculation.
+        """
+        logger.info(
+            'Finding MSSA date ranges for batch of {} providers'.format(len(batch_claims_data)))
+        # Reset attribute with new batch.
+        self.clear_mssa_date_range_cache()
+        if isinstance(batch_claims_data, claim_batch.ClaimBatch):
+            # Only the candidate claims of providers with quality codes are materialized.
+            eligible_claims_by_provider = self.filter_claim_batch_by_eligibility_criteria(
+                batch_claims_data, mask=self._get_batch_quality_code_mask(batch_claims_data))
+            claims_to_query = [
+                claim for claims in eligible_claims_by_provider.values() for claim in claims
+            ]
+        else:
+            claims_to_query = [
+                claim
+                for claims in batch_claims_data.values()
+                for claim in self.filter_by_eligibility_criteria(claims)
+            ]
+        if claims_to_query:
+            self._cache_mssa_episode_date_ranges(claims_to_query)
+
+    def clear_mssa_date_range_cache(self):
+        """Clear the cache of MSSA date ranges to prevent it from growing too large."""
+        self.queried_bene_sks = set()
+        self.mssa_episode_date_ranges_by_beneficiary = {}
+
     @override
     def filter_by_eligibility_criteria(self, claims):
         """
@@ -154,9 +201,56 @@ class Measure407(QPPMeasure):
         return list(eligible_instances.values())
 
     def _get_mssa_episode_date_ranges(self, claims):
-        """Get MSSA date ranges and reduce them by episodes."""
-        mssa_date_ranges = self._get_mssa_date_ranges(claims)
-        return Measure407._merge_mssa_date_ranges(mssa_date_ranges)
+        """
+        Get MSSA date ranges and reduce them by episodes.
+
+        This method uses cached information, limiting the IDR queries to the beneficiaries not
+        already queried for the batch.
+        """
+        missing_claims = [
+            claim for claim in claims if claim.bene_sk not in self.queried_bene_sks
+        ]
+        if missing_claims:
+            self._cache_mssa_episode_date_ranges(missing_claims)
+
+        return {
+            bene_sk: self.mssa_episode_date_ranges_by_beneficiary[bene_sk]
+            for bene_sk in {claim.bene_sk for claim in claims}
+            if bene_sk in self.mssa_episode_date_ranges_by_beneficiary
+        }
+
+    def _cache_mssa_episode_date_ranges(self, claims):
+        """Query the MSSA episodes of the claims' beneficiaries and record them."""
+        bene_sks = {claim.bene_sk for claim in claims}
+        self.queried_bene_sks.update(bene_sks)
+        if self.lookup_cache is not None:
+            cached_date_ranges = self.lookup_cache.get_many(
+                'mssa_episodes', bene_sks, self._get_lookup_window())
+            # Beneficiaries without MSSA episodes are cached with an empty list of date ranges.
+            self.mssa_episode_date_ranges_by_beneficiary.update({
+                bene_sk: list(date_ranges)
+                for bene_sk, date_ranges in cached_date_ranges.items() if date_ranges
+            })
+            claims = [claim for claim in claims if claim.bene_sk not in cached_date_ranges]
+            if not claims:
+                return
+
+        mssa_episode_date_ranges = Measure407._merge_mssa_date_ranges(
+            self._get_mssa_date_ranges(claims))
+        self.mssa_episode_date_ranges_by_beneficiary.update(mssa_episode_date_ranges)
+        if self.lookup_cache is not None:
+            self.lookup_cache.set_many(
+                'mssa_episodes',
+                {
+                    claim.bene_sk: tuple(mssa_episode_date_ranges.get(claim.bene_sk, ()))
+                    for claim in claims
+                },
+                self._get_lookup_window()
+            )
+
+    @staticmethod
+    def _get_lookup_window():
+        return (config.get('calculation.start_date'), config.get('calculation.end_date'))
 
     @override
     def get_eligible_instances(self, claims):
@@ -4,7 +4,10 @@ import datetime
 from math import floor
 
 from claims_to_quality.analyzer.calculation.visit_measure import VisitMeasure
+from claims_to_quality.analyzer.datasource import lookup_cache
+from claims_to_quality.analyzer.models import claim_batch
 from claims_to_quality.analyzer.processing import claim_filtering
+from claims_to_quality.config import config
 from claims_to_quality.lib import newrelic_application
 from claims_to_quality.lib.connectors import idr_queries
 from claims_to_quality.lib.helpers.decorators import override
@@ -43,6 +46,10 @@ class Measure46(VisitMeasure):
     - This measure is not part of an EMA cluster.
     """
 
+    # Quality codes are checked across all of the provider's claims.
+    uses_all_claims = True
+    shardable_by_beneficiary = False
+
     HIDDEN_CODES = [
         '99221',
         '99222',
@@ -81,6 +88,8 @@ class Measure46(VisitMeasure):
         """Instantiate a Measure46."""
         super(Measure46, self).__init__(*args, **kwargs)
         self.discharge_dates_by_beneficiary = collections.defaultdict(set)
+        # Discharge dates found in previous batches (see lookup_cache.py).
+        self.lookup_cache = lookup_cache.get_lookup_cache()
 
     @newrelic.agent.function_trace(name='execute-measure-46', group='Task')
     @override
@@ -109,29 +118,35 @@ class Measure46(VisitMeasure):
                 - eligible_population_exception
                 - eligible_population
         """
-        relevant_claims = self.filter_by_eligibility_criteria(claims)
-        eligible_instances = self.get_eligible_instances(relevant_claims)
-        eligible_instances_by_stratum = self.assign_eligible_instances_to_strata(eligible_instances)
-
-        measure_results = []
-        for stratum_dict in eligible_instances_by_stratum:
-            stratum_results = self.score_eligible_instances(stratum_dict['instances'])
-            measure_results.append(
-                {
-                    'name': stratum_dict['name'],
-                    'results': {
-                        'eligible_population_exclusion': stratum_results[
-                            'eligiblePopulationExclusion'],
-                        'eligible_population_exception': stratum_results[
-                            'eligiblePopulationException'],
-                        'performance_met': stratum_results['performanceMet'],
-                        'performance_not_met': stratum_results['performanceNotMet'],
-                        'eligible_population':
-                            sum(stratum_results.values())
+        self.reset_performance_marker_cache()
+        try:
+            relevant_claims = self.filter_by_eligibility_criteria(claims)
+            eligible_instances = self.get_eligible_instances(relevant_claims)
+            eligible_instances_by_stratum = self.assign_eligible_instances_to_strata(
+                eligible_instances)
+
+            measure_results = []
+            for stratum_dict in eligible_instances_by_stratum:
+                stratum_results = self.score_eligible_instances(stratum_dict['instances'])
+                measure_results.append(
+                    {
+                        'name': stratum_dict['name'],
+                        'results': {
+                            'eligible_population_exclusion': stratum_results[
+                                'eligiblePopulationExclusion'],
+                            'eligible_population_exception': stratum_results[
+                                'eligiblePopulationException'],
+                            'performance_met': stratum_results['performanceMet'],
+                            'performance_not_met': stratum_results['performanceNotMet'],
+                            'eligible_population':
+                                sum(stratum_results.values())
+                        }
                     }
-                }
-            )
-        return measure_results
+                )
+            return measure_results
+        finally:
+            # Do not keep the provider's claims alive until the next provider is calculated.
+            self.reset_performance_marker_cache()
 
     @newrelic.agent.background_task(
         newrelic_application.get(), name='get-batch-discharge-dates', group='Task')
@@ -140,6 +155,8 @@ class Measure46(VisitMeasure):
         Query the IDR for discharge dates relevant to Measure 46 for a batch of providers.
 
         The results are stored in the Measure46 calculator object for use during calculation.
+        Providers whose beneficiaries' discharge dates are all in the lookup cache are not
+        queried.
         """
         logger.info(
             'Finding discharge dates for batch of {} providers'.format(len(batch_claims_data)))
@@ -150,12 +167,27 @@ class Measure46(VisitMeasure):
         bene_sks_to_query = []
         quality_codes = self.measure_definition.quality_code_map
 
-        for provider in batch_claims_data:
-            claims = batch_claims_data[provider]
-            if claim_filtering.do_any_claims_have_quality_codes(claims, quality_codes):
+        bene_sks_by_provider = {}
+        if isinstance(batch_claims_data, claim_batch.ClaimBatch):
+            # Read the beneficiaries from the batch columns, without materializing claims.
+            quality_code_mask = batch_claims_data.claims_with_any_procedure_code(quality_codes)
+            for provider, (start, end) in batch_claims_data.provider_ranges.items():
+                if quality_code_mask[start:end].any():
+                    bene_sks_by_provider[provider] = batch_claims_data.get_view(
+                        provider).get_bene_sks()
+        else:
+            for provider in batch_claims_data:
+                claims = batch_claims_data[provider]
+                if claim_filtering.do_any_claims_have_quality_codes(claims, quality_codes):
+                    bene_sks_by_provider[provider] = {claim.bene_sk for claim in claims}
+
+        missing_bene_sks = self._load_cached_discharge_dates(
+            set().union(*bene_sks_by_provider.values()))
+        for provider, bene_sks in bene_sks_by_provider.items():
+            if bene_sks & missing_bene_sks:
                 tins_to_query.extend([provider[0]])
                 npis_to_query.extend([provider[1]])
-                bene_sks_to_query.extend([claim.bene_sk for claim in claims])
+                bene_sks_to_query.extend(bene_sks)
 
         self._get_discharge_dates_by_provider(
             tins=tins_to_query,
@@ -217,13 +249,14 @@ class Measure46(VisitMeasure):
         Filter the given list of claims and return only the claims that followed a discharge event.
 
         This method uses cached information, limiting the IDR queries to only the TINs, NPIs, and
-        beneficiaries not already contained in the attribute `discharge_dates_by_beneficiary`.
+        beneficiaries not already contained in the attribute `discharge_dates_by_beneficiary`,
+        or in the lookup cache.
         """
-        missing_bene_sks = {
+        missing_bene_sks = self._load_cached_discharge_dates({
             claim.bene_sk
             for claim in claims
             if claim.bene_sk not in self.discharge_dates_by_beneficiary
-        }
+        })
         missing_tins = {
             claim.clm_rndrg_prvdr_tax_num
             for claim in claims
@@ -294,6 +327,38 @@ class Measure46(VisitMeasure):
             if bene_sk not in self.discharge_dates_by_beneficiary:
                 self.discharge_dates_by_beneficiary[bene_sk] = set()
 
+        if self.lookup_cache is not None:
+            self.lookup_cache.set_many(
+                'discharge_dates',
+                {
+                    bene_sk: frozenset(self.discharge_dates_by_beneficiary[bene_sk])
+                    for bene_sk in bene_sks
+                },
+                self._get_lookup_window()
+            )
+
+    def _load_cached_discharge_dates(self, bene_sks):
+        """
+        Record the discharge dates of the beneficiaries found in the lookup cache.
+
+        Returns the set of beneficiaries missing from the lookup cache.
+        """
+        if self.lookup_cache is None:
+            return set(bene_sks)
+
+        cached_discharge_dates = self.lookup_cache.get_many(
+            'discharge_dates', bene_sks, self._get_lookup_window())
+        for bene_sk, discharge_dates in cached_discharge_dates.items():
+            self.discharge_dates_by_beneficiary[bene_sk] = set(discharge_dates)
+        return set(bene_sks) - set(cached_discharge_dates)
+
+    def _get_lookup_window(self):
+        return (
+            config.get('calculation.start_date'),
+            config.get('calculation.end_date'),
+            self.DISCHARGE_PERIOD
+        )
+
     def clear_discharge_date_cache(self):
         """Clear the cache of discharge dates to prevent it from growing too large."""
         self.discharge_dates_by_beneficiary = collections.defaultdict(set)
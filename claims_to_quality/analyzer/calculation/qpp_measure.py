@@ -15,6 +15,14 @@ class QPPMeasure(object):
     TODO: Add documentation describing each type of measure that will extend this class.
     """
 
+    # Set to True for measures whose calculation depends on claims that do not match any of
+    # their eligibility options, so that they are not restricted to candidate claims.
+    uses_all_claims = False
+
+    # Set to False for measures whose results for a beneficiary depend on the claims of other
+    # beneficiaries, so that they are not calculated over shards of a provider's claims.
+    shardable_by_beneficiary = True
+
     def __init__(self, measure_definition, **kwargs):
         """Create a measure."""
         self.measure_definition = measure_definition
@@ -24,6 +32,8 @@ class QPPMeasure(object):
             measure_definition['strata'] is not None and len(measure_definition['strata']) > 1
         )
         self.performance_marker_ranking = self.get_performance_marker_ranking()
+        # Performance markers of the current provider's claims, keyed by claim identity.
+        self._performance_markers_by_claim_id = {}
 
         self.__dict__.update(kwargs)
 
@@ -45,39 +55,87 @@ class QPPMeasure(object):
         3) Assign a performance marker to each eligible instance.
         4) Aggregate totals by performance marker across all eligible instances.
         """
-        relevant_claims = self.filter_by_eligibility_criteria(claims)
+        self.reset_performance_marker_cache()
+        try:
+            relevant_claims = self.filter_by_eligibility_criteria(claims)
+
+            # If the measure has date range restrictions, filter further.
+            if hasattr(self, 'date_ranges'):
+                relevant_claims = self.filter_by_valid_dates(relevant_claims)
+
+            if relevant_claims:
+                logger.debug('Relevant claims found for measure {}.'.format(
+                    self.measure_definition.measure_number))
+                eligible_instances = self.get_eligible_instances(relevant_claims)
+            else:
+                logger.debug('No relevant claims found for measure {}.'.format(
+                    self.measure_definition.measure_number))
+                eligible_instances = []
+
+            count_by_performance_marker = self.score_eligible_instances(eligible_instances)
+
+            # TODO: evaluate switching to using the camelCase attribute names everywhere.
+            return {
+                'eligible_population_exclusion': count_by_performance_marker[
+                    'eligiblePopulationExclusion'],
+                'eligible_population_exception': count_by_performance_marker[
+                    'eligiblePopulationException'],
+                'performance_met': count_by_performance_marker['performanceMet'],
+                'performance_not_met': count_by_performance_marker['performanceNotMet'],
+                'eligible_population':
+                    sum(count_by_performance_marker.values())
+            }
+        finally:
+            # Do not keep the provider's claims alive until the next provider is calculated.
+            self.reset_performance_marker_cache()
+
+    def filter_by_eligibility_criteria(self, claims):
+        """Filter out claims that do not meet any of the measure's eligibility options."""
+        logger.debug('Filter by eligibility criteria.')
+        return [claim for claim in claims if self._does_claim_meet_any_eligibility_options(claim)]
 
-        # If the measure has date range restrictions, filter further.
-        if hasattr(self, 'date_ranges'):
-            relevant_claims = self.filter_by_valid_dates(relevant_claims)
+    def filter_claim_batch_by_eligibility_criteria(self, batch, mask=None):
+        """
+        Return the claims of a ClaimBatch meeting any of the measure's eligibility options.
 
-        if relevant_claims:
-            logger.debug('Relevant claims found for measure {}.'.format(
-                self.measure_definition.measure_number))
-            eligible_instances = self.get_eligible_instances(relevant_claims)
-        else:
-            logger.debug('No relevant claims found for measure {}.'.format(
-                self.measure_definition.measure_number))
-            eligible_instances = []
+        Claims without any of the procedure codes required by the eligibility options are
+        excluded using the batch columns, so that only the remaining claims (within the given
+        mask, if any) are materialized, one provider at a time.
 
-        count_by_performance_marker = self.score_eligible_instances(eligible_instances)
+        Returns a dictionary (tin, npi) --> eligible claims, for providers with candidate claims.
+        """
+        procedure_codes = self._get_eligibility_procedure_codes()
+        if procedure_codes is not None:
+            procedure_code_mask = batch.claims_with_any_procedure_code(procedure_codes)
+            mask = procedure_code_mask if mask is None else mask & procedure_code_mask
 
-        # TODO: evaluate switching to using the camelCase attribute names everywhere.
         return {
-            'eligible_population_exclusion': count_by_performance_marker[
-                'eligiblePopulationExclusion'],
-            'eligible_population_exception': count_by_performance_marker[
-                'eligiblePopulationException'],
-            'performance_met': count_by_performance_marker['performanceMet'],
-            'performance_not_met': count_by_performance_marker['performanceNotMet'],
-            'eligible_population':
-                sum(count_by_performance_marker.values())
+            identifier: QPPMeasure.filter_by_eligibility_criteria(self, claims)
+            for identifier, claims in batch.iter_claims(mask)
         }
 
-    def filter_by_eligibility_criteria(self, claims):
-        """Filter out claims that do not meet any of the measure's eligibility options."""
-        logger.debug('Filter by eligibility criteria.')
-        return [claim for claim in claims if self._does_claim_meet_any_eligibility_options(claim)]
+    def _get_eligibility_procedure_codes(self):
+        """
+        Return the procedure codes of which each eligible claim has at least one.
+
+        Returns None if any eligibility option can be met without a procedure code.
+        """
+        procedure_codes = set()
+        for eligibility_option in self.eligibility_options:
+            option_codes = (
+                eligibility_option.procedure_code_map or
+                eligibility_option.additional_procedure_code_map
+            )
+            if not option_codes:
+                return None
+            procedure_codes.update(option_codes)
+        return procedure_codes
+
+    def _get_batch_quality_code_mask(self, batch):
+        """Return a ClaimBatch mask selecting all claims of providers with any quality code."""
+        quality_codes = self.measure_definition.get_measure_quality_codes()
+        return batch.claims_of_providers_with_any(
+            batch.claims_with_any_procedure_code(quality_codes))
 
     def _does_claim_meet_any_eligibility_options(self, claim):
         """Return True if and only if the claim meets at least one eligibility option."""
@@ -87,10 +145,29 @@ class QPPMeasure(object):
         else:
             return False
 
+    def reset_performance_marker_cache(self):
+        """Forget the performance markers assigned to the previous provider's claims."""
+        self._performance_markers_by_claim_id = {}
+
     def _assign_performance_markers(self, claim):
+        """
+        Return the set of performance markers that a claim belongs to.
+
+        Markers are computed at most once per claim until the cache is reset. The claim is kept
+        alongside its markers so that its id cannot be reused by another claim in the meantime.
+        """
+        cached = self._performance_markers_by_claim_id.get(id(claim))
+        if cached is not None and cached[0] is claim:
+            return cached[1]
+
+        markers = self._compute_performance_markers(claim)
+        self._performance_markers_by_claim_id[id(claim)] = (claim, markers)
+        return markers
+
+    def _compute_performance_markers(self, claim):
         """Return the set of performance markers that a claim belongs to."""
         logger.debug('Assign performance markers.')
-        return {
+        return frozenset(
             option.option_type for option in self.performance_options
             if all(
                 any(
@@ -100,7 +177,7 @@ class QPPMeasure(object):
                 )
                 for measure_code in option.quality_codes
             )
-        }
+        )
 
     def get_performance_marker_ranking(self):
         """
@@ -1,8 +1,9 @@
 """"This class is used to read claims data from db into the claims model."""
 import itertools
-from collections import defaultdict
+from collections import Counter, defaultdict
 
-from claims_to_quality.analyzer.models import claim
+from claims_to_quality.analyzer.datasource import code_reader
+from claims_to_quality.analyzer.models import claim_batch, claim_record
 from claims_to_quality.config import config
 from claims_to_quality.lib.connectors import idr_queries
 from claims_to_quality.lib.qpp_logging import logging_config
@@ -23,9 +24,24 @@ class ClaimsDataReader(object):
     into the claim model, and returns a claim object.
     """
 
-    def __init__(self):
-        """Initialize ClaimsDataReader."""
+    def __init__(self, procedure_codes=None, quality_codes=None, procedure_code_condition=None):
+        """
+        Initialize ClaimsDataReader.
+
+        Args:
+            procedure_codes (set(str)): If given, split claims without any of these procedure
+                codes are dropped before claim objects are built.
+            quality_codes (set(str)): If given, providers without any of these quality codes
+                on their remaining claims are dropped before claim objects are built.
+            procedure_code_condition (str): If given, SQL condition on claim lines pushed down to
+                the batch query, so that only split claims with a matching line are transferred.
+        """
         self.hide_sensitive_information = config.get('hide_sensitive_information')
+        self.procedure_codes = procedure_codes
+        self.quality_codes = quality_codes
+        self.procedure_code_condition = procedure_code_condition
+        self.skipped_counts = Counter()
+        self.code_vocabulary = code_reader.get_code_vocabulary()
 
     # Column headers that should be the same for all lines in a claim.
     CLAIM_LEVEL_COLUMNS = {
@@ -133,7 +149,28 @@ class ClaimsDataReader(object):
 
     def _lines_to_claim(self, claim_lines, columns):
         """
-        Convert set of lines of a claim into a claim model.
+        Convert set of lines of a claim into a claim record.
+
+        Claim records are built directly from the typed row values, bypassing the
+        validation and conversion steps of the schematics Claim model.
+        """
+        claim_values = self._get_claim_values(claim_lines, columns)
+        lines = [
+            claim_record.ClaimLineRecord(**line_values)
+            for line_values in claim_values.pop('claim_lines')
+        ]
+        procedure_codes = {line.clm_line_hcpcs_cd: True for line in lines}
+
+        return claim_record.ClaimRecord(
+            claim_lines=lines,
+            aggregated_procedure_codes=procedure_codes,
+            procedure_code_bits=self.code_vocabulary.to_bitset(procedure_codes),
+            **claim_values
+        )
+
+    def _get_claim_values(self, claim_lines, columns):
+        """
+        Return the field values of a claim, with its lines as a list of field value dictionaries.
 
         TODO: Add null / empty string handling for each of the values in case they don't exist.
         """
@@ -143,57 +180,108 @@ class ClaimsDataReader(object):
         # Assign claim-level values.
         top = claim_lines[0]
 
-        tmp_claim = {
+        claim_values = {
             new_col: top[columns[old_col]]
             for old_col, new_col in self.CLAIM_LEVEL_COLUMNS.items()
         }
 
         # Collect diagnosis codes from every line (in case of varying codes across split claims).
-        tmp_claim['dx_codes'] = list({
+        claim_values['dx_codes'] = list({
             code for row in claim_lines
             for code in self._get_dx_code_list(row, columns)
         })
 
         # Collect claim start and thru dates accounting for split claims.
         # Take the earliest and latest dates if there is more than one claim.
-        tmp_claim['clm_from_dt'] = min([line[columns['clm_from_dt']] for line in claim_lines])
-        tmp_claim['clm_thru_dt'] = max([line[columns['clm_thru_dt']] for line in claim_lines])
+        claim_values['clm_from_dt'] = min([line[columns['clm_from_dt']] for line in claim_lines])
+        claim_values['clm_thru_dt'] = max([line[columns['clm_thru_dt']] for line in claim_lines])
 
         # Collect line-level values.
-        procedure_codes = {}
-        tmp_claim['claim_lines'] = []
+        claim_values['claim_lines'] = []
         for claim_line in claim_lines:
-            line = {
+            line_values = {
                 new_col: claim_line[columns[old_col]]
                 for old_col, new_col in self.LINE_LEVEL_COLUMNS.items()
             }
-
-            line['mdfr_cds'] = [
+            line_values['mdfr_cds'] = [
                 claim_line[columns[col]]
                 for col in self.MODIFIER_CODE_COLUMNS
                 if claim_line[columns[col]]
             ]
+            claim_values['claim_lines'].append(line_values)
 
-            procedure_codes[line['clm_line_hcpcs_cd']] = True
+        return claim_values
 
-            tmp_claim['claim_lines'].append(line)
+    def _group_claim_by_lines(self, rows, columns, id_column):
+        claims = [
+            self._lines_to_claim(claim_lines, columns)
+            for claim_lines in self._group_claim_lines(rows, id_column)
+        ]
 
-        tmp_claim['aggregated_procedure_codes'] = procedure_codes
-        return claim.Claim(tmp_claim)
+        logger.debug('{} claim lines loaded as {} claims.'.format(len(rows), len(claims)))
+        return claims
 
-    def _group_claim_by_lines(self, rows, columns, id_column):
-        if self.hide_sensitive_information and len(rows) < 50:
+    def _group_claim_lines(self, rows, id_column):
+        """Group the rows of a provider into the lines of each relevant claim."""
+        if self.hide_sensitive_information and _get_provider_row_count(rows) < 50:
             # TIN/NPIs with fewer than 50 claims should be hidden due to rare-values.
             logger.debug('Fewer than 50 claims, dropping provider')
             return []
 
-        claims = []
         # Group claim lines into claims based on splt_clm_id.
-        for unique_id, group in itertools.groupby(rows, lambda x: x[id_column]):
-            claims.append(self._lines_to_claim(list(group), columns))
+        return self._filter_claims_lines([
+            list(group) for unique_id, group in itertools.groupby(rows, lambda x: x[id_column])
+        ])
 
-        logger.debug('{} claim lines loaded as {} claims.'.format(len(rows), len(claims)))
-        return claims
+    def _filter_claims_lines(self, claims_lines):
+        """
+        Drop the lines of irrelevant claims, or of the whole provider, before building claims.
+
+        Split claims are kept if they have any of the procedure codes. If none of the kept
+        claims has any of the quality codes, all claims are dropped.
+        """
+        kept_claims_lines = claims_lines
+        if self.procedure_codes is not None:
+            kept_claims_lines = [
+                claim_lines for claim_lines in claims_lines
+                if _has_any_procedure_code(claim_lines, self.procedure_codes)
+            ]
+
+        if self.quality_codes is not None and not any(
+                _has_any_procedure_code(claim_lines, self.quality_codes)
+                for claim_lines in kept_claims_lines):
+            kept_claims_lines = []
+            self.skipped_counts['providers'] += 1
+
+        self.skipped_counts['claims'] += len(claims_lines) - len(kept_claims_lines)
+        self.skipped_counts['rows'] += (
+            sum(len(claim_lines) for claim_lines in claims_lines) -
+            sum(len(claim_lines) for claim_lines in kept_claims_lines)
+        )
+        return kept_claims_lines
+
+    def _log_skipped_counts(self):
+        """Log and reset the counts of rows, claims and providers skipped for the batch."""
+        if self.procedure_codes is not None or self.quality_codes is not None:
+            logger.info(
+                'Skipped {rows} claim lines, {claims} claims and {providers} providers '
+                'without relevant codes in this batch.'.format(
+                    rows=self.skipped_counts['rows'],
+                    claims=self.skipped_counts['claims'],
+                    providers=self.skipped_counts['providers'])
+            )
+        self.skipped_counts = Counter()
+
+    @staticmethod
+    def _log_pushdown_row_counts(first_row, row_count):
+        """Log the claim lines transferred with the pushed down condition, out of all lines."""
+        if first_row is None or idr_queries.BATCH_ROW_COUNT_COLUMN not in first_row.columns:
+            return
+        unfiltered_row_count = first_row[idr_queries.BATCH_ROW_COUNT_COLUMN]
+        logger.info(
+            'Procedure code pushdown transferred {} of {} claim lines ({} fewer).'.format(
+                row_count, unfiltered_row_count, unfiltered_row_count - row_count)
+        )
 
     @newrelic.agent.function_trace(name='load-batch-from-db', group='Task')
     def load_batch_from_db(
@@ -212,7 +300,10 @@ class ClaimsDataReader(object):
             The key is a (tin, npi) tuple identifier.
         """
         (columns, rows) = query_claims_from_teradata_batch_provider(
-            provider_tin_list, provider_npi_list, start_date, end_date, session=session)
+            provider_tin_list, provider_npi_list, start_date, end_date, session=session,
+            procedure_code_condition=self.procedure_code_condition)
+        if columns and rows:
+            self._log_pushdown_row_counts(rows[0], len(rows))
 
         if not columns:
             return {}
@@ -223,7 +314,7 @@ class ClaimsDataReader(object):
 
         batch_dict = defaultdict(list)
         for row in rows:
-            identifier = (row['clm_rndrg_prvdr_tax_num'], row['clm_line_rndrg_prvdr_npi_num'])
+            identifier = _get_provider_identifier(row)
             if self.hide_sensitive_information:
                 row = anonymization_filter.anonymize_row(row)
             batch_dict[identifier].append(row)
@@ -232,17 +323,119 @@ class ClaimsDataReader(object):
             len(batch_dict.values()))
         )
 
-        return {
+        batch_claims_data = {
             identifier: self._group_claim_by_lines(records_for_provider, columns, id_column)
             for identifier, records_for_provider in batch_dict.items()
         }
+        self._log_skipped_counts()
+        return batch_claims_data
+
+    @newrelic.agent.function_trace(name='stream-batch-from-db', group='Task')
+    def stream_batch_from_db(
+            self, provider_tin_list, provider_npi_list,
+            start_date, end_date, session=None):
+        """
+        Query the database and yield the claims of each provider as soon as they are complete.
+
+        Rows are read from an open cursor, ordered by (tin, npi, splt_clm_id), so that only
+        the rows of the current provider are held in memory. The session must remain open
+        until the generator is exhausted.
+
+        Args:
+            provider_tin_list ([str]): List of provider tax identification number to load.
+            provider_npi_list ([str]): List of national provider identifier to load.
+            start_date (date): Start date of data to load.
+            end_date (date): End date of data to load.
+        Yields:
+            ((tin, npi), list of claims objects) tuples, one per provider with claim lines.
+        """
+        for identifier, provider_rows in self._stream_provider_rows(
+                provider_tin_list, provider_npi_list, start_date, end_date, session):
+            yield identifier, self._group_claim_by_lines(
+                provider_rows, provider_rows[0].columns, 'splt_clm_id')
+
+    @newrelic.agent.function_trace(name='load-claim-batch-from-db', group='Task')
+    def load_claim_batch_from_db(
+            self, provider_tin_list, provider_npi_list,
+            start_date, end_date, session=None, code_vocabulary=None):
+        """
+        Query the database and convert results into a columnar ClaimBatch.
+
+        Rows are streamed like in `stream_batch_from_db`, and the values of each claim are
+        appended to the batch columns without building claim objects.
+
+        Args:
+            provider_tin_list ([str]): List of provider tax identification number to load.
+            provider_npi_list ([str]): List of national provider identifier to load.
+            start_date (date): Start date of data to load.
+            end_date (date): End date of data to load.
+            code_vocabulary (CodeVocabulary): Vocabulary used to intern codes in the batch.
+        Returns:
+            ClaimBatch of the claims of the providers with claim lines.
+        """
+        builder = claim_batch.ClaimBatchBuilder(code_vocabulary)
+        for identifier, provider_rows in self._stream_provider_rows(
+                provider_tin_list, provider_npi_list, start_date, end_date, session):
+            columns = provider_rows[0].columns
+            builder.add_provider(identifier)
+            for claim_lines in self._group_claim_lines(provider_rows, 'splt_clm_id'):
+                builder.add_claim(self._get_claim_values(claim_lines, columns))
+        return builder.build()
+
+    def _stream_provider_rows(
+            self, provider_tin_list, provider_npi_list, start_date, end_date, session):
+        """Yield ((tin, npi), claim line rows) for each provider, from an ordered cursor."""
+        rows = stream_claims_from_teradata_batch_provider(
+            provider_tin_list, provider_npi_list, start_date, end_date, session=session,
+            procedure_code_condition=self.procedure_code_condition)
+        first_row = None
+        row_count = 0
+
+        anonymization_filter = deidentification.AnonymizationFilter()
+
+        seen_identifiers = set()
+        for identifier, provider_rows in itertools.groupby(rows, _get_provider_identifier):
+            if identifier in seen_identifiers:
+                raise AssertionError(
+                    'Claim lines for NPI {} are not contiguous in the batch query results!'.format(
+                        identifier[1])
+                )
+            seen_identifiers.add(identifier)
+
+            provider_rows = list(provider_rows)
+            if first_row is None:
+                first_row = provider_rows[0]
+            row_count += len(provider_rows)
+            if self.hide_sensitive_information:
+                provider_rows = [anonymization_filter.anonymize_row(row) for row in provider_rows]
+
+            yield identifier, provider_rows
+
+        logger.debug('Claim lines streamed for {} providers.'.format(len(seen_identifiers)))
+        self._log_pushdown_row_counts(first_row, row_count)
+        self._log_skipped_counts()
+
+
+def _get_provider_identifier(row):
+    return (row['clm_rndrg_prvdr_tax_num'], row['clm_line_rndrg_prvdr_npi_num'])
+
+
+def _get_provider_row_count(rows):
+    """Return the number of claim lines of a provider, before any procedure code pushdown."""
+    if rows and idr_queries.PROVIDER_ROW_COUNT_COLUMN in rows[0].columns:
+        return rows[0][idr_queries.PROVIDER_ROW_COUNT_COLUMN]
+    return len(rows)
+
+
+def _has_any_procedure_code(claim_lines, procedure_codes):
+    return any(row['clm_line_hcpcs_cd'] in procedure_codes for row in claim_lines)
 
 
 @newrelic.agent.function_trace(name='execute-query-claims-batch', group='Task')
 def query_claims_from_teradata_batch_provider(
         provider_tins, provider_npis,
         start_date, end_date,
-        session=None):
+        session=None, procedure_code_condition=None):
     """
     Query claims table for the analyzer for a batch of providers.
 
@@ -252,6 +445,8 @@ def query_claims_from_teradata_batch_provider(
         start_date (date): Start date of data to load.
         end_date (date): End date of data to load.
         session (session): Teradata session to use to access IDR.
+        procedure_code_condition (str): If given, only split claims with at least one claim line
+            meeting this SQL condition are queried.
     Returns:
         (column_names, rows) (list(str), list(tuple)):  Tuple of list of headers, and
                 list of tuples containing claim line values.
@@ -262,7 +457,8 @@ def query_claims_from_teradata_batch_provider(
         tins=provider_tins,
         npis=provider_npis,
         start_date=start_date,
-        end_date=end_date
+        end_date=end_date,
+        procedure_code_condition=procedure_code_condition
     )
 
     rows = execute.execute(query, session)
@@ -271,3 +467,27 @@ def query_claims_from_teradata_batch_provider(
         return (columns, rows)
 
     return ([], rows)
+
+
+def stream_claims_from_teradata_batch_provider(
+        provider_tins, provider_npis,
+        start_date, end_date,
+        session=None, db_fetch_size=1000, procedure_code_condition=None):
+    """
+    Query claims table for a batch of providers, iterating over rows as they are fetched.
+
+    Takes the same arguments as query_claims_from_teradata_batch_provider.
+    Returns:
+        Iterator over the claim line rows, ordered by (tin, npi, splt_clm_id).
+    """
+    logger.debug('Stream claims from TERADATA in env - {}.'.format(config.get('environment')))
+
+    query = idr_queries.get_ordered_access_layer_batch_query(
+        tins=provider_tins,
+        npis=provider_npis,
+        start_date=start_date,
+        end_date=end_date,
+        procedure_code_condition=procedure_code_condition
+    )
+
+    return execute.execute_iterator(query, arraysize=db_fetch_size, session=session)
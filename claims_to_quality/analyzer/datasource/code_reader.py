@@ -1,27 +1,73 @@
 """Read code objects from JSON."""
-from claims_to_quality.config import config
+from claims_to_quality.analyzer.datasource import measure_registry
+from claims_to_quality.analyzer.models.code_vocabulary import CodeVocabulary
 
-import ujson as json
 
-
-def load_quality_codes(
-    measures=None,
-    json_path=config.get('assets.qpp_single_source_json')[config.get('calculation.measures_year')]
-):
+def load_quality_codes(measures=None, json_path=None):
     """
     Load quality codes from the single source JSON file and return them as a set of strings.
 
     If the measures parameter is provided, restrict to quality codes on those measures.
     """
-    with open(json_path, encoding='utf-8') as file:
-        single_source = json.load(file)
-
-    # Filter out measures that are not claims-based quality measures with performanceOptions.
-    single_source = filter(lambda measure: 'performanceOptions' in measure, single_source)
+    single_source = measure_registry.load_registry(json_path)
 
     return {
-        code['code'] for measure in single_source
+        code['code'] for measure_number, measure in single_source.items()
         for option in measure['performanceOptions']
         for code in option['qualityCodes']
-        if (measures is None or measure['measureId'] in measures)
+        if (measures is None or measure_number in measures)
     }
+
+
+def load_code_vocabulary(json_path=None):
+    """
+    Build a CodeVocabulary of the codes mentioned in the single source JSON file.
+
+    Procedure and quality codes are given the first IDs, so that bitsets of these codes stay
+    small, followed by modifier, place of service and diagnosis codes. Codes are sorted within
+    each group so that the IDs only depend on the file.
+    """
+    single_source = measure_registry.load_registry(json_path)
+
+    procedure_codes, modifier_codes, pos_codes, diagnosis_codes = set(), set(), set(), set()
+    for measure in single_source.values():
+        measure_codes = [
+            code for option in measure['performanceOptions'] for code in option['qualityCodes']
+        ]
+        for option in measure.get('eligibilityOptions', []):
+            measure_codes.extend(option.get('procedureCodes', []))
+            measure_codes.extend(option.get('additionalProcedureCodes', []))
+            for column in ('diagnosisCodes', 'diagnosisExclusionCodes', 'additionalDiagnosisCodes'):
+                # Diagnosis codes are stored in the IDR without dots.
+                diagnosis_codes.update(code.replace('.', '') for code in option.get(column, []))
+
+        for code in measure_codes:
+            procedure_codes.add(code['code'])
+            modifier_codes.update(code.get('modifiers', []))
+            modifier_codes.update(code.get('modifierExclusions', []))
+            pos_codes.update(code.get('placesOfService', []))
+            pos_codes.update(code.get('placesOfServiceExclusions', []))
+
+    return CodeVocabulary(
+        sorted(procedure_codes) +
+        sorted(modifier_codes - procedure_codes) +
+        sorted(pos_codes - procedure_codes - modifier_codes) +
+        sorted(diagnosis_codes - procedure_codes - modifier_codes - pos_codes)
+    )
+
+
+_code_vocabulary = None
+
+
+def get_code_vocabulary():
+    """Return the process-wide CodeVocabulary, loading it on first use."""
+    global _code_vocabulary
+    if _code_vocabulary is None:
+        _code_vocabulary = load_code_vocabulary()
+    return _code_vocabulary
+
+
+def set_code_vocabulary(vocabulary):
+    """Set the process-wide CodeVocabulary, e.g. to share the parent's IDs in a worker process."""
+    global _code_vocabulary
+    _code_vocabulary = vocabulary
@@ -0,0 +1,205 @@
+"""
+Cache of the auxiliary IDR lookups made during measure calculation.
+
+Measures 46 (discharge dates), 415/416 (CT scans) and 407 (MSSA episodes) query the IDR for facts
+about the beneficiaries of the claims being scored. The same beneficiaries recur across providers
+and batches, so the results are cached per beneficiary, keyed by
+(query kind, bene_sk, as_was_date, date window).
+
+The in-memory cache is a least recently used cache holding at most `max_bytes` of pickled
+values. With a `path`, entries are also written to a local SQLite database, which is consulted on
+memory misses, so that results survive evictions and restarts. The database is not bounded.
+"""
+import collections
+import os
+import pickle
+import sqlite3
+import threading
+
+from claims_to_quality.config import config
+from claims_to_quality.lib.qpp_logging import logging_config
+
+logger = logging_config.get_logger(__name__)
+
+_CREATE_TABLE = """
+CREATE TABLE IF NOT EXISTS lookups (
+    key TEXT PRIMARY KEY,
+    value BLOB NOT NULL
+)
+"""
+
+# Maximum number of keys per SELECT, below SQLite's limit on the number of parameters.
+_MAX_KEYS_PER_QUERY = 500
+
+
+class IDRLookupCache(object):
+    """Thread-safe, memory-bounded LRU cache of IDR lookups, optionally backed by SQLite."""
+
+    def __init__(self, max_bytes, path=None):
+        """
+        Initialize an IDRLookupCache.
+
+        :param max_bytes: Maximum size of the pickled values held in memory
+        :type max_bytes: int
+        :param path: Path of the SQLite database backing the cache, created if needed
+        :type path: str
+        """
+        self.max_bytes = max_bytes
+        self.path = path
+        self.nbytes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # Key --> (value, size in bytes), from least to most recently used.
+        self._entries = collections.OrderedDict()
+        self._connection = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        """Return the number of entries held in memory."""
+        with self._lock:
+            return len(self._entries)
+
+    def get_many(self, kind, bene_sks, window):
+        """
+        Return the cached results of a lookup for the given beneficiaries.
+
+        Returns a dictionary {bene_sk: value}, without the beneficiaries missing from the cache.
+        """
+        keys = {bene_sk: _get_key(kind, bene_sk, window) for bene_sk in set(bene_sks)}
+        found = {}
+        with self._lock:
+            for bene_sk, key in keys.items():
+                entry = self._entries.get(key)
+                if entry is not None:
+                    self._entries.move_to_end(key)
+                    found[bene_sk] = entry[0]
+
+            if self.path is not None and len(found) < len(keys):
+                missing_keys = {
+                    key: bene_sk for bene_sk, key in keys.items() if bene_sk not in found
+                }
+                for key, pickled_value in self._select(list(missing_keys)):
+                    value = pickle.loads(pickled_value)
+                    self._store(key, value, len(pickled_value))
+                    found[missing_keys[key]] = value
+                    self.disk_hits += 1
+
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def set_many(self, kind, values_by_bene_sk, window):
+        """Cache the results of a lookup, given as a dictionary {bene_sk: value}."""
+        rows = [
+            (_get_key(kind, bene_sk, window), pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+            for bene_sk, value in values_by_bene_sk.items()
+        ]
+        with self._lock:
+            for (key, pickled_value), value in zip(rows, values_by_bene_sk.values()):
+                self._store(key, value, len(pickled_value))
+
+            if self.path is not None and rows:
+                connection = self._get_connection()
+                with connection:
+                    connection.executemany(
+                        'INSERT OR REPLACE INTO lookups (key, value) VALUES (?, ?)', rows)
+
+    def clear(self):
+        """Forget the entries held in memory."""
+        with self._lock:
+            self._entries = collections.OrderedDict()
+            self.nbytes = 0
+
+    def close(self):
+        """Close the database connection."""
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+    def get_metrics(self):
+        """Return the hit, miss and eviction counts, and the memory used."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'entries': len(self._entries),
+                'nbytes': self.nbytes,
+            }
+
+    def log_metrics(self):
+        """Log the hit rate and memory use of the cache."""
+        metrics = self.get_metrics()
+        logger.info(
+            'IDR lookup cache - {hit_rate:.0%} hit rate ({hits} hits including {disk_hits} from '
+            'disk, {misses} misses), {entries} entries using {nbytes} bytes, '
+            '{evictions} evictions.'.format(**metrics))
+
+    def _store(self, key, value, size):
+        """Hold a value in memory, evicting the least recently used values above max_bytes."""
+        previous_entry = self._entries.pop(key, None)
+        if previous_entry is not None:
+            self.nbytes -= previous_entry[1]
+        if size > self.max_bytes:
+            return
+
+        self._entries[key] = (value, size)
+        self.nbytes += size
+        while self.nbytes > self.max_bytes:
+            _, (_, evicted_size) = self._entries.popitem(last=False)
+            self.nbytes -= evicted_size
+            self.evictions += 1
+
+    def _select(self, keys):
+        connection = self._get_connection()
+        rows = []
+        for start in range(0, len(keys), _MAX_KEYS_PER_QUERY):
+            chunk = keys[start:start + _MAX_KEYS_PER_QUERY]
+            rows.extend(connection.execute(
+                'SELECT key, value FROM lookups WHERE key IN ({})'.format(
+                    ', '.join('?' * len(chunk))),
+                chunk
+            ).fetchall())
+        return rows
+
+    def _get_connection(self):
+        if self._connection is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._connection = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            # Let the worker processes read while another one writes.
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            with self._connection:
+                self._connection.execute(_CREATE_TABLE)
+            logger.debug('Opened IDR lookup cache {}.'.format(self.path))
+        return self._connection
+
+
+def _get_key(kind, bene_sk, window):
+    """Return the key of a lookup, as a string usable by SQLite."""
+    return '|'.join(
+        str(part) for part in (kind, bene_sk, config.get('calculation.as_was_date')) + window)
+
+
+_lookup_cache = None
+_lookup_cache_lock = threading.Lock()
+
+
+def get_lookup_cache():
+    """Return the IDR lookup cache shared by the measures of this process, or None if disabled."""
+    global _lookup_cache
+    if not config.get('idr_lookup_cache.enabled'):
+        return None
+    with _lookup_cache_lock:
+        if _lookup_cache is None:
+            _lookup_cache = IDRLookupCache(
+                max_bytes=config.get('idr_lookup_cache.max_bytes'),
+                path=config.get('idr_lookup_cache.path'))
+        return _lookup_cache
@@ -1,31 +1,19 @@
 """Read measure definitions from JSON."""
+from claims_to_quality.analyzer.datasource import measure_registry
 from claims_to_quality.analyzer.models.measures.measure_definition import MeasureDefinition
-from claims_to_quality.config import config
 
-import ujson as json
 
-
-def load_single_source(
-    json_path=config.get('assets.qpp_single_source_json')[
-        config.get('calculation.measures_year')
-    ]
-):
+def load_single_source(json_path=None):
     """
     Load the single source file as JSON keyed by measure number.
 
-    Only load claims-based measures by using the 'performanceOptions' key.
+    Only load claims-based measures by using the 'performanceOptions' key. The file defaults to
+    the single source for the configured measures year, and is only parsed once per process.
     """
-    with open(json_path, encoding='utf-8') as file:
-        single_source_as_list = json.load(file)
-
-    return {
-        measure_json['measureId']: measure_json
-        for measure_json in single_source_as_list
-        if 'performanceOptions' in measure_json
-    }
+    return measure_registry.load_registry(json_path)
 
 
-def load_measure_definition(measure_number, single_source_json=load_single_source()):
+def load_measure_definition(measure_number, single_source_json=None):
     """
     Load a MeasureDefinition model describing a single measure.
 
@@ -33,6 +21,8 @@ def load_measure_definition(measure_number, single_source_json=load_single_sourc
         measure_number: A string, e.g. '046'
         single_source_json: a mapping measure_number-->measure_definition
     """
+    if single_source_json is None:
+        single_source_json = load_single_source()
     measure_definition = single_source_json.get(measure_number, None)
     if measure_definition:
         return MeasureDefinition(measure_definition, strict=False)
@@ -0,0 +1,94 @@
+"""
+Compiled registry of the claims-based measures in a single source JSON file.
+
+Parsing the single source file is only done once per process and file. The claims-based measures
+are also compiled to a marshal file keyed by the hash of the JSON contents, which is much faster
+to load than the JSON itself and is invalidated whenever the single source file changes.
+"""
+import hashlib
+import marshal
+import os
+
+from claims_to_quality.config import config
+from claims_to_quality.lib.qpp_logging import logging_config
+
+import ujson as json
+
+logger = logging_config.get_logger(__name__)
+
+# Increment when the structure of the compiled registry changes.
+REGISTRY_VERSION = 1
+
+# Registries loaded in this process, keyed by JSON path.
+_registries = {}
+
+
+def get_single_source_path(year=None):
+    """Return the path of the single source JSON file for the given year (default: config)."""
+    return config.get('assets.qpp_single_source_json')[
+        year or config.get('calculation.measures_year')
+    ]
+
+
+def load_registry(json_path=None):
+    """
+    Return the claims-based measures in the single source file as a dict keyed by measure number.
+
+    The registry is shared by all callers in the process and must not be modified.
+    """
+    json_path = json_path or get_single_source_path()
+    registry = _registries.get(json_path)
+    if registry is None:
+        registry = _registries[json_path] = _load_compiled_registry(json_path)
+    return registry
+
+
+def clear_registries():
+    """Forget the registries loaded in this process."""
+    _registries.clear()
+
+
+def _compile_registry(single_source_as_list):
+    """Only keep claims-based measures by using the 'performanceOptions' key."""
+    return {
+        measure_json['measureId']: measure_json
+        for measure_json in single_source_as_list
+        if 'performanceOptions' in measure_json
+    }
+
+
+def _get_compiled_path(contents):
+    return os.path.join(
+        config.get('assets.compiled_measures_dir'),
+        'measures-v{version}-{digest}.marshal'.format(
+            version=REGISTRY_VERSION, digest=hashlib.sha256(contents).hexdigest())
+    )
+
+
+def _load_compiled_registry(json_path):
+    with open(json_path, 'rb') as file:
+        contents = file.read()
+
+    compiled_path = _get_compiled_path(contents)
+    try:
+        with open(compiled_path, 'rb') as file:
+            return marshal.load(file)
+    except (OSError, EOFError, ValueError, TypeError):
+        pass
+
+    registry = _compile_registry(json.loads(contents.decode('utf-8')))
+    _write_compiled_registry(registry, compiled_path)
+    return registry
+
+
+def _write_compiled_registry(registry, compiled_path):
+    """Write the compiled registry atomically, so that other processes never read part of it."""
+    temporary_path = '{}.{}.tmp'.format(compiled_path, os.getpid())
+    try:
+        os.makedirs(os.path.dirname(compiled_path), exist_ok=True)
+        with open(temporary_path, 'wb') as file:
+            marshal.dump(registry, file)
+        os.replace(temporary_path, compiled_path)
+    except OSError as error:
+        logger.warning('Could not write compiled measure registry {}: {}'.format(
+            compiled_path, error))
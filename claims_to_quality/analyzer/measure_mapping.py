@@ -14,7 +14,7 @@ from claims_to_quality.analyzer.calculation.patient_periodic_measure import Pati
 from claims_to_quality.analyzer.calculation.patient_process_measure import PatientProcessMeasure
 from claims_to_quality.analyzer.calculation.procedure_measure import ProcedureMeasure
 from claims_to_quality.analyzer.calculation.visit_measure import VisitMeasure
-from claims_to_quality.analyzer.datasource import measure_reader
+from claims_to_quality.analyzer.datasource import measure_reader, measure_registry
 from claims_to_quality.config import config
 
 MEASURE_NUMBER_TO_CLASS = {
@@ -174,7 +174,7 @@ MEASURE_NUMBER_TO_CLASS = {
 def get_measure_calculator(
     measure_number,
     year=config.get('calculation.measures_year'),
-    single_source_json=measure_reader.load_single_source(),
+    single_source_json=None,
 ):
     """Generate a measure calculator object with correct definition and type."""
     try:
@@ -196,8 +196,8 @@ def get_measure_calculator(
 
 def get_measure_calculators(measures, year=config.get('calculation.measures_year')):
     """Generate a dictionary of measure calculator object with correct definition and type."""
-    json_path = config.get('assets.qpp_single_source_json')[year]
-    single_source_json = measure_reader.load_single_source(json_path)
+    single_source_json = measure_reader.load_single_source(
+        measure_registry.get_single_source_path(year))
     return {
         measure: get_measure_calculator(
             measure_number=measure,
@@ -0,0 +1,384 @@
+"""
+Columnar representation of the claims for a whole batch of providers.
+
+A batch holds millions of claim lines. Instead of keeping one Python object per claim and per
+line, ClaimBatch stores claim-level values as NumPy arrays (dates as day ordinals, codes and
+beneficiary keys as interned integers) and line-level values as CSR-style offset arrays.
+
+Claims for a single provider are contiguous, so a provider's claims are exposed as a
+zero-copy ClaimBatchView. Claim records are only materialized when a provider is processed.
+Batches read from the IDR are built with a ClaimBatchBuilder directly from the claim line rows.
+"""
+import collections
+import datetime
+
+from claims_to_quality.analyzer.datasource import code_reader
+from claims_to_quality.analyzer.models import claim_record
+from claims_to_quality.analyzer.models.code_vocabulary import CodeVocabulary
+
+import numpy as np
+
+# Sentinel values for missing dates, codes and sex codes.
+MISSING_DATE = 0
+MISSING_SEX_CODE = -1
+
+
+def _date_to_ordinal(value):
+    return value.toordinal() if value is not None else MISSING_DATE
+
+
+def _ordinal_to_date(value):
+    return datetime.date.fromordinal(value) if value != MISSING_DATE else None
+
+
+def _sex_code_to_int(value):
+    return int(value) if value and value.isdigit() else MISSING_SEX_CODE
+
+
+def _rows_with_any_id(ids, offsets, id_set):
+    """
+    Return a boolean mask over rows indicating which rows contain at least one of id_set.
+
+    `ids` is a flat array of integer ids and row i covers ids[offsets[i]:offsets[i + 1]].
+    """
+    matches = np.isin(ids, np.fromiter(id_set, dtype=np.int32, count=len(id_set)))
+    cumulative_matches = np.concatenate(([0], np.cumsum(matches)))
+    return (cumulative_matches[offsets[1:]] - cumulative_matches[offsets[:-1]]) > 0
+
+
+class _ClaimColumns(object):
+    """
+    Operations shared by a ClaimBatch and its provider views.
+
+    Subclasses define the claim-level arrays and the offset arrays used below.
+    Line and diagnosis offsets are absolute indices into the batch-level arrays.
+    """
+
+    def __len__(self):
+        """Return the number of claims."""
+        return len(self.clm_from_dt)
+
+    def claims_with_any_procedure_code(self, procedure_codes):
+        """Return a boolean mask over claims, True where a line has any of the given codes."""
+        return _rows_with_any_id(
+            self._batch.line_hcpcs, self.line_offsets, self._batch.codes.get_ids(procedure_codes)
+        )
+
+    def has_any_procedure_code(self, procedure_codes):
+        """Return True if any claim has a line with any of the given codes."""
+        code_ids = self._batch.codes.get_ids(procedure_codes)
+        lines = self._batch.line_hcpcs[self.line_offsets[0]:self.line_offsets[-1]]
+        return bool(code_ids) and bool(np.isin(lines, list(code_ids)).any())
+
+    def claims_with_any_diagnosis_code(self, diagnosis_codes):
+        """Return a boolean mask over claims, True where the claim has any of the given codes."""
+        return _rows_with_any_id(
+            self._batch.dx_codes, self.dx_offsets, self._batch.codes.get_ids(diagnosis_codes)
+        )
+
+    def claims_in_date_range(self, from_date, to_date):
+        """Return a boolean mask over claims, True where clm_from_dt is in the date range."""
+        return (
+            (self.clm_from_dt >= from_date.toordinal()) &
+            (self.clm_from_dt <= to_date.toordinal())
+        )
+
+    def claims_in_age_range(self, min_age, max_age):
+        """Return a boolean mask over claims, True where min_age <= bene_age < max_age."""
+        return (self.bene_age >= min_age) & (self.bene_age < max_age)
+
+    def claims_with_sex_code(self, sex_code):
+        """Return a boolean mask over claims, True where the beneficiary has the sex code."""
+        return self.bene_sex_cd == _sex_code_to_int(sex_code)
+
+
+class ClaimBatchBuilder(object):
+    """
+    Accumulate the columns of a ClaimBatch one claim at a time.
+
+    Claims are added to the provider most recently passed to `add_provider`, so that the
+    claims of each provider are contiguous. Claims can be given as ClaimRecords or as
+    dictionaries of the same fields (e.g. as read from the IDR), so that batches read from
+    the database never need per-claim objects.
+    """
+
+    def __init__(self, code_vocabulary=None):
+        """
+        Initialize an empty ClaimBatchBuilder.
+
+        Args:
+            code_vocabulary (CodeVocabulary): Vocabulary used to intern codes. Codes observed
+                in the claims are added to it. Defaults to a new, empty vocabulary, in which
+                case materialized claims have no procedure code bitset.
+        """
+        self.codes = code_vocabulary if code_vocabulary is not None else CodeVocabulary()
+        self.bene_sks = CodeVocabulary()
+        self.provider_ranges = collections.OrderedDict()
+        self.columns = collections.defaultdict(list)
+        for offsets in ('line_offsets', 'dx_offsets', 'mdfr_offsets'):
+            self.columns[offsets].append(0)
+        self._identifier = None
+
+    @property
+    def num_claims(self):
+        """Return the number of claims added so far."""
+        return len(self.columns['clm_from_dt'])
+
+    def add_provider(self, identifier):
+        """Start the claims of the given (tin, npi)."""
+        if identifier in self.provider_ranges:
+            raise ValueError('Claims of provider {} are not contiguous.'.format(identifier))
+        self.provider_ranges[identifier] = (self.num_claims, self.num_claims)
+        self._identifier = identifier
+
+    def add_claim(self, claim):
+        """
+        Append a claim of the current provider.
+
+        Args:
+            claim: ClaimRecord, or dictionary of its field values. Claim lines can likewise be
+                ClaimLineRecords or dictionaries.
+        """
+        columns = self.columns
+        intern = self.codes.intern
+        clm_from_dt = claim_record.to_date(claim['clm_from_dt'])
+        clm_ptnt_birth_dt = claim_record.to_date(claim['clm_ptnt_birth_dt'])
+        columns['splt_clm_ids'].append(claim_record.to_str(claim['splt_clm_id']))
+        columns['bene_keys'].append(self.bene_sks.intern(claim_record.to_str(claim['bene_sk'])))
+        columns['clm_ptnt_birth_dt'].append(_date_to_ordinal(clm_ptnt_birth_dt))
+        columns['clm_from_dt'].append(_date_to_ordinal(clm_from_dt))
+        columns['clm_thru_dt'].append(
+            _date_to_ordinal(claim_record.to_date(claim['clm_thru_dt'])))
+        columns['bene_age'].append(claim_record.get_bene_age(clm_from_dt, clm_ptnt_birth_dt))
+        columns['bene_sex_cd'].append(
+            _sex_code_to_int(claim_record.to_str(claim['clm_bene_sex_cd'])))
+        columns['dx_codes'].extend(intern(code) for code in claim['dx_codes'] or [])
+        columns['dx_offsets'].append(len(columns['dx_codes']))
+        for line in claim['claim_lines']:
+            columns['line_num'].append(claim_record.to_int(line['clm_line_num']) or 0)
+            columns['line_hcpcs'].append(intern(claim_record.to_str(line['clm_line_hcpcs_cd'])))
+            columns['line_pos'].append(intern(claim_record.to_str(line['clm_pos_code'])))
+            columns['line_from_dt'].append(
+                _date_to_ordinal(claim_record.to_date(line['clm_line_from_dt'])))
+            columns['line_thru_dt'].append(
+                _date_to_ordinal(claim_record.to_date(line['clm_line_thru_dt'])))
+            columns['mdfr_codes'].extend(intern(code) for code in line['mdfr_cds'] or [])
+            columns['mdfr_offsets'].append(len(columns['mdfr_codes']))
+        columns['line_offsets'].append(len(columns['line_hcpcs']))
+
+        start, _ = self.provider_ranges[self._identifier]
+        self.provider_ranges[self._identifier] = (start, self.num_claims)
+
+    def build(self):
+        """Return the ClaimBatch of the claims added. The builder should not be reused."""
+        return ClaimBatch.from_builder(self)
+
+
+class ClaimBatch(_ClaimColumns, collections.abc.Mapping):
+    """
+    Columnar claims for a batch of providers.
+
+    ClaimBatch is a read-only mapping from (tin, npi) to the list of the provider's claims so
+    that it can be used wherever a batch dictionary of claims is expected. Claims are
+    materialized on access, and the claims of the provider accessed last are kept so that a
+    provider is only materialized once while it is processed. Use `get_view` or the batch-level
+    masks to work with the columns directly.
+    """
+
+    def __init__(self, claims_by_provider, code_vocabulary=None):
+        """
+        Build a ClaimBatch from (tin, npi) -> claims pairs.
+
+        Args:
+            claims_by_provider: mapping or iterable of ((tin, npi), list(Claim)) pairs.
+                Passing a generator lets the per-provider claim objects be freed as soon as
+                they have been converted into columns.
+            code_vocabulary (CodeVocabulary): Vocabulary used to intern codes. Codes observed
+                in the claims are added to it. Defaults to a new, empty vocabulary.
+        """
+        if isinstance(claims_by_provider, collections.abc.Mapping):
+            claims_by_provider = claims_by_provider.items()
+
+        builder = ClaimBatchBuilder(code_vocabulary)
+        for identifier, claims in claims_by_provider:
+            builder.add_provider(identifier)
+            for claim in claims:
+                builder.add_claim(claim)
+        self._set_columns(builder)
+
+    @classmethod
+    def from_builder(cls, builder):
+        """Return a ClaimBatch holding the columns accumulated by a ClaimBatchBuilder."""
+        batch = cls.__new__(cls)
+        batch._set_columns(builder)
+        return batch
+
+    def _set_columns(self, builder):
+        columns = builder.columns
+        self._batch = self
+        self.codes = builder.codes
+        self.bene_sks = builder.bene_sks
+        self.provider_ranges = builder.provider_ranges
+        # (identifier, claims) of the provider accessed last.
+        self._last_accessed = (None, None)
+
+        # Claim-level columns.
+        self.splt_clm_ids = columns['splt_clm_ids']
+        self.bene_keys = np.array(columns['bene_keys'], dtype=np.int32)
+        self.clm_ptnt_birth_dt = np.array(columns['clm_ptnt_birth_dt'], dtype=np.int32)
+        self.clm_from_dt = np.array(columns['clm_from_dt'], dtype=np.int32)
+        self.clm_thru_dt = np.array(columns['clm_thru_dt'], dtype=np.int32)
+        self.bene_age = np.array(columns['bene_age'], dtype=np.float64)
+        self.bene_sex_cd = np.array(columns['bene_sex_cd'], dtype=np.int8)
+        self.line_offsets = np.array(columns['line_offsets'], dtype=np.int64)
+        self.dx_offsets = np.array(columns['dx_offsets'], dtype=np.int64)
+        self.dx_codes = np.array(columns['dx_codes'], dtype=np.int32)
+
+        # Line-level columns.
+        self.line_num = np.array(columns['line_num'], dtype=np.int32)
+        self.line_hcpcs = np.array(columns['line_hcpcs'], dtype=np.int32)
+        self.line_pos = np.array(columns['line_pos'], dtype=np.int32)
+        self.line_from_dt = np.array(columns['line_from_dt'], dtype=np.int32)
+        self.line_thru_dt = np.array(columns['line_thru_dt'], dtype=np.int32)
+        self.mdfr_offsets = np.array(columns['mdfr_offsets'], dtype=np.int64)
+        self.mdfr_codes = np.array(columns['mdfr_codes'], dtype=np.int32)
+
+    def _build_claim(self, index, identifier):
+        """Materialize the claim at the given batch index as a ClaimRecord."""
+        lookup = self.codes.lookup
+        tin, npi = identifier
+        line_start, line_end = self.line_offsets[index], self.line_offsets[index + 1]
+        claim_lines = []
+        procedure_codes = {}
+        for line_index in range(line_start, line_end):
+            mdfr_start, mdfr_end = self.mdfr_offsets[line_index], self.mdfr_offsets[line_index + 1]
+            line = claim_record.ClaimLineRecord(
+                clm_line_num=int(self.line_num[line_index]),
+                clm_line_hcpcs_cd=lookup(self.line_hcpcs[line_index]),
+                mdfr_cds=[lookup(code_id) for code_id in self.mdfr_codes[mdfr_start:mdfr_end]],
+                clm_pos_code=lookup(self.line_pos[line_index]),
+                clm_line_from_dt=_ordinal_to_date(self.line_from_dt[line_index]),
+                clm_line_thru_dt=_ordinal_to_date(self.line_thru_dt[line_index]),
+            )
+            procedure_codes[line.clm_line_hcpcs_cd] = True
+            claim_lines.append(line)
+
+        # Bitsets are only comparable with those of the process-wide vocabulary.
+        procedure_code_bits = None
+        if self.codes is code_reader.get_code_vocabulary():
+            procedure_code_bits = self.codes.to_bitset(procedure_codes)
+
+        dx_start, dx_end = self.dx_offsets[index], self.dx_offsets[index + 1]
+        sex_code = self.bene_sex_cd[index]
+        return claim_record.ClaimRecord(
+            splt_clm_id=self.splt_clm_ids[index],
+            clm_rndrg_prvdr_npi_num=npi,
+            clm_rndrg_prvdr_tax_num=tin,
+            bene_sk=self.bene_sks.lookup(self.bene_keys[index]),
+            clm_ptnt_birth_dt=_ordinal_to_date(self.clm_ptnt_birth_dt[index]),
+            clm_bene_sex_cd=str(sex_code) if sex_code != MISSING_SEX_CODE else None,
+            clm_from_dt=_ordinal_to_date(self.clm_from_dt[index]),
+            clm_thru_dt=_ordinal_to_date(self.clm_thru_dt[index]),
+            dx_codes=[lookup(code_id) for code_id in self.dx_codes[dx_start:dx_end]],
+            claim_lines=claim_lines,
+            aggregated_procedure_codes=procedure_codes,
+            procedure_code_bits=procedure_code_bits,
+        )
+
+    def iter_claims(self, mask=None):
+        """
+        Yield ((tin, npi), claims) pairs, optionally restricted to the claims selected by mask.
+
+        Claims are materialized one provider at a time, and providers without any claim
+        selected by the mask are skipped.
+        """
+        for identifier, (start, end) in self.provider_ranges.items():
+            provider_mask = mask[start:end] if mask is not None else None
+            if provider_mask is not None and not provider_mask.any():
+                continue
+            yield identifier, self.get_view(identifier).to_claims(provider_mask)
+
+    def to_claims(self, mask=None):
+        """Materialize claim records, optionally restricted to the claims selected by mask."""
+        return [claim for _, claims in self.iter_claims(mask) for claim in claims]
+
+    def claims_of_providers_with_any(self, mask):
+        """Return a boolean mask over claims, True for all claims of providers with any in mask."""
+        provider_mask = np.zeros(self.num_claims, dtype=bool)
+        for start, end in self.provider_ranges.values():
+            if mask[start:end].any():
+                provider_mask[start:end] = True
+        return provider_mask
+
+    def get_view(self, identifier):
+        """Return a zero-copy ClaimBatchView over the claims of the given (tin, npi)."""
+        start, end = self.provider_ranges[identifier]
+        return ClaimBatchView(self, identifier, start, end)
+
+    def select(self, mask):
+        """Return a new ClaimBatch containing only the claims selected by the boolean mask."""
+        return ClaimBatch(
+            (
+                (identifier, self.get_view(identifier).to_claims(mask[start:end]))
+                for identifier, (start, end) in self.provider_ranges.items()
+            ),
+            code_vocabulary=self.codes
+        )
+
+    @property
+    def nbytes(self):
+        """Return the number of bytes used by the NumPy arrays of the batch."""
+        return sum(
+            value.nbytes for value in vars(self).values() if isinstance(value, np.ndarray)
+        )
+
+    def __getitem__(self, identifier):
+        """Return the materialized claims of the given (tin, npi), cached until the next one."""
+        last_identifier, last_claims = self._last_accessed
+        if last_claims is not None and last_identifier == identifier:
+            return last_claims
+        claims = self.get_view(identifier).to_claims()
+        self._last_accessed = (identifier, claims)
+        return claims
+
+    def __iter__(self):
+        """Iterate over the (tin, npi) identifiers in the batch."""
+        return iter(self.provider_ranges)
+
+    def __len__(self):
+        """Return the number of providers in the batch."""
+        return len(self.provider_ranges)
+
+    @property
+    def num_claims(self):
+        """Return the number of claims in the batch."""
+        return len(self.clm_from_dt)
+
+
+class ClaimBatchView(_ClaimColumns):
+    """Zero-copy view over the contiguous claims of a single provider in a ClaimBatch."""
+
+    def __init__(self, batch, identifier, start, end):
+        """Create a view over claims [start, end) of the batch."""
+        self._batch = batch
+        self._start = start
+        self.identifier = identifier
+        self.bene_keys = batch.bene_keys[start:end]
+        self.clm_from_dt = batch.clm_from_dt[start:end]
+        self.clm_thru_dt = batch.clm_thru_dt[start:end]
+        self.bene_age = batch.bene_age[start:end]
+        self.bene_sex_cd = batch.bene_sex_cd[start:end]
+        self.line_offsets = batch.line_offsets[start:end + 1]
+        self.dx_offsets = batch.dx_offsets[start:end + 1]
+
+    def get_bene_sks(self):
+        """Return the set of beneficiary keys (bene_sk) of the provider's claims."""
+        return {self._batch.bene_sks.lookup(key) for key in np.unique(self.bene_keys)}
+
+    def to_claims(self, mask=None):
+        """Materialize claim records, optionally restricted to the claims selected by mask."""
+        indices = range(len(self)) if mask is None else np.flatnonzero(mask)
+        return [
+            self._batch._build_claim(self._start + int(index), self.identifier)
+            for index in indices
+        ]
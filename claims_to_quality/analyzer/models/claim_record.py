@@ -0,0 +1,209 @@
+"""
+Compact, slotted record types for claims and claim lines.
+
+The schematics `Claim` and `ClaimLine` models re-validate and re-convert every field on
+construction, which dominates batch build time for large providers. These records expose the
+same attribute API used by the measure classes but only convert values that are not already
+native Python types (e.g. values read from csv), so that the claim reader can build them
+directly from typed Teradata values.
+"""
+import datetime
+import functools
+
+import ciso8601
+
+from dateutil.relativedelta import relativedelta
+
+
+def to_date(value):
+    """Convert an ISO-formatted string to a date, leaving date objects untouched."""
+    if value is None or isinstance(value, datetime.date):
+        return value
+    parsed = ciso8601.parse_datetime(value)
+    if parsed is None:
+        raise ValueError('Date format invalid: {}'.format(value))
+    return parsed.date()
+
+
+def to_str(value):
+    """Convert a value to a string, leaving strings and None untouched."""
+    if value is None or isinstance(value, str):
+        return value
+    return str(value)
+
+
+def to_int(value):
+    """Convert a value to an integer, leaving integers and None untouched."""
+    if value is None or isinstance(value, int):
+        return value
+    return int(value)
+
+
+@functools.lru_cache(maxsize=2**16)
+def get_bene_age(clm_from_dt, clm_ptnt_birth_dt):
+    """
+    Return the patient age in years at date of service, as a float.
+
+    This is the same calculation as `Claim.bene_age`. Results are cached since the same
+    (date of service, birth date) pairs recur across the claims of a beneficiary.
+    """
+    age_delta = relativedelta(clm_from_dt, clm_ptnt_birth_dt)
+    return age_delta.years + age_delta.months / 12.0 + age_delta.days / 365.0
+
+
+class _Record(object):
+    """Base class providing dictionary-style access and equality for slotted records."""
+
+    __slots__ = ()
+
+    # Fields compared for equality. Derived attributes (e.g. bene_age) are excluded.
+    _fields = ()
+
+    def __getitem__(self, name):
+        """Return the value of the given field."""
+        try:
+            return getattr(self, name)
+        except AttributeError:
+            raise KeyError(name)
+
+    def __setitem__(self, name, value):
+        """Set the value of the given field."""
+        if name not in self._fields:
+            raise KeyError(name)
+        setattr(self, name, value)
+
+    def get(self, name, default=None):
+        """Return the value of the given field, or `default` if it does not exist."""
+        return getattr(self, name, default)
+
+    def __eq__(self, other):
+        """Compare records field by field."""
+        if type(self) is not type(other):
+            return NotImplemented
+        return all(getattr(self, field) == getattr(other, field) for field in self._fields)
+
+    __hash__ = None
+
+
+class ClaimLineRecord(_Record):
+    """Slotted equivalent of the `ClaimLine` model."""
+
+    _fields = (
+        'clm_line_num',
+        'clm_line_hcpcs_cd',
+        'mdfr_cds',
+        'clm_pos_code',
+        'clm_line_from_dt',
+        'clm_line_thru_dt',
+    )
+    # measure_code_matches caches the results of MeasureCode.matches_line for the line.
+    __slots__ = _fields + ('measure_code_matches',)
+
+    def __init__(
+            self,
+            clm_line_num=None,
+            clm_line_hcpcs_cd=None,
+            mdfr_cds=None,
+            clm_pos_code=None,
+            clm_line_from_dt=None,
+            clm_line_thru_dt=None):
+        """Create a ClaimLineRecord, converting non-native values where needed."""
+        self.clm_line_num = to_int(clm_line_num)
+        self.clm_line_hcpcs_cd = to_str(clm_line_hcpcs_cd)
+        self.mdfr_cds = mdfr_cds if mdfr_cds is not None else []
+        self.clm_pos_code = to_str(clm_pos_code)
+        self.clm_line_from_dt = to_date(clm_line_from_dt)
+        self.clm_line_thru_dt = to_date(clm_line_thru_dt)
+        self.measure_code_matches = None
+
+    def __str__(self):
+        """Return a string representation of the claim line."""
+        return 'ClaimLine - line_number: {clm_line_num}'.format(clm_line_num=self.clm_line_num)
+
+
+class ClaimRecord(_Record):
+    """
+    Slotted equivalent of the `Claim` model.
+
+    Exposes the attributes, item access and `get_procedure_codes` method used by the measure
+    classes, and pre-computes `bene_age` on initialization.
+    """
+
+    _fields = (
+        'splt_clm_id',
+        'clm_rndrg_prvdr_npi_num',
+        'clm_rndrg_prvdr_tax_num',
+        'bene_sk',
+        'clm_ptnt_birth_dt',
+        'clm_bene_sex_cd',
+        'clm_from_dt',
+        'clm_thru_dt',
+        'dx_codes',
+        'claim_lines',
+        'aggregated_procedure_codes',
+    )
+    __slots__ = _fields + ('bene_age', 'procedure_code_bits')
+
+    def __init__(
+            self,
+            splt_clm_id=None,
+            clm_rndrg_prvdr_npi_num=None,
+            clm_rndrg_prvdr_tax_num=None,
+            bene_sk=None,
+            clm_ptnt_birth_dt=None,
+            clm_bene_sex_cd=None,
+            clm_from_dt=None,
+            clm_thru_dt=None,
+            dx_codes=None,
+            claim_lines=None,
+            aggregated_procedure_codes=None,
+            procedure_code_bits=None):
+        """
+        Create a ClaimRecord, calculating and storing beneficiary age as float.
+
+        procedure_code_bits is the CodeVocabulary bitset of the claim's procedure codes, if known.
+        """
+        self.splt_clm_id = to_str(splt_clm_id)
+        self.clm_rndrg_prvdr_npi_num = to_str(clm_rndrg_prvdr_npi_num)
+        self.clm_rndrg_prvdr_tax_num = to_str(clm_rndrg_prvdr_tax_num)
+        self.bene_sk = to_str(bene_sk)
+        self.clm_ptnt_birth_dt = to_date(clm_ptnt_birth_dt)
+        self.clm_bene_sex_cd = to_str(clm_bene_sex_cd)
+        self.clm_from_dt = to_date(clm_from_dt)
+        self.clm_thru_dt = to_date(clm_thru_dt)
+        self.dx_codes = dx_codes if dx_codes is not None else []
+        self.claim_lines = claim_lines if claim_lines is not None else []
+        self.aggregated_procedure_codes = aggregated_procedure_codes
+        self.procedure_code_bits = procedure_code_bits
+        self.bene_age = get_bene_age(self.clm_from_dt, self.clm_ptnt_birth_dt)
+
+    @classmethod
+    def from_dict(cls, claim_data):
+        """Create a ClaimRecord from a dictionary shaped like the input to the `Claim` model."""
+        claim_data = dict(claim_data)
+        claim_data['claim_lines'] = [
+            ClaimLineRecord(**line) for line in claim_data.get('claim_lines') or []
+        ]
+        return cls(**claim_data)
+
+    def get_procedure_codes(self):
+        """
+        Return the map of procedure codes present in all claim lines under this claim.
+
+        If this claim was not created by claim_reader, aggregated_procedure_codes will be null
+        so we need to populate it.
+        """
+        if not self.aggregated_procedure_codes:
+            self.aggregated_procedure_codes = {
+                line.clm_line_hcpcs_cd: True for line in self.claim_lines
+            }
+
+        return self.aggregated_procedure_codes
+
+    def __str__(self):
+        """Return a string representation of the claim."""
+        return 'Claim-Split Claim ID: {splt_clm_id}, npi: {npi}, claim_lines: {claim_lines}'.format(
+            splt_clm_id=self.splt_clm_id,
+            npi=self.clm_rndrg_prvdr_npi_num,
+            claim_lines=len(self.claim_lines or [])
+        )
@@ -0,0 +1,93 @@
+"""
+Mapping between codes (HCPCS, ICD-10, modifier and place of service codes) and dense integer IDs.
+
+Reference codes, i.e. the codes mentioned in measure definitions, are given the first IDs in a
+deterministic order, so that vocabularies built from the same single source file in different
+processes agree. Codes observed in claims are appended after the reference codes.
+
+Sets of reference codes can be represented as integer bitsets, so that checking whether a claim
+has any of a measure's codes is a single bitwise AND.
+"""
+MISSING_CODE = -1
+
+
+class CodeVocabulary(object):
+    """Map codes to dense integer IDs."""
+
+    def __init__(self, reference_codes=()):
+        """
+        Create a CodeVocabulary.
+
+        Args:
+            reference_codes: Codes to give the first IDs to, in the given order. Only these
+                codes can be represented in bitsets.
+        """
+        self.codes = []
+        self.code_ids = {}
+        for code in reference_codes:
+            self.intern(code)
+        self.num_reference_codes = len(self.codes)
+
+    def intern(self, code):
+        """Return the ID of the given code, adding it if needed."""
+        if code is None:
+            return MISSING_CODE
+        code_id = self.code_ids.get(code)
+        if code_id is None:
+            code_id = len(self.codes)
+            self.code_ids[code] = code_id
+            self.codes.append(code)
+        return code_id
+
+    def lookup(self, code_id):
+        """Return the code for the given ID."""
+        return self.codes[code_id] if code_id != MISSING_CODE else None
+
+    def get_ids(self, codes):
+        """Return the set of IDs for the known codes among the given codes."""
+        return {self.code_ids[code] for code in codes if code in self.code_ids}
+
+    def to_bitset(self, codes):
+        """Return the bitset of the reference codes among the given codes, ignoring the others."""
+        bitset = 0
+        for code in codes:
+            code_id = self.code_ids.get(code, self.num_reference_codes)
+            if code_id < self.num_reference_codes:
+                bitset |= 1 << code_id
+        return bitset
+
+    def to_reference_bitset(self, codes):
+        """
+        Return the bitset of the given codes, or None if any of them is not a reference code.
+
+        A claim bitset only represents the claim's reference codes. Comparing it with the bitset
+        of a set of codes is only exact if all the codes in the set are reference codes.
+        """
+        bitset = 0
+        for code in codes:
+            code_id = self.code_ids.get(code, self.num_reference_codes)
+            if code_id >= self.num_reference_codes:
+                return None
+            bitset |= 1 << code_id
+        return bitset
+
+    def __len__(self):
+        """Return the number of codes in the vocabulary."""
+        return len(self.codes)
+
+    def __contains__(self, code):
+        """Return True if the code is in the vocabulary."""
+        return code in self.code_ids
+
+    def to_dict(self):
+        """Return a JSON-serializable representation of the vocabulary."""
+        return {'codes': list(self.codes), 'num_reference_codes': self.num_reference_codes}
+
+    @classmethod
+    def from_dict(cls, vocabulary_dict):
+        """Create a CodeVocabulary from the output of `to_dict`, preserving all IDs."""
+        codes = vocabulary_dict['codes']
+        vocabulary = cls(codes[:vocabulary_dict['num_reference_codes']])
+        for code in codes[vocabulary.num_reference_codes:]:
+            vocabulary.intern(code)
+        return vocabulary
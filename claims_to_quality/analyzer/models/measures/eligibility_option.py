@@ -1,4 +1,6 @@
 """"Model representing one measure eligibility option."""
+import collections
+
 from claims_to_quality.analyzer.models.measures import measure_code
 
 import newrelic.agent
@@ -45,6 +47,16 @@ class EligibilityOption(Model):
         """Initialize an EligibilityOption, pre-calculating which steps to use to filter claims."""
         super(EligibilityOption, self).__init__(*args, **kwargs)
 
+        # Share measure code instances across measures so that line matches are reused.
+        if self.procedure_codes:
+            self.procedure_codes = [
+                measure_code.canonicalize(code) for code in self.procedure_codes
+            ]
+        if self.additional_procedure_codes:
+            self.additional_procedure_codes = [
+                measure_code.canonicalize(code) for code in self.additional_procedure_codes
+            ]
+
         self.procedure_code_map = self._get_procedure_code_map_from_measure_codes(
             self.procedure_codes)
         self.additional_procedure_code_map = self._get_procedure_code_map_from_measure_codes(
@@ -100,19 +112,11 @@ class EligibilityOption(Model):
         """Convert a list of procedure codes into a mapping 'code_str': MeasureCode instance."""
         # TODO: Determine if the same code string ever appears twice for two distinct measure codes
         # within the same eligibility option.
-        procedure_code_strings = {
-            measure_code.code
-            for measure_code in procedure_code_list
-        } if procedure_code_list else set()
-
-        return {
-            code_string: [
-                measure_code
-                for measure_code in procedure_code_list
-                if measure_code.code == code_string
-            ]
-            for code_string in procedure_code_strings
-        }
+        procedure_code_map = collections.defaultdict(list)
+        for procedure_code in procedure_code_list or []:
+            procedure_code_map[procedure_code.code].append(procedure_code)
+
+        return dict(procedure_code_map)
 
     def __repr__(self):
         """Return a string representation of the eligibility option."""
@@ -1,9 +1,39 @@
 """Model representing one encounter/procedure/quality code in a measure definition."""
+import collections
+
 from schematics.models import Model
 from schematics.types import StringType
 from schematics.types.compound import ListType
 
 
+# Canonical MeasureCode instances, keyed by constraints and shared by all loaded measures.
+_canonical_measure_codes = {}
+
+# Number of line match results computed ('misses') and reused from the line cache ('hits').
+match_cache_stats = collections.Counter()
+
+
+def canonicalize(measure_code):
+    """Return the shared MeasureCode instance with the same constraints as the given one."""
+    canonical_measure_code = _canonical_measure_codes.get(measure_code.constraint_key)
+    if canonical_measure_code is None:
+        canonical_measure_code = measure_code
+        canonical_measure_code.canonical_id = len(_canonical_measure_codes)
+        _canonical_measure_codes[measure_code.constraint_key] = canonical_measure_code
+    return canonical_measure_code
+
+
+def get_match_cache_hit_rate():
+    """Return the proportion of line match results reused since the stats were last reset."""
+    total = match_cache_stats['hits'] + match_cache_stats['misses']
+    return match_cache_stats['hits'] / total if total else 0.0
+
+
+def reset_match_cache_stats():
+    """Reset the line match cache statistics."""
+    match_cache_stats.clear()
+
+
 class MeasureCode(Model):
     """This model represents each encounter/procedure/quality code in a measure definition."""
 
@@ -22,6 +52,17 @@ class MeasureCode(Model):
         """Initialize a MeasureCode, pre-calculating which steps to use to filter claim lines."""
         super(MeasureCode, self).__init__(*args, **kwargs)
 
+        # Measure codes with the same key match the same lines.
+        self.constraint_key = (
+            self.code,
+            frozenset(self.modifiers or []),
+            frozenset(self.modifier_exclusions or []),
+            frozenset(self.places_of_service or []),
+            frozenset(self.places_of_service_exclusions or []),
+        )
+        # Only canonical instances cache their results on claim lines.
+        self.canonical_id = None
+
         self.constraints = [self._does_line_match_hcpcs_string]
         # Only apply constraints relevant to the measure code.
         if self.places_of_service:
@@ -41,8 +82,28 @@ class MeasureCode(Model):
             self.constraints.append(self._does_line_meet_modifier_exclusion_constraint)
 
     def matches_line(self, line):
-        """Apply measure code constraints to the claim line."""
-        return all(constraint(line) for constraint in self.constraints)
+        """
+        Apply measure code constraints to the claim line.
+
+        For canonical measure codes, the result is cached on claim lines which support it, so
+        that it is reused by every measure sharing this measure code.
+        """
+        line_matches = getattr(line, 'measure_code_matches', False)
+        if self.canonical_id is None or line_matches is False:
+            return all(constraint(line) for constraint in self.constraints)
+
+        if line_matches is None:
+            line_matches = line.measure_code_matches = {}
+
+        match = line_matches.get(self.canonical_id)
+        if match is None:
+            match_cache_stats['misses'] += 1
+            match = line_matches[self.canonical_id] = all(
+                constraint(line) for constraint in self.constraints
+            )
+        else:
+            match_cache_stats['hits'] += 1
+        return match
 
     def _does_line_match_hcpcs_string(self, line):
         return self.code == line.clm_line_hcpcs_cd
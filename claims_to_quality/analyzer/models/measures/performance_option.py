@@ -1,4 +1,6 @@
 """Model representing one measure performance option."""
+import collections
+
 from claims_to_quality.analyzer.models.measures import measure_code
 
 from schematics.exceptions import ValidationError
@@ -46,14 +48,11 @@ class PerformanceOption(Model):
         """Initialize a PerformanceOption with quality codes as a set."""
         super(PerformanceOption, self).__init__(*args, **kwargs)
 
-        quality_code_strings = {
-            measure_code.code for measure_code in self.quality_codes
-        } if self.quality_codes else set()
-
-        self.quality_code_map = {
-            code_string: [
-                measure_code
-                for measure_code in self.quality_codes if measure_code.code == code_string
-            ]
-            for code_string in quality_code_strings
-        }
+        # Share measure code instances across measures so that line matches are reused.
+        if self.quality_codes:
+            self.quality_codes = [measure_code.canonicalize(code) for code in self.quality_codes]
+
+        quality_code_map = collections.defaultdict(list)
+        for quality_code in self.quality_codes or []:
+            quality_code_map[quality_code.code].append(quality_code)
+        self.quality_code_map = dict(quality_code_map)
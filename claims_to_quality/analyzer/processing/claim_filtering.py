@@ -9,7 +9,16 @@ import newrelic.agent
 
 logger = logging_config.get_logger(__name__)
 
-QUALITY_CODES = set(code_reader.load_quality_codes())
+_quality_codes = None
+_quality_code_bits = None
+
+
+def get_quality_codes():
+    """Return the set of quality codes of all measures, loading it on first use."""
+    global _quality_codes
+    if _quality_codes is None:
+        _quality_codes = frozenset(code_reader.load_quality_codes())
+    return _quality_codes
 
 
 def filter_claims_by_date(claims_data, from_date, to_date):
@@ -20,32 +29,69 @@ def filter_claims_by_date(claims_data, from_date, to_date):
     ]
 
 
-def does_claim_have_quality_codes(claim, quality_codes=QUALITY_CODES):
+def _get_code_bits(codes):
+    """
+    Return the vocabulary bitset of the given codes, or None if it cannot be used for filtering.
+
+    The bitset of the quality codes of all measures is only calculated once.
+    """
+    if codes is _quality_codes:
+        global _quality_code_bits
+        if _quality_code_bits is None:
+            _quality_code_bits = code_reader.get_code_vocabulary().to_reference_bitset(codes)
+        return _quality_code_bits
+    return code_reader.get_code_vocabulary().to_reference_bitset(codes)
+
+
+def _does_claim_have_any_codes(claim, codes, code_bits):
+    """Check the claim's procedure codes with the bitset if available, or the code set."""
+    claim_bits = getattr(claim, 'procedure_code_bits', None)
+    if code_bits is not None and claim_bits is not None:
+        return bool(claim_bits & code_bits)
+    return not codes.isdisjoint(claim.get_procedure_codes())
+
+
+def does_claim_have_quality_codes(claim, quality_codes=None):
     """Ascertain whether a claim has any quality codes present on its lines."""
-    return not quality_codes.isdisjoint(claim.get_procedure_codes())
+    if quality_codes is None:
+        quality_codes = get_quality_codes()
+    return _does_claim_have_any_codes(claim, quality_codes, _get_code_bits(quality_codes))
 
 
-def do_any_claims_have_quality_codes(claims_data, quality_codes=QUALITY_CODES):
+def do_any_claims_have_quality_codes(claims_data, quality_codes=None):
     """Ascertain whether any claims have quality codes."""
-    quality_code_set = set(quality_codes)
-    return any((does_claim_have_quality_codes(claim, quality_code_set) for claim in claims_data))
+    if quality_codes is None:
+        quality_code_set = get_quality_codes()
+    else:
+        quality_code_set = set(quality_codes)
+    quality_code_bits = _get_code_bits(quality_code_set)
+    return any(
+        _does_claim_have_any_codes(claim, quality_code_set, quality_code_bits)
+        for claim in claims_data
+    )
 
 
 def does_claim_have_relevant_procedure_codes(claim, procedure_codes):
     """Ascertain whether any claims have matching procedure codes."""
-    return not procedure_codes.isdisjoint(claim.get_procedure_codes())
+    return _does_claim_have_any_codes(claim, procedure_codes, _get_code_bits(procedure_codes))
 
 
-@newrelic.agent.function_trace(name='filter-claims-by-qpp-relevant-procedure-codes', group='Task')
-def filter_claims_by_measure_procedure_codes(claims_data, measure_definitions):
-    """Return claims containing any measure-relevant procedure codes."""
-    procedure_codes = {
+def get_measure_procedure_codes(measure_definitions):
+    """Return the set of procedure codes relevant to any of the given measures."""
+    return {
         code for measure in measure_definitions
         for code in measure.procedure_code_map
     }
 
+
+@newrelic.agent.function_trace(name='filter-claims-by-qpp-relevant-procedure-codes', group='Task')
+def filter_claims_by_measure_procedure_codes(claims_data, measure_definitions):
+    """Return claims containing any measure-relevant procedure codes."""
+    procedure_codes = get_measure_procedure_codes(measure_definitions)
+
     does_claim_meet_filter_condition = functools.partial(
-        does_claim_have_relevant_procedure_codes,
-        procedure_codes=procedure_codes
+        _does_claim_have_any_codes,
+        codes=procedure_codes,
+        code_bits=_get_code_bits(procedure_codes)
     )
     return list(filter(does_claim_meet_filter_condition, claims_data))
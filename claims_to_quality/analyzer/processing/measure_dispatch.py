@@ -0,0 +1,77 @@
+"""
+Index dispatching a provider's claims to the measures they may be eligible for.
+
+Each measure only counts claims matching one of its eligibility options, and every option
+with procedure codes requires a claim line matching one of them. The index maps each HCPCS code
+to the (measure, eligibility option, measure code) entries it may match, so that a single pass
+over a provider's claim lines finds the candidate claims of every measure.
+"""
+import collections
+
+from claims_to_quality.lib.qpp_logging import logging_config
+
+import newrelic.agent
+
+logger = logging_config.get_logger(__name__)
+
+IndexEntry = collections.namedtuple(
+    'IndexEntry', ['measure_number', 'eligibility_option', 'measure_code'])
+
+
+class MeasureDispatchIndex(object):
+    """Map HCPCS codes to the measure codes of the eligibility options they may match."""
+
+    def __init__(self, measure_calculators):
+        """
+        Compile the index for the given measure calculators.
+
+        Args:
+            measure_calculators: dict of measure_number --> QPPMeasure.
+        """
+        self.entries_by_code = collections.defaultdict(list)
+        # Measures that must be given all of a provider's claims.
+        self.measures_using_all_claims = set()
+
+        for measure_number, calculator in measure_calculators.items():
+            if calculator.uses_all_claims or any(
+                    not (option.procedure_codes or option.additional_procedure_codes)
+                    for option in calculator.eligibility_options):
+                self.measures_using_all_claims.add(measure_number)
+                continue
+
+            for option in calculator.eligibility_options:
+                # Options with both lists require a match in each, so index procedure codes only.
+                for measure_code in option.procedure_codes or option.additional_procedure_codes:
+                    self.entries_by_code[measure_code.code].append(
+                        IndexEntry(measure_number, option, measure_code)
+                    )
+
+        self.entries_by_code = dict(self.entries_by_code)
+        logger.debug('Measure dispatch index compiled for {} codes.'.format(
+            len(self.entries_by_code)))
+
+    @newrelic.agent.function_trace(name='get-candidate-claims', group='Task')
+    def get_candidate_claims(self, claims):
+        """
+        Return the claims that may be eligible for each measure, in a single pass over the lines.
+
+        Returns:
+            dict of measure_number --> list of claims, in the original order. Measures without
+            any candidate claims are omitted.
+        """
+        candidate_claims = collections.defaultdict(list)
+        for claim in claims:
+            matched_measures = set()
+            for line in claim.claim_lines:
+                for entry in self.entries_by_code.get(line.clm_line_hcpcs_cd, ()):
+                    if (entry.measure_number not in matched_measures and
+                            entry.measure_code.matches_line(line)):
+                        matched_measures.add(entry.measure_number)
+
+            for measure_number in matched_measures:
+                candidate_claims[measure_number].append(claim)
+
+        for measure_number in self.measures_using_all_claims:
+            candidate_claims[measure_number] = claims
+
+        return dict(candidate_claims)
@@ -6,7 +6,6 @@ This module is used during 90-day-window determination.
 # TODO: Create Provider class to handle this logic.
 import datetime
 
-from claims_to_quality.analyzer.datasource import code_reader
 from claims_to_quality.analyzer.processing import claim_filtering
 from claims_to_quality.lib.qpp_logging import logging_config
 
@@ -16,7 +15,6 @@ import newrelic.agent
 logger = logging_config.get_logger(__name__)
 
 MINIMUM_REPORTING_PERIOD = datetime.timedelta(days=90)
-QUALITY_CODES = set(code_reader.load_quality_codes())
 
 
 class MissingCodeException(Exception):
@@ -0,0 +1,226 @@
+"""
+Pipelined driver running IDR fetch, measure calculation and submission concurrently.
+
+Each stage runs in its own thread and hands batches to the next stage through a bounded queue,
+so that a slow stage blocks the stages upstream of it instead of letting batches pile up:
+
+    fetch:   read a batch of SQS messages and load the providers' claims from the IDR.
+    compute: calculate the measures of each provider of the batch.
+    submit:  submit the measurement sets and delete the SQS messages.
+
+While batch N is being calculated, batch N+1 is read from Teradata and batch N-1 is submitted.
+Each stage records the time spent working, waiting for input and blocked on a full output queue,
+so that the bottleneck stage can be identified from its occupancy.
+"""
+import queue
+import threading
+import time
+
+from claims_to_quality.analyzer.processing import process
+from claims_to_quality.lib.qpp_logging import logging_config
+from claims_to_quality.lib.sqs_methods import message_handling
+
+logger = logging_config.get_logger(__name__)
+
+# Marks the end of the batches flowing through the pipeline.
+_END_OF_BATCHES = object()
+
+
+class StageMetrics(object):
+    """Time spent by a pipeline stage working, waiting for input and blocked on its output."""
+
+    def __init__(self, name):
+        """Create empty metrics for the named stage."""
+        self.name = name
+        self.busy_seconds = 0.0
+        self.waiting_seconds = 0.0
+        self.blocked_seconds = 0.0
+        self.batches = 0
+
+    @property
+    def occupancy(self):
+        """Return the proportion of the stage's time spent working."""
+        total = self.busy_seconds + self.waiting_seconds + self.blocked_seconds
+        return self.busy_seconds / total if total else 0.0
+
+    def to_dict(self):
+        """Return the metrics as a dictionary."""
+        return {
+            'batches': self.batches,
+            'busy_seconds': self.busy_seconds,
+            'waiting_seconds': self.waiting_seconds,
+            'blocked_seconds': self.blocked_seconds,
+            'occupancy': self.occupancy,
+        }
+
+
+class Pipeline(object):
+    """Run the fetch, compute and submit stages of the analyzer concurrently."""
+
+    STAGES = ('fetch', 'compute', 'submit')
+
+    def __init__(
+            self,
+            queue_reader,
+            processor,
+            submitter,
+            batch_size,
+            queue_size=1,
+            log_interval=10):
+        """
+        Initialize a Pipeline.
+
+        :param queue_reader: QueueReader providing batches of SQS messages
+        :param processor: Processor used to load claims and calculate measures
+        :param submitter: Submitter used to submit results and delete messages
+        :param batch_size: Number of SQS messages per batch
+        :type batch_size: int
+        :param queue_size: Number of batches which can wait between two stages
+        :type queue_size: int
+        :param log_interval: Number of submitted batches between two occupancy logs
+        :type log_interval: int
+        """
+        self.queue_reader = queue_reader
+        self.processor = processor
+        self.submitter = submitter
+        self.batch_size = batch_size
+        self.log_interval = log_interval
+        self.queues = {
+            'compute': queue.Queue(maxsize=queue_size),
+            'submit': queue.Queue(maxsize=queue_size),
+        }
+        self.metrics = {stage: StageMetrics(stage) for stage in self.STAGES}
+        self._stop = threading.Event()
+        self._errors = []
+
+    def run(self, max_batches=None):
+        """
+        Run the pipeline until `max_batches` batches have been read, or until stopped.
+
+        Raises the first exception raised by any of the stages, once all stages have stopped.
+        """
+        threads = [
+            threading.Thread(target=self._run_stage, args=(stage, target), name=stage, daemon=True)
+            for stage, target in (
+                ('fetch', lambda: self._fetch_stage(max_batches)),
+                ('compute', self._compute_stage),
+                ('submit', self._submit_stage),
+            )
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.log_metrics()
+        if self._errors:
+            raise self._errors[0]
+
+    def stop(self):
+        """Stop reading new batches. Batches already read are processed and submitted."""
+        self._stop.set()
+
+    def get_metrics(self):
+        """Return the metrics of each stage, and the current number of batches in each queue."""
+        return {
+            'stages': {stage: self.metrics[stage].to_dict() for stage in self.STAGES},
+            'queue_sizes': {stage: self.queues[stage].qsize() for stage in self.queues},
+        }
+
+    def log_metrics(self):
+        """Log the occupancy of each stage."""
+        logger.info('Pipeline stage occupancy - {}.'.format(', '.join(
+            '{}: {:.0%} ({} batches)'.format(
+                stage, self.metrics[stage].occupancy, self.metrics[stage].batches)
+            for stage in self.STAGES
+        )))
+
+    def _run_stage(self, stage, target):
+        try:
+            target()
+        except Exception as error:
+            logger.error('Pipeline {} stage failed: {}'.format(stage, error))
+            self._errors.append(error)
+            self._stop.set()
+            # Discard the remaining input so that the upstream stages are not blocked. The SQS
+            # messages of discarded batches are not deleted, so they will be read again.
+            if stage != 'fetch':
+                for _ in self._iterate_queue(stage):
+                    pass
+            # Let the downstream stages finish the batches they already have.
+            if stage != 'submit':
+                self._put(self._get_next_stage(stage), _END_OF_BATCHES, stage)
+
+    def _fetch_stage(self, max_batches):
+        metrics = self.metrics['fetch']
+        batches = self.queue_reader.read_batch(self.batch_size, stop_event=self._stop)
+        while not self._stop.is_set() and (max_batches is None or metrics.batches < max_batches):
+            start_time = time.perf_counter()
+            messages = next(batches, None)
+            metrics.waiting_seconds += time.perf_counter() - start_time
+            if messages is None:
+                break
+
+            start_time = time.perf_counter()
+            providers = message_handling.decode_messages(messages)
+            batch_claims_data = self._fetch_batch(providers)
+            metrics.busy_seconds += time.perf_counter() - start_time
+            metrics.batches += 1
+
+            self._put('compute', (providers, batch_claims_data), 'fetch')
+
+        self._put('compute', _END_OF_BATCHES, 'fetch')
+
+    def _fetch_batch(self, providers):
+        """Load the batch's claims, or mark all of its providers as errored if it fails."""
+        try:
+            return self.processor._safe_get_batch(providers)
+        except Exception as error:
+            logger.error(process.Processor._get_error_message_details(error))
+            for provider in providers:
+                provider['processing_error'] = True
+            return None
+
+    def _compute_stage(self):
+        metrics = self.metrics['compute']
+        for providers, batch_claims_data in self._iterate_queue('compute'):
+            start_time = time.perf_counter()
+            if batch_claims_data is not None:
+                # The discharge date cache of Measure 46 is only used by this stage.
+                providers = self.processor._process_providers(batch_claims_data, providers)
+            metrics.busy_seconds += time.perf_counter() - start_time
+            metrics.batches += 1
+
+            self._put('submit', providers, 'compute')
+
+        self._put('submit', _END_OF_BATCHES, 'compute')
+
+    def _submit_stage(self):
+        metrics = self.metrics['submit']
+        for providers in self._iterate_queue('submit'):
+            start_time = time.perf_counter()
+            self.submitter.submit_batch(providers)
+            metrics.busy_seconds += time.perf_counter() - start_time
+            metrics.batches += 1
+
+            if self.log_interval and metrics.batches % self.log_interval == 0:
+                self.log_metrics()
+
+    def _iterate_queue(self, stage):
+        """Yield the batches put in the stage's input queue until the end of the batches."""
+        while True:
+            start_time = time.perf_counter()
+            item = self.queues[stage].get()
+            self.metrics[stage].waiting_seconds += time.perf_counter() - start_time
+            if item is _END_OF_BATCHES:
+                return
+            yield item
+
+    def _put(self, stage, item, from_stage):
+        """Put an item in the stage's input queue, blocking while it is full."""
+        start_time = time.perf_counter()
+        self.queues[stage].put(item)
+        self.metrics[from_stage].blocked_seconds += time.perf_counter() - start_time
+
+    def _get_next_stage(self, stage):
+        return self.STAGES[self.STAGES.index(stage) + 1]
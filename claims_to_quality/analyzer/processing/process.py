@@ -8,18 +8,23 @@ For a TIN, NPI, start_date, end_date, measures, the processor will:
     - log the results
 - submit the results
 """
+import collections
 import sys
 import traceback
 
 from claims_to_quality.analyzer import measure_mapping
-from claims_to_quality.analyzer.datasource import claim_reader
-from claims_to_quality.analyzer.processing import claim_filtering, performance_period_handling
+from claims_to_quality.analyzer.calculation import ct_scan_measure
+from claims_to_quality.analyzer.datasource import claim_reader, code_reader, lookup_cache
+from claims_to_quality.analyzer.models.measures import measure_code
+from claims_to_quality.analyzer.processing import (
+    claim_filtering, measure_dispatch, performance_period_handling, sharding)
 from claims_to_quality.analyzer.submission import qpp_measurement_set
+from claims_to_quality.config import config
 from claims_to_quality.lib import newrelic_application
 from claims_to_quality.lib.connectors import teradata_connector
 from claims_to_quality.lib.qpp_logging import logging_config
 from claims_to_quality.lib.sqs_methods import message_handling
-from claims_to_quality.lib.teradata_methods import teradata_errors
+from claims_to_quality.lib.teradata_methods import measures_to_sql, teradata_errors
 
 import newrelic.agent
 
@@ -38,7 +43,10 @@ class Processor(object):
             start_date,
             end_date,
             measures,
-            infer_performance_period):
+            infer_performance_period,
+            columnar_batches=False,
+            stream_batches=False,
+            shard_large_providers=False):
         """
         Initialize Processor.
 
@@ -48,6 +56,16 @@ class Processor(object):
         :type end_date: date
         :param measures: Measures to calcuate
         :type measures: list
+        :param columnar_batches: Hold each batch as a columnar ClaimBatch between reading and
+            processing instead of a dictionary of claim lists
+        :type columnar_batches: bool
+        :param stream_batches: Process each provider as soon as its claims have been read,
+            instead of reading the whole batch first. The Measure 46, 407 and CT scan lookups
+            are then made for each provider instead of once per batch
+        :type stream_batches: bool
+        :param shard_large_providers: Calculate the measures of providers with many claims over
+            beneficiary shards in a process pool (see sharding.py)
+        :type shard_large_providers: bool
         """
         self.start_date = start_date
         self.end_date = end_date
@@ -56,8 +74,37 @@ class Processor(object):
         self.measure_definitions = [
             calculator.measure_definition for calculator in self.measure_calculators.values()
         ]
+        self.measure_dispatch_index = measure_dispatch.MeasureDispatchIndex(
+            self.measure_calculators)
+        self.lookup_cache = lookup_cache.get_lookup_cache()
+        # Measures 415 and 416 share the CT scans queried for each batch.
+        self.ct_scan_calculators = [
+            calculator for calculator in self.measure_calculators.values()
+            if isinstance(calculator, ct_scan_measure.CTScanMeasure)
+        ]
         self.infer_performance_period = infer_performance_period
-        self.claim_reader = claim_reader.ClaimsDataReader()
+        self.columnar_batches = columnar_batches
+        self.stream_batches = stream_batches
+        self.sharded_executor = None
+        if shard_large_providers:
+            self.sharded_executor = sharding.BeneficiaryShardedExecutor(
+                self.measure_calculators,
+                min_claims=config.get('sharding.min_claims'),
+                num_processes=config.get('sharding.num_processes')
+            )
+        # Restrict attention to the claims with measure-relevant procedure codes, and to the
+        # providers with quality codes on these claims, before claim objects are built.
+        # The procedure codes can also be pushed down to the batch query, so that irrelevant
+        # claims are not transferred at all.
+        procedure_code_condition = None
+        if config.get('claim_reader.procedure_code_pushdown'):
+            procedure_code_condition = measures_to_sql.get_relevant_claim_lines_condition(
+                self.measure_definitions)
+        self.claim_reader = claim_reader.ClaimsDataReader(
+            procedure_codes=claim_filtering.get_measure_procedure_codes(self.measure_definitions),
+            quality_codes=claim_filtering.get_quality_codes(),
+            procedure_code_condition=procedure_code_condition
+        )
         self.session = teradata_connector.teradata_connection()
         self.count = 0
         self.count_no_claims = 0
@@ -68,15 +115,81 @@ class Processor(object):
         logger.debug('Starting processing for batch.')
         decoded_messages = message_handling.decode_messages(messages)
         logger.info('Processing batch of {batch_size} providers.'.format(batch_size=len(messages)))
+        if self.stream_batches:
+            return self._process_streamed_batch(decoded_messages)
+
         batch_claims_data = self._safe_get_batch(decoded_messages)
+        return self._process_providers(batch_claims_data, decoded_messages)
+
+    def _process_streamed_batch(self, decoded_messages):
+        """
+        Process each provider of a batch as soon as its claims have been read from the IDR.
+
+        The batch lookups of Measure 46 discharge dates, Measure 407 MSSA episodes and CT scans
+        need the claims of all the providers they cover, so in this mode they are made provider
+        by provider, with one query each per provider not covered by the lookup caches.
+        If the stream fails, the remaining providers are loaded as a regular batch.
+        """
+        if not decoded_messages:
+            return []
+
+        pending_providers = collections.OrderedDict()
+        for provider in decoded_messages:
+            identifier = (provider.get('tin'), provider.get('npi'))
+            pending_providers.setdefault(identifier, []).append(provider)
+
+        processed_providers = []
+        tin_list, npi_list = message_handling.get_tin_npi_list(decoded_messages)
+        logger.info(
+            'Stream batch of {batch_size} providers.'.format(batch_size=len(decoded_messages))
+        )
+        try:
+            for identifier, claims in self.claim_reader.stream_batch_from_db(
+                    provider_tin_list=tin_list,
+                    provider_npi_list=npi_list,
+                    start_date=self.start_date,
+                    end_date=self.end_date,
+                    session=self.session):
+                processed_providers.extend(self._process_providers(
+                    {identifier: claims}, pending_providers.pop(identifier, [])
+                ))
+        except teradata_errors.TeradataError:
+            self.session = teradata_connector.teradata_connection()
+            remaining_providers = [
+                provider for providers in pending_providers.values() for provider in providers
+            ]
+            if not remaining_providers:
+                return processed_providers
+
+            logger.warning('Streaming failed, loading the {} remaining providers.'.format(
+                len(remaining_providers)))
+            tin_list, npi_list = message_handling.get_tin_npi_list(remaining_providers)
+            batch_claims_data = self._get_batch(tin_list=tin_list, npi_list=npi_list)
+            return processed_providers + self._process_providers(
+                batch_claims_data, remaining_providers)
+
+        # The remaining providers do not have any claim lines in the IDR.
+        remaining_providers = [
+            provider for providers in pending_providers.values() for provider in providers
+        ]
+        return processed_providers + self._process_providers({}, remaining_providers)
+
+    def _process_providers(self, batch_claims_data, providers):
+        if not providers:
+            return []
 
         if '046' in self.measures:
             self.measure_calculators['046'].get_batch_discharge_dates(batch_claims_data)
+        if '407' in self.measures:
+            self.measure_calculators['407'].get_batch_mssa_date_ranges(batch_claims_data)
+        ct_scan_measure.get_batch_ct_scan_dates(self.ct_scan_calculators, batch_claims_data)
 
-        return [
-            self._safe_process_provider(batch_claims_data, provider)
-            for provider in decoded_messages
+        processed_providers = [
+            self._safe_process_provider(batch_claims_data, provider) for provider in providers
         ]
+        if self.lookup_cache is not None:
+            self.lookup_cache.log_metrics()
+        return processed_providers
 
     @newrelic.agent.background_task(
         newrelic_application.get(),
@@ -188,13 +301,21 @@ class Processor(object):
         """
         logger.debug('Calculating measures - {}'.format(self.measures))
         measures_added = 0
+        measure_code.reset_match_cache_stats()
+        # Restrict each measure to the claims which may match its eligibility options.
+        candidate_claims = self.measure_dispatch_index.get_candidate_claims(claims_data)
+        sharded_results = self._calculate_sharded_measures(claims_data, candidate_claims)
         for measure_number in self.measures:
             logger.debug('Calculating measure - {}'.format(measure_number))
 
-            measure_calculator, results = self._calculate_measure(
-                claims_data=claims_data,
-                measure_number=measure_number
-            )
+            if measure_number in sharded_results:
+                measure_calculator = self.measure_calculators[measure_number]
+                results = sharded_results[measure_number]
+            else:
+                measure_calculator, results = self._calculate_measure(
+                    claims_data=candidate_claims.get(measure_number, []),
+                    measure_number=measure_number
+                )
 
             if measure_calculator.has_multiple_strata:
                 measure_added = measurement_set.add_measure_with_multiple_strata(
@@ -212,9 +333,28 @@ class Processor(object):
         logger.info('{} measure{} recorded for this provider.'.format(
             measures_added,
             '' if measures_added == 1 else 's'))
+        logger.debug('Measure code line match cache hit rate: {:.1%}.'.format(
+            measure_code.get_match_cache_hit_rate()))
 
         return measurement_set
 
+    @newrelic.agent.function_trace(name='calculate-sharded-measures', group='Task')
+    def _calculate_sharded_measures(self, claims_data, candidate_claims):
+        """
+        Calculate the shardable measures of a provider with many claims over beneficiary shards.
+
+        Returns a dictionary of measure number --> results, empty if the provider is not sharded.
+        """
+        if self.sharded_executor is None or not self.sharded_executor.should_shard(claims_data):
+            return {}
+
+        logger.info('Sharding the calculation of {} claims by beneficiary.'.format(
+            len(claims_data)))
+        return self.sharded_executor.execute({
+            measure_number: candidate_claims.get(measure_number, [])
+            for measure_number in self.measures
+        })
+
     @newrelic.agent.function_trace(name='calculate-measure', group='Task')
     def _calculate_measure(self, claims_data, measure_number):
         """
@@ -230,7 +370,17 @@ class Processor(object):
 
     # TODO - Move data handling functions to their own file or to claim_reader.py.
     def _get_batch(self, tin_list, npi_list):
-        batch_claims_data = self.claim_reader.load_batch_from_db(
+        if self.columnar_batches:
+            return self.claim_reader.load_claim_batch_from_db(
+                provider_tin_list=tin_list,
+                provider_npi_list=npi_list,
+                start_date=self.start_date,
+                end_date=self.end_date,
+                session=self.session,
+                code_vocabulary=code_reader.get_code_vocabulary()
+            )
+
+        return self.claim_reader.load_batch_from_db(
             provider_tin_list=tin_list,
             provider_npi_list=npi_list,
             start_date=self.start_date,
@@ -238,14 +388,6 @@ class Processor(object):
             session=self.session
         )
 
-        # Restrict attention to the claims with measure-relevant procedure codes.
-        return {
-            identifier: claim_filtering.filter_claims_by_measure_procedure_codes(
-                claims_data=claims, measure_definitions=self.measure_definitions
-            )
-            for identifier, claims in batch_claims_data.items()
-        }
-
     @newrelic.agent.background_task(
         newrelic_application.get(),
         name='get-safe-batch',
@@ -0,0 +1,83 @@
+"""
+Delayed retries of failed submissions.
+
+Retries are kept in a heap ordered by due time. A background thread hands each retry to the
+Submitter's thread pool once it is due, so that a measurement set waiting to be resubmitted
+does not hold up the other providers of its batch, or the following batches.
+"""
+import heapq
+import itertools
+import threading
+import time
+
+
+class DelayedRetryQueue(object):
+    """Run functions on an executor after a delay."""
+
+    def __init__(self, executor, clock=time.monotonic):
+        """
+        Initialize a DelayedRetryQueue.
+
+        :param executor: concurrent.futures executor running the due functions
+        :param clock: Function returning the current time in seconds
+        """
+        self._executor = executor
+        self._clock = clock
+        self._heap = []
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self._closed = False
+        self._thread = None
+
+    def __len__(self):
+        """Return the number of retries which are not due yet."""
+        with self._condition:
+            return len(self._heap)
+
+    def schedule(self, delay, function, *args):
+        """
+        Run function(*args) on the executor in `delay` seconds.
+
+        Returns False, without scheduling the retry, if the queue is closed.
+        """
+        with self._condition:
+            if self._closed:
+                return False
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name='delayed-retries', daemon=True)
+                self._thread.start()
+            heapq.heappush(
+                self._heap, (self._clock() + delay, next(self._sequence), function, args))
+            self._condition.notify()
+        return True
+
+    def close(self):
+        """
+        Stop running retries.
+
+        Returns the number of discarded retries which were not due yet.
+        """
+        with self._condition:
+            self._closed = True
+            discarded = len(self._heap)
+            self._heap = []
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join()
+        return discarded
+
+    def _run(self):
+        with self._condition:
+            while not self._closed:
+                if not self._heap:
+                    self._condition.wait()
+                    continue
+
+                wait_seconds = self._heap[0][0] - self._clock()
+                if wait_seconds > 0:
+                    self._condition.wait(wait_seconds)
+                    continue
+
+                _, _, function, args = heapq.heappop(self._heap)
+                self._executor.submit(function, *args)
@@ -0,0 +1,140 @@
+"""
+Calculate the measures of very large providers across a pool of processes.
+
+Almost all measures group claims by beneficiary before scoring them, so that the results of a
+provider are the sum of the results of disjoint sets of beneficiaries. For providers with many
+claims, the claims of each shardable measure are partitioned by a hash of the beneficiary ID,
+each shard is calculated in a separate process and the counts of the shards are added up.
+
+Measures which are not shardable by beneficiary (see `QPPMeasure.shardable_by_beneficiary`)
+are calculated in the calling process.
+"""
+import collections
+import multiprocessing
+import zlib
+
+from claims_to_quality.lib.qpp_logging import logging_config
+
+logger = logging_config.get_logger(__name__)
+
+# Measure calculators of the sharded executor which forked the pool, inherited by its processes.
+_measure_calculators = None
+
+
+class BeneficiaryShardedExecutor(object):
+    """Calculate shardable measures over claims partitioned by beneficiary."""
+
+    def __init__(self, measure_calculators, min_claims, num_processes):
+        """
+        Initialize a BeneficiaryShardedExecutor.
+
+        The process pool is forked by `start`, so that the processes inherit the measure
+        calculators and their code IDs. Forking a process which runs threads can leave locks held
+        in the pool processes, so `start` should be called before any thread is started.
+        Otherwise, the pool is forked the first time a provider is sharded.
+
+        :param measure_calculators: Dictionary of measure number --> measure calculator
+        :type measure_calculators: dict
+        :param min_claims: Minimum number of claims of a provider for its measures to be sharded
+        :type min_claims: int
+        :param num_processes: Number of processes, and of shards
+        :type num_processes: int
+        """
+        self.measure_calculators = measure_calculators
+        self.min_claims = min_claims
+        self.num_processes = num_processes
+        self.shardable_measures = {
+            measure_number for measure_number, calculator in measure_calculators.items()
+            if calculator.shardable_by_beneficiary
+        }
+        self._pool = None
+
+    def should_shard(self, claims):
+        """Return True if the provider's claims are numerous enough to be sharded."""
+        return self.num_processes > 1 and len(claims) >= self.min_claims
+
+    def execute(self, claims_by_measure):
+        """
+        Calculate the shardable measures of a provider.
+
+        Args:
+            claims_by_measure (dict): Dictionary of measure number --> claims to calculate the
+                measure on. Measures which are not shardable are ignored.
+        Returns:
+            Dictionary of measure number --> results, as returned by the measure's execute method.
+        """
+        shards = [collections.defaultdict(list) for _ in range(self.num_processes)]
+        measure_numbers = sorted(self.shardable_measures.intersection(claims_by_measure))
+        for measure_number in measure_numbers:
+            for claim in claims_by_measure[measure_number]:
+                shards[get_shard(claim.bene_sk, self.num_processes)][measure_number].append(claim)
+
+        # Each shard calculates every measure, so that measures without claims in a shard
+        # still return results with the expected structure.
+        shard_tasks = [
+            {measure_number: shard[measure_number] for measure_number in measure_numbers}
+            for shard in shards
+        ]
+        logger.debug('Calculating {} measures over {} beneficiary shards.'.format(
+            len(measure_numbers), self.num_processes))
+        shard_results = self._get_pool().map(_execute_shard, shard_tasks)
+
+        return {
+            measure_number: merge_results([results[measure_number] for results in shard_results])
+            for measure_number in measure_numbers
+        }
+
+    def start(self):
+        """Fork the process pool, if not already forked."""
+        global _measure_calculators
+        if self._pool is None:
+            _measure_calculators = self.measure_calculators
+            self._pool = multiprocessing.get_context('fork').Pool(self.num_processes)
+
+    def close(self):
+        """Stop the process pool."""
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
+
+    def _get_pool(self):
+        self.start()
+        return self._pool
+
+
+def get_shard(bene_sk, num_shards):
+    """Return the shard of a beneficiary, consistently across processes and runs."""
+    return zlib.crc32(str(bene_sk).encode('utf-8')) % num_shards
+
+
+def merge_results(shard_results):
+    """
+    Add up the measure results of the shards of a provider.
+
+    Results are either a dictionary of counts, or a list of {'name', 'results'} dictionaries for
+    measures with multiple strata, which are merged stratum by stratum.
+    """
+    if isinstance(shard_results[0], dict):
+        total = collections.Counter()
+        for results in shard_results:
+            total.update(results)
+        return {key: total[key] for key in shard_results[0]}
+
+    results_by_stratum = collections.OrderedDict(
+        (stratum['name'], []) for stratum in shard_results[0])
+    for results in shard_results:
+        for stratum in results:
+            results_by_stratum[stratum['name']].append(stratum['results'])
+    return [
+        {'name': name, 'results': merge_results(stratum_results)}
+        for name, stratum_results in results_by_stratum.items()
+    ]
+
+
+def _execute_shard(claims_by_measure):
+    """Calculate the measures of a shard in a pool process."""
+    return {
+        measure_number: _measure_calculators[measure_number].execute(claims)
+        for measure_number, claims in claims_by_measure.items()
+    }
@@ -3,10 +3,32 @@ Methods to submit results after processing of TIN/NPI.
 
 - submit the results
 - delete SQS message if processed.
+
+The providers of a batch are submitted concurrently by a pool of threads, with at most
+`max_in_flight` submissions in flight. The SQS messages of the providers submitted successfully
+are deleted in groups of up to 10 messages (one DeleteMessageBatch request per group), at the
+latest once the batch has been submitted.
+
+With a `heartbeat` (see visibility_heartbeat.py), the visibility timeout of the messages keeps
+being extended until they are deleted, or until their provider has failed for good.
+
+Measurement sets which fail with a retryable error (e.g. rate limiting) are resubmitted later,
+with exponential backoff, without blocking the rest of the batch. Their SQS messages are
+deleted once they have been submitted successfully.
+
+With `skip_unchanged_submissions`, measurement sets identical to the last one successfully
+submitted for the provider (see submission_ledger.py) are not submitted again. The ledger entry
+of a provider is forgotten when its measurement set is not found by a PUT or PATCH.
 """
-from claims_to_quality.analyzer.submission import api_submitter
+import concurrent.futures
+import threading
+
+from claims_to_quality.analyzer.processing import retry_queue
+from claims_to_quality.analyzer.submission import api_submitter, submission_ledger
+from claims_to_quality.config import config
 from claims_to_quality.lib import newrelic_application
 from claims_to_quality.lib.qpp_logging import logging_config
+from claims_to_quality.lib.sqs_methods import message_handling
 
 import newrelic.agent
 
@@ -26,7 +48,10 @@ class Submitter(object):
             self,
             remove_messages,
             send_submissions,
-            patch_update=False):
+            patch_update=False,
+            max_in_flight=None,
+            skip_unchanged_submissions=False,
+            heartbeat=None):
         """
         Initialize Submitter.
 
@@ -34,10 +59,31 @@ class Submitter(object):
         :type remove_messages: bool
         :param send_submissions: Activate sending submissions to the Submission API.
         :type send_submissions: bool
+        :param max_in_flight: Maximum number of providers submitted concurrently (default: config)
+        :type max_in_flight: int
+        :param skip_unchanged_submissions: Do not resubmit measurement sets identical to the last
+            one submitted for the provider
+        :type skip_unchanged_submissions: bool
+        :param heartbeat: VisibilityHeartbeat extending the visibility timeout of the messages,
+            which are untracked once processed
         """
         self.remove_messages = remove_messages
         self.send_submissions = send_submissions
         self.patch_update = patch_update
+        self.max_in_flight = max_in_flight or config.get('submission.max_in_flight')
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.max_in_flight)
+        self._retries = retry_queue.DelayedRetryQueue(self._executor)
+        self.retry_max_attempts = config.get('submission.retry.max_attempts')
+        self.retry_initial_delay = config.get('submission.retry.initial_delay_seconds')
+        self.retry_max_delay = config.get('submission.retry.max_delay_seconds')
+        self.ledger = None
+        if skip_unchanged_submissions:
+            self.ledger = submission_ledger.SubmissionLedger(config.get('submission.ledger_path'))
+        self.count_skipped = 0
+        self._count_lock = threading.Lock()
+        self.heartbeat = heartbeat
+        self._pending_deletes = []
+        self._delete_lock = threading.Lock()
 
     @newrelic.agent.background_task(
         newrelic_application.get(),
@@ -55,27 +101,115 @@ class Submitter(object):
             - processing_error
             - measurement_set (if available)
         """
-        for provider in providers:
-            # If there is a processing error, do not submit and do not delete the SQS message.
-            if provider['processing_error']:
-                continue
+        if self.send_submissions:
+            api_submitter.prefetch_measurement_set_ids([
+                provider['measurement_set'] for provider in providers
+                if not provider['processing_error'] and provider.get('measurement_set') and
+                not provider['measurement_set'].is_empty() and
+                not self._is_unchanged(provider['measurement_set'])
+            ])
 
-            measurement_set = provider.get('measurement_set', None)
-            provider_tin = provider.get('tin')
-            provider_npi = provider.get('npi')
+        # If there is a processing error, do not submit and do not delete the SQS message.
+        self._untrack([provider for provider in providers if provider['processing_error']])
+        submissions = [
+            (provider, self._executor.submit(
+                self._send_submissions,
+                provider.get('tin'),
+                provider.get('npi'),
+                provider.get('measurement_set', None)
+            ))
+            for provider in providers if not provider['processing_error']
+        ]
 
+        # Unexpected errors are raised once the results of all providers have been handled.
+        unexpected_error = None
+        for provider, submission in submissions:
             try:
-                self._send_submissions(provider_tin, provider_npi, measurement_set)
-            except requests.exceptions.HTTPError as e:
+                submission.result()
+            except requests.exceptions.RequestException as error:
                 # If there is a submission error, do not delete the SQS message from the queue.
-                logger.warning(str(e) + 'NPI: {}'.format(provider_npi))
-                logger.info('1 providers errored out.')
+                if (
+                    isinstance(error, requests.exceptions.HTTPError) or
+                    api_submitter.is_retryable_error(error)
+                ):
+                    self._handle_submission_error(provider, error, attempt=1)
+                    continue
+                logger.error('Error submitting NPI: {} - {}'.format(provider.get('npi'), error))
+                self._untrack([provider])
+                unexpected_error = unexpected_error or error
                 continue
 
             # If processing and submission were successful and `remove_messages` is True,
             # remove the SQS messages and log the removal.
             self._process_after_submission(provider)
 
+        self.flush_deletes()
+        if unexpected_error is not None:
+            raise unexpected_error
+
+    def flush_deletes(self):
+        """Delete the SQS messages of the providers submitted successfully."""
+        with self._delete_lock:
+            pending_deletes, self._pending_deletes = self._pending_deletes, []
+        if not pending_deletes:
+            return
+
+        messages = [provider['message'] for provider in pending_deletes]
+        failed_messages = message_handling.delete_messages(messages)
+        # Messages which could not be deleted are read again once their visibility times out.
+        self._untrack(pending_deletes)
+        logger.info('Deleted {} messages from SQS for providers NPI: {}'.format(
+            len(messages) - len(failed_messages),
+            ', '.join(str(provider.get('npi', None)) for provider in pending_deletes
+                      if provider['message'] not in failed_messages)
+        ))
+
+    def close(self):
+        """
+        Wait for the submissions in flight and close the pooled HTTP connections.
+
+        Retries which are not due yet are discarded. Their SQS messages are left on the queue,
+        so that they will be read again.
+        """
+        discarded_retries = self._retries.close()
+        if discarded_retries:
+            logger.warning('Discarded {} pending submission retries.'.format(discarded_retries))
+        self._executor.shutdown(wait=True)
+        self.flush_deletes()
+        api_submitter.close_session()
+        if self.ledger is not None:
+            self.ledger.close()
+
+    def _handle_submission_error(self, provider, error, attempt):
+        """Schedule a retry of the provider's submission if the error is retryable."""
+        provider_npi = provider.get('npi')
+        if api_submitter.is_retryable_error(error) and attempt < self.retry_max_attempts:
+            delay = min(self.retry_max_delay, self.retry_initial_delay * 2 ** (attempt - 1))
+            if self._retries.schedule(delay, self._retry_submission, provider, attempt + 1):
+                logger.warning('{} NPI: {}. Retrying in {} seconds.'.format(
+                    error, provider_npi, delay))
+                return
+
+        logger.warning(str(error) + 'NPI: {}'.format(provider_npi))
+        logger.info('1 providers errored out.')
+        self._untrack([provider])
+
+    def _retry_submission(self, provider, attempt):
+        """Resubmit a provider from the thread pool, deleting its message on success."""
+        try:
+            self._send_submissions(
+                provider.get('tin'), provider.get('npi'), provider.get('measurement_set', None))
+        except requests.exceptions.RequestException as error:
+            self._handle_submission_error(provider, error, attempt)
+            return
+        except Exception as error:
+            logger.error('Error resubmitting NPI: {} - {}'.format(provider.get('npi'), error))
+            self._untrack([provider])
+            return
+
+        self._process_after_submission(provider)
+        self.flush_deletes()
+
     @newrelic.agent.function_trace(name='send-submissions-if-not-empty', group='Task')
     def _send_submissions(self, tin, npi, measurement_set):
         if not measurement_set:
@@ -93,14 +227,74 @@ class Submitter(object):
             return
 
         if self.send_submissions:
+            if self._is_unchanged(measurement_set):
+                logger.info(
+                    'Unchanged measurement set. Not resubmitting for provider NPI: {}'.format(npi))
+                with self._count_lock:
+                    self.count_skipped += 1
+                return
+
             logger.info('Submitting results for provider NPI: {}'.format(npi))
-            api_submitter.submit_to_measurement_sets_api(
-                measurement_set, patch_update=self.patch_update
-            )
+            try:
+                api_submitter.submit_to_measurement_sets_api(
+                    measurement_set,
+                    patch_update=self.patch_update,
+                    previous_measurements=self._get_previous_measurements(measurement_set)
+                )
+            except requests.exceptions.HTTPError as error:
+                # The measurement set last submitted was deleted, so the ledger entry is stale.
+                if self.ledger is not None and _is_not_found_error(error):
+                    self.ledger.forget(*self._get_ledger_key(measurement_set))
+                raise
             logger.info('Submitted results successfully for provider NPI: {}'.format(npi))
+            if self.ledger is not None:
+                self.ledger.record(
+                    *self._get_ledger_key(measurement_set),
+                    content_hash=measurement_set.get_content_hash(),
+                    measurements=measurement_set.data['measurements']
+                )
+
+    def _is_unchanged(self, measurement_set):
+        """Return True if the measurement set was already submitted for the provider."""
+        if self.ledger is None:
+            return False
+        return (
+            self.ledger.get_hash(*self._get_ledger_key(measurement_set)) ==
+            measurement_set.get_content_hash()
+        )
+
+    def _get_previous_measurements(self, measurement_set):
+        """Return the measurements last submitted for the provider, when patching."""
+        if not self.patch_update or self.ledger is None:
+            return None
+        return self.ledger.get_measurements(*self._get_ledger_key(measurement_set))
+
+    @staticmethod
+    def _get_ledger_key(measurement_set):
+        submission = measurement_set.data['submission']
+        return (
+            submission['taxpayerIdentificationNumber'],
+            submission['nationalProviderIdentifier'],
+            submission['performanceYear'],
+        )
 
     def _process_after_submission(self, provider):
-        if self.remove_messages:
-            provider_npi = provider.get('npi', None)
-            provider['message'].delete()
-            logger.info('Deleted message from SQS for provider NPI: {}'.format(provider_npi))
+        if not self.remove_messages:
+            self._untrack([provider])
+            return
+
+        with self._delete_lock:
+            self._pending_deletes.append(provider)
+            is_full = len(self._pending_deletes) >= message_handling.BOTO_MAX_SEND_LIMIT
+        if is_full:
+            self.flush_deletes()
+
+    def _untrack(self, providers):
+        """Stop extending the visibility timeout of the providers' messages."""
+        if self.heartbeat is not None and providers:
+            self.heartbeat.untrack([provider['message'] for provider in providers])
+
+
+def _is_not_found_error(error):
+    """Return True if the request failed because the measurement set does not exist."""
+    return error.response is not None and error.response.status_code == 404
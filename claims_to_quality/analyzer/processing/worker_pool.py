@@ -0,0 +1,219 @@
+"""
+Supervisor forking worker processes which each read, process and submit batches of providers.
+
+Measure calculation is bound by the GIL, so a single process uses a single core. Each worker
+process owns its own QueueReader, Processor (and therefore its own Teradata session) and
+Submitter, and reads batches from the shared SQS queue until it is asked to stop. SQS hands each
+message to a single worker at a time, so workers do not need to coordinate which providers they
+process.
+
+The supervisor loads the measure registry and code vocabulary before forking, so that all
+workers share the same code IDs. On SIGTERM or SIGINT, it asks the workers to finish their
+current batch and stop, then waits for them to exit. The processed, no-claims and errored
+provider counts of all workers are aggregated in shared counters.
+"""
+import multiprocessing
+import signal
+import sys
+import time
+
+from claims_to_quality.analyzer.datasource import code_reader, measure_registry
+from claims_to_quality.analyzer.processing import process, submit
+from claims_to_quality.analyzer.queue_reader import queue_reader
+from claims_to_quality.config import config
+from claims_to_quality.lib.connectors import teradata_session_pool
+from claims_to_quality.lib.qpp_logging import logging_config
+from claims_to_quality.lib.sqs_methods import visibility_heartbeat
+
+logger = logging_config.get_logger(__name__)
+
+# Processor attributes aggregated across workers.
+COUNTERS = ('count', 'count_no_claims', 'count_errors')
+
+JOIN_POLL_SECONDS = 1
+
+
+class WorkerPool(object):
+    """Fork worker processes and coordinate their shutdown."""
+
+    def __init__(
+            self,
+            queue_name,
+            batch_size,
+            processor_kwargs,
+            submitter_kwargs,
+            num_workers=None,
+            pull_batch_size=10,
+            shutdown_timeout=None):
+        """
+        Initialize a WorkerPool.
+
+        :param queue_name: SQS queue name
+        :type queue_name: str
+        :param batch_size: Number of providers processed together by a worker
+        :type batch_size: int
+        :param processor_kwargs: Arguments used by each worker to create its Processor
+        :type processor_kwargs: dict
+        :param submitter_kwargs: Arguments used by each worker to create its Submitter
+        :type submitter_kwargs: dict
+        :param num_workers: Number of worker processes (default: config)
+        :type num_workers: int
+        :param pull_batch_size: Max number of messages to pull from SQS at once
+        :type pull_batch_size: int
+        :param shutdown_timeout: Seconds to wait for workers to stop before terminating them
+        :type shutdown_timeout: float
+        """
+        self.queue_name = queue_name
+        self.batch_size = batch_size
+        self.processor_kwargs = processor_kwargs
+        self.submitter_kwargs = submitter_kwargs
+        self.num_workers = num_workers or config.get('worker_pool.num_workers')
+        self.pull_batch_size = pull_batch_size
+        self.shutdown_timeout = shutdown_timeout or config.get(
+            'worker_pool.shutdown_timeout_seconds')
+
+        self._context = multiprocessing.get_context('fork')
+        self.stop_event = self._context.Event()
+        self.counters = {name: self._context.Value('l', 0) for name in COUNTERS}
+        self.workers = []
+
+    def run(self):
+        """Start the workers and wait for them to exit, stopping them on SIGTERM or SIGINT."""
+        # Load shared data before forking, so that the workers inherit it.
+        measure_registry.load_registry()
+        code_reader.get_code_vocabulary()
+
+        previous_handlers = {
+            signum: signal.signal(signum, self._handle_signal)
+            for signum in (signal.SIGTERM, signal.SIGINT)
+        }
+        try:
+            self.start()
+            self.join()
+        finally:
+            for signum, handler in previous_handlers.items():
+                signal.signal(signum, handler)
+
+        logger.info(
+            'Worker pool stopped. {count} providers processed, {count_no_claims} with no claims '
+            'and {count_errors} errored out.'.format(**self.get_counts()))
+
+    def start(self):
+        """Fork the worker processes."""
+        logger.info('Starting {} worker processes.'.format(self.num_workers))
+        for worker_index in range(self.num_workers):
+            worker = self._context.Process(
+                target=_start_worker,
+                name='c2q-worker-{}'.format(worker_index),
+                args=(self._get_worker_settings(), self.stop_event, self.counters),
+            )
+            worker.start()
+            self.workers.append(worker)
+
+    def stop(self):
+        """Ask the workers to stop after their current batch."""
+        if not self.stop_event.is_set():
+            logger.info('Stopping worker processes after their current batch.')
+        self.stop_event.set()
+
+    def join(self):
+        """
+        Wait for all workers to exit.
+
+        Once the pool is stopping, workers which have not exited within the shutdown timeout are
+        terminated. Their unfinished SQS messages are not deleted and will be read again.
+        """
+        deadline = None
+        while True:
+            alive_workers = [worker for worker in self.workers if worker.is_alive()]
+            if not alive_workers:
+                break
+
+            if self.stop_event.is_set():
+                deadline = deadline or time.monotonic() + self.shutdown_timeout
+                if time.monotonic() >= deadline:
+                    for worker in alive_workers:
+                        logger.warning('Terminating worker {} after {} seconds.'.format(
+                            worker.name, self.shutdown_timeout))
+                        worker.terminate()
+                        worker.join()
+                    break
+
+            alive_workers[0].join(timeout=JOIN_POLL_SECONDS)
+
+        for worker in self.workers:
+            if worker.exitcode:
+                logger.error('Worker {} exited with code {}.'.format(
+                    worker.name, worker.exitcode))
+
+    def get_counts(self):
+        """Return the provider counts aggregated across all workers."""
+        return {name: counter.value for name, counter in self.counters.items()}
+
+    def _handle_signal(self, signum, frame):
+        self.stop()
+
+    def _get_worker_settings(self):
+        return {
+            'queue_name': self.queue_name,
+            'pull_batch_size': self.pull_batch_size,
+            'batch_size': self.batch_size,
+            'processor_kwargs': self.processor_kwargs,
+            'submitter_kwargs': self.submitter_kwargs,
+        }
+
+
+def run_worker(settings, stop_event, counters):
+    """
+    Read, process and submit batches until the stop event is set.
+
+    The Processor, and its Teradata session, are created in the worker process, since sessions
+    cannot be shared across processes.
+
+    The sharding process pool is forked before the reader, heartbeat and submitter start their
+    threads, so that the pool processes do not inherit locks held by these threads.
+    """
+    processor = process.Processor(**settings['processor_kwargs'])
+    if processor.sharded_executor is not None:
+        processor.sharded_executor.start()
+    heartbeat = visibility_heartbeat.get_heartbeat()
+    reader = queue_reader.PrefetchingQueueReader(
+        queue_name=settings['queue_name'],
+        pull_batch_size=settings['pull_batch_size'],
+        heartbeat=heartbeat)
+    submitter = submit.Submitter(heartbeat=heartbeat, **settings['submitter_kwargs'])
+
+    try:
+        for messages in reader.read_batch(settings['batch_size'], stop_event=stop_event):
+            counts_before = {name: getattr(processor, name) for name in COUNTERS}
+            providers = processor.process_batch_messages(messages)
+            submitter.submit_batch(providers)
+            _add_counts(counters, {
+                name: getattr(processor, name) - counts_before[name] for name in COUNTERS
+            })
+    finally:
+        submitter.close()
+        heartbeat.stop()
+        processor.session.close()
+        teradata_session_pool.close_pool()
+        if processor.sharded_executor is not None:
+            processor.sharded_executor.close()
+
+
+def _start_worker(settings, stop_event, counters):
+    def handle_sigterm(signum, frame):
+        # A SIGTERM sent once the pool is stopping terminates the worker immediately.
+        if stop_event.is_set():
+            sys.exit(1)
+        stop_event.set()
+
+    # The supervisor handles interrupts and sets the stop event.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, handle_sigterm)
+    run_worker(settings, stop_event, counters)
+
+
+def _add_counts(counters, counts):
+    for name, count in counts.items():
+        with counters[name].get_lock():
+            counters[name].value += count
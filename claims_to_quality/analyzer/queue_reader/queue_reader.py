@@ -2,9 +2,17 @@
 Method to read and process the tin/npi queue.
 
 This will start a measure caclulation / submission process for each message.
+
+The PrefetchingQueueReader keeps several long polls in flight in background threads, so that
+batches are filled without waiting for each receive call in turn. Partial batches are yielded
+once their first messages have waited `max_latency_seconds`, instead of after an empty poll.
 """
+import collections
+import threading
+import time
 from datetime import datetime
 
+from claims_to_quality.config import config
 from claims_to_quality.lib import newrelic_application
 from claims_to_quality.lib.connectors import sqs_connector
 from claims_to_quality.lib.qpp_logging import logging_config
@@ -21,7 +29,8 @@ class QueueReader(object):
     def __init__(
             self,
             queue_name,
-            pull_batch_size):
+            pull_batch_size,
+            heartbeat=None):
         """Initiating a QueueReader.
 
         :param queue_name: SQS queue name
@@ -29,9 +38,12 @@ class QueueReader(object):
         :param pull_batch_size: Max number of messages to pull at once
         :type pull_batch_size: int
         # Note: pull_batch_size needs to be < 10.
+        :param heartbeat: VisibilityHeartbeat extending the visibility timeout of the messages
+            pulled, until they are untracked by the Submitter
         """
         self._queue = sqs_connector.get_queue(queue_name=queue_name)
         self._pull_batch_size = pull_batch_size
+        self._heartbeat = heartbeat
 
         logger.debug('Initiated queue reader {queue} at {time}'.format(
             queue=self._queue, time=datetime.now()))
@@ -42,6 +54,8 @@ class QueueReader(object):
         messages = message_handling.get_messages(
             self._queue, pull_batch_size=self._pull_batch_size)
         logger.debug('Fetched {} messages to process.'.format(len(messages)))
+        if self._heartbeat is not None and messages:
+            self._heartbeat.track(messages)
         return messages
 
     @newrelic.agent.background_task(newrelic_application.get(), name='read-queue', group='Task')
@@ -58,11 +72,16 @@ class QueueReader(object):
 
     @newrelic.agent.background_task(
         newrelic_application.get(), name='read-queue-batch', group='Task')
-    def read_batch(self, batch_size):
-        """Start reading the SQS queue."""
+    def read_batch(self, batch_size, stop_event=None):
+        """
+        Start reading the SQS queue.
+
+        If a stop_event is given, reading stops once it is set, after yielding the messages
+        already pulled from the queue.
+        """
         logger.debug('Start reading in batches...')
         batch = []
-        while True:
+        while stop_event is None or not stop_event.is_set():
             messages = self._pull_next_batch()
             for message in messages:
                 if len(batch) < batch_size:
@@ -76,3 +95,188 @@ class QueueReader(object):
                 yield batch
                 logger.debug('Passed {} messages batch from queue.'.format(len(batch)))
                 batch = []
+
+        if batch:
+            yield batch
+            logger.debug('Passed {} messages batch from queue.'.format(len(batch)))
+
+
+class PrefetchingQueueReader(QueueReader):
+    """Read SQS queue with concurrent long polls and yield batches of messages."""
+
+    # Maximum number of seconds between two checks of the stop event.
+    STOP_POLL_SECONDS = 1
+
+    def __init__(
+            self,
+            queue_name,
+            pull_batch_size,
+            heartbeat=None,
+            num_pollers=None,
+            wait_time_seconds=None,
+            max_latency_seconds=None):
+        """Initiating a PrefetchingQueueReader.
+
+        :param queue_name: SQS queue name
+        :type queue_name: str
+        :param pull_batch_size: Max number of messages to pull at once
+        :type pull_batch_size: int
+        :param heartbeat: VisibilityHeartbeat extending the visibility timeout of the messages
+            pulled, until they are untracked by the Submitter
+        :param num_pollers: Number of receive calls in flight (default: config)
+        :type num_pollers: int
+        :param wait_time_seconds: Long polling duration of each receive call (default: config)
+        :type wait_time_seconds: int
+        :param max_latency_seconds: Maximum number of seconds a partial batch waits for more
+            messages (default: config)
+        :type max_latency_seconds: float
+        """
+        super(PrefetchingQueueReader, self).__init__(queue_name, pull_batch_size, heartbeat)
+        self._queue_name = queue_name
+        self.num_pollers = num_pollers or config.get('queue_reader.num_pollers')
+        self.wait_time_seconds = wait_time_seconds or config.get('queue_reader.wait_time_seconds')
+        self.max_latency_seconds = max_latency_seconds or config.get(
+            'queue_reader.max_batch_latency_seconds')
+
+        self.count_batches = 0
+        self.count_messages = 0
+        # Time spent waiting for messages to fill the batches.
+        self.queue_wait_seconds = 0.0
+
+        self._buffer = collections.deque()
+        self._buffer_condition = threading.Condition()
+        self._stop_polling = threading.Event()
+        self._pollers = []
+
+    def get_metrics(self):
+        """Return the number of batches and messages yielded, and the time spent waiting."""
+        return {
+            'batches': self.count_batches,
+            'messages': self.count_messages,
+            'queue_wait_seconds': self.queue_wait_seconds,
+        }
+
+    @newrelic.agent.background_task(
+        newrelic_application.get(), name='read-queue-batch', group='Task')
+    def read_batch(self, batch_size, stop_event=None):
+        """
+        Start reading the SQS queue.
+
+        If a stop_event is given, reading stops once it is set, after yielding the messages
+        already pulled from the queue.
+        """
+        logger.debug('Start reading in batches with {} pollers...'.format(self.num_pollers))
+        self._start_pollers(batch_size)
+        try:
+            while stop_event is None or not stop_event.is_set():
+                batch = self._next_batch(batch_size, stop_event)
+                if batch:
+                    yield batch
+                    logger.debug('Passed {} messages batch from queue.'.format(len(batch)))
+
+            # Wait for the receive calls in flight, then pass on the messages they pulled.
+            self._stop_pollers()
+            while self._buffer:
+                batch = self._pop_batch(batch_size)
+                yield batch
+                logger.debug('Passed {} messages batch from queue.'.format(len(batch)))
+        finally:
+            self._stop_pollers()
+            if self._buffer:
+                # Make the messages which were not passed on visible again right away, instead
+                # of once their (extended) visibility timeout expires.
+                leftover_messages = list(self._buffer)
+                message_handling.change_messages_visibility(leftover_messages, 0)
+                if self._heartbeat is not None:
+                    self._heartbeat.untrack(leftover_messages)
+            self._buffer.clear()
+
+    def _next_batch(self, batch_size, stop_event):
+        """
+        Wait for a full batch, or for `max_latency_seconds` once the batch has messages.
+
+        Returns the messages available when the stop event is set, if any.
+        """
+        start_time = time.perf_counter()
+        deadline = None
+        with self._buffer_condition:
+            while len(self._buffer) < batch_size:
+                if stop_event is not None and stop_event.is_set():
+                    break
+                wait_seconds = self.STOP_POLL_SECONDS
+                if self._buffer:
+                    if deadline is None:
+                        deadline = time.perf_counter() + self.max_latency_seconds
+                    wait_seconds = min(wait_seconds, deadline - time.perf_counter())
+                    if wait_seconds <= 0:
+                        break
+                self._buffer_condition.wait(wait_seconds)
+
+            batch = self._pop_batch(batch_size)
+
+        wait_seconds = time.perf_counter() - start_time
+        if batch:
+            self.count_batches += 1
+            self.count_messages += len(batch)
+            self.queue_wait_seconds += wait_seconds
+            newrelic.agent.record_custom_metric(
+                'Custom/QueueReader/QueueWaitSeconds', wait_seconds,
+                application=newrelic_application.get())
+        return batch
+
+    def _pop_batch(self, batch_size):
+        """Remove up to `batch_size` messages from the buffer, and let the pollers refill it."""
+        with self._buffer_condition:
+            batch = [self._buffer.popleft() for _ in range(min(batch_size, len(self._buffer)))]
+            self._buffer_condition.notify_all()
+        return batch
+
+    def _start_pollers(self, batch_size):
+        self._stop_polling.clear()
+        self._pollers = [
+            threading.Thread(
+                target=self._poll,
+                args=(batch_size,),
+                name='queue-poller-{}'.format(index),
+                daemon=True)
+            for index in range(self.num_pollers)
+        ]
+        for poller in self._pollers:
+            poller.start()
+
+    def _stop_pollers(self):
+        self._stop_polling.set()
+        with self._buffer_condition:
+            self._buffer_condition.notify_all()
+        for poller in self._pollers:
+            poller.join()
+        self._pollers = []
+
+    def _poll(self, batch_size):
+        """Pull messages into the buffer, keeping at most about one batch ahead."""
+        # boto3 resources are not thread-safe, so each poller uses its own queue.
+        sqs_queue = sqs_connector.get_queue(queue_name=self._queue_name)
+        while True:
+            with self._buffer_condition:
+                while len(self._buffer) >= batch_size and not self._stop_polling.is_set():
+                    self._buffer_condition.wait()
+            if self._stop_polling.is_set():
+                return
+
+            try:
+                messages = message_handling.get_messages(
+                    sqs_queue,
+                    pull_batch_size=self._pull_batch_size,
+                    wait_time_seconds=self.wait_time_seconds)
+            except Exception as error:
+                logger.warning('Error pulling messages from SQS: {}'.format(error))
+                self._stop_polling.wait(self.STOP_POLL_SECONDS)
+                continue
+
+            if not messages:
+                continue
+            if self._heartbeat is not None:
+                self._heartbeat.track(messages)
+            with self._buffer_condition:
+                self._buffer.extend(messages)
+                self._buffer_condition.notify_all()
@@ -1,6 +1,23 @@
-"""Methods to submit a MeasurementSet object to Nava's API."""
+"""
+Methods to submit a MeasurementSet object to Nava's API.
+
+All requests go through a shared requests.Session, so that connections to the API are kept
+alive and reused across providers instead of paying a new TCP and TLS handshake per request.
+The session is safe to use from the threads of a concurrent Submitter.
+
+Requests are paced by the shared adaptive rate limiter (see rate_limiter.py), which slows down
+when the API responds with a rate-limiting or overload status code.
+
+The IDs of existing measurement sets can be prefetched for a whole batch of providers with
+`prefetch_measurement_set_ids`, which saves a submissions query per provider.
+"""
+import collections
+import threading
 import urllib.parse
 
+from claims_to_quality.analyzer.submission import (
+    measurement_set_cache, rate_limiter, submission_ledger
+)
 from claims_to_quality.config import config
 from claims_to_quality.lib.qpp_logging import logging_config
 
@@ -27,6 +44,34 @@ STATUS_CODES_TO_RETRY_ON = {
 }
 
 
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    """Return the shared HTTP session, creating its connection pool on first use."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            pool_size = config.get('submission.max_in_flight')
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(
+                pool_connections=pool_size, pool_maxsize=pool_size)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+            _session = session
+        return _session
+
+
+def close_session():
+    """Close the pooled connections of the shared HTTP session."""
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+            _session = None
+
+
 class NoMatchingMeasurementSetsException(Exception):
     """Indicates that no C2Q measurement sets can be found within a QPP submission."""
 
@@ -43,12 +88,30 @@ def _retry_on_fixable_request_errors(exception):
     """
     return (
         isinstance(exception, requests.exceptions.HTTPError) and
+        exception.response is not None and
         exception.response.status_code in STATUS_CODES_TO_RETRY_ON
     ) or (
         isinstance(exception, requests.exceptions.ConnectTimeout)
     )
 
 
+def _send_request(method, *args, **kwargs):
+    """Send a request with the shared session once allowed by the rate limiter."""
+    limiter = rate_limiter.get_rate_limiter()
+    limiter.acquire()
+    response = getattr(get_session(), method)(*args, **kwargs)
+    if response.status_code in STATUS_CODES_TO_RETRY_ON:
+        limiter.on_throttled()
+    else:
+        limiter.on_success()
+    return response
+
+
+def is_retryable_error(exception):
+    """Return True for submission errors which may succeed when retried later."""
+    return _retry_on_fixable_request_errors(exception)
+
+
 def _handle_http_error(response, message):
     """Handler for http errors."""
     http_error = False
@@ -72,32 +135,65 @@ def _handle_http_error(response, message):
 
 
 @newrelic.agent.function_trace(name='submit-to-measurement-sets-api', group='Task')
-@retry(stop_max_attempt_number=STOP_MAX_ATTEMPT_NUMBER, wait_fixed=WAIT_FIXED_MILLISECONDS)
-def submit_to_measurement_sets_api(measurement_set, patch_update):
+def submit_to_measurement_sets_api(measurement_set, patch_update, previous_measurements=None):
     """
     Send the submission object to the appropriate API endpoint.
 
-    Retry using exponential backoff.
+    When patching, only the measurements which differ from the previous measurements are sent.
+    Previous measurements default to those of the existing measurement set, if the submissions
+    API returns them. Returns None if no measurement changed.
+
+    Errors are not retried here: the Submitter reschedules the measurement sets which failed
+    with a retryable error (see `is_retryable_error`) without blocking other submissions.
     """
-    return _submit_to_measurement_sets_api(measurement_set, patch_update=patch_update)
+    return _submit_to_measurement_sets_api(
+        measurement_set, patch_update=patch_update, previous_measurements=previous_measurements)
 
 
-def _submit_to_measurement_sets_api(measurement_set, patch_update):
+def _submit_to_measurement_sets_api(measurement_set, patch_update, previous_measurements=None):
     """Send the submission object to the appropriate API endpoint."""
     # TODO: Add a separate method to validate submission without sending it.
+    submission = measurement_set.data['submission']
+    provider_key = (
+        submission['taxpayerIdentificationNumber'],
+        submission['nationalProviderIdentifier'],
+        submission['performanceYear'],
+    )
+    cache = measurement_set_cache.get_cache()
+    measurement_set_id = cache.get(*provider_key)
     # Attempt to find existing measurement sets if any exist.
-    try:
-        matching_submission = get_existing_submissions(measurement_set)
-        measurement_set_id = get_measurement_set_id_from_submission(matching_submission)
-    except(NoMatchingSubmissionsException, NoMatchingMeasurementSetsException):
+    if measurement_set_id is measurement_set_cache.MISSING:
+        try:
+            matching_submission = get_existing_submissions(measurement_set)
+            existing_measurement_set = get_measurement_set_from_submission(matching_submission)
+        except(NoMatchingSubmissionsException, NoMatchingMeasurementSetsException):
+            measurement_set_id = None
+        else:
+            measurement_set_id = existing_measurement_set['id']
+            if previous_measurements is None:
+                previous_measurements = existing_measurement_set.get('measurements')
+
+    if measurement_set_id is None:
         # If no measurement sets exist, we can safely POST.
         response = _post_to_measurement_sets_api(measurement_set)
-    else:
+    elif patch_update and previous_measurements is not None:
+        # Only PATCH the measurements which changed since the previous submission.
+        changed_measurements = measurement_set.get_changed_measurements(previous_measurements)
+        if not changed_measurements:
+            logger.info('No measurement changed. Not patching measurement set {}.'.format(
+                measurement_set_id))
+            return None
+        response = _patch_to_measurement_sets_api(
+            measurement_set, measurement_set_id, measurements=changed_measurements)
+    elif patch_update:
         # If a measurement set does exist, we use the existing id to PUT or PATCH.
-        if patch_update:
-            response = _patch_to_measurement_sets_api(measurement_set, measurement_set_id)
-        else:
-            response = _put_to_measurement_sets_api(measurement_set, measurement_set_id)
+        response = _patch_to_measurement_sets_api(measurement_set, measurement_set_id)
+    else:
+        response = _put_to_measurement_sets_api(measurement_set, measurement_set_id)
+
+    # A new measurement set was created, or the cached ID may be stale.
+    if measurement_set_id is None or response.status_code >= 400:
+        cache.invalidate(*provider_key)
 
     _handle_http_error(response, message='submit_to_measurement_sets_api')
 
@@ -116,6 +212,13 @@ def get_submissions(npi=None, tin=None, performance_year=None, start_index=0):
 
     FIXME: Move this into a different file, this is not part of the api submitter.
     """
+    return _get_submissions(
+        npi=npi, tin=tin, performance_year=performance_year, start_index=start_index)
+
+
+def _get_submissions(
+        npi=None, tin=None, performance_year=None, start_index=0, items_per_page=None):
+    """Make a GET request for a page of submissions, without retrying."""
     logger.debug('Making a simple GET request to verify submissions.')
 
     endpoint_url = urllib.parse.urljoin(
@@ -127,6 +230,9 @@ def get_submissions(npi=None, tin=None, performance_year=None, start_index=0):
         'startIndex': start_index,
     }
 
+    if items_per_page:
+        params['itemsPerPage'] = items_per_page
+
     if npi:
         params['nationalProviderIdentifier'] = npi
     headers = get_headers()
@@ -137,12 +243,100 @@ def get_submissions(npi=None, tin=None, performance_year=None, start_index=0):
     if performance_year:
         params['performanceYear'] = str(performance_year)
 
-    response = requests.get(endpoint_url, params=params, headers=headers)
+    response = _send_request('get', endpoint_url, params=params, headers=headers)
     # If the request failed, raise an error.
     _handle_http_error(response, 'get_submissions')
     return response.json()
 
 
+def _get_all_submissions(tin, performance_year, max_pages=None):
+    """
+    Return the submissions of a TIN for a performance year, page by page.
+
+    Stops after `max_pages` pages, or as soon as the total number of submissions shows that more
+    pages would be needed. Returns (submissions, True if all the submissions were returned).
+    """
+    items_per_page = config.get('submission.measurement_set_cache.items_per_page')
+    submissions = []
+    num_pages = 0
+    while True:
+        data = _get_submissions(
+            tin=tin,
+            performance_year=performance_year,
+            start_index=len(submissions),
+            items_per_page=items_per_page
+        )['data']
+        num_pages += 1
+        page = data['submissions']
+        submissions.extend(page)
+        total_items = data.get('totalItems')
+        if (
+            len(page) < items_per_page or
+            (total_items is not None and len(submissions) >= total_items)
+        ):
+            return submissions, True
+
+        if max_pages is not None:
+            num_pages_needed = num_pages
+            if total_items is not None:
+                num_pages_needed = -(-total_items // items_per_page)
+            if num_pages >= max_pages or num_pages_needed > max_pages:
+                return submissions, False
+
+
+@newrelic.agent.function_trace(name='prefetch-measurement-set-ids', group='Task')
+def prefetch_measurement_set_ids(measurement_sets):
+    """
+    Cache the IDs of the existing claims measurement sets of the given measurement sets' providers.
+
+    Submissions are queried once per TIN and performance year, for all the NPIs of the TIN,
+    unless all of them are already cached. Providers without a claims measurement set are cached
+    as such, so that their measurement sets are POSTed without querying the API again. If a
+    query fails, the IDs of its providers are looked up when they are submitted.
+
+    Paging through the submissions of a TIN only pays off when the batch has enough of its NPIs:
+    TINs with fewer than `min_npis_per_tin` uncached NPIs are not prefetched, and paging stops
+    once it would take more requests than looking up each NPI. The providers not found then are
+    looked up when they are submitted.
+    """
+    cache = measurement_set_cache.get_cache()
+    npis_by_tin_and_year = collections.defaultdict(set)
+    for measurement_set in measurement_sets:
+        submission = measurement_set.data['submission']
+        tin = submission['taxpayerIdentificationNumber']
+        npi = submission['nationalProviderIdentifier']
+        performance_year = submission['performanceYear']
+        if cache.get(tin, npi, performance_year) is measurement_set_cache.MISSING:
+            npis_by_tin_and_year[(tin, performance_year)].add(npi)
+
+    min_npis_per_tin = config.get('submission.measurement_set_cache.min_npis_per_tin')
+    for (tin, performance_year), npis in npis_by_tin_and_year.items():
+        if len(npis) < min_npis_per_tin:
+            continue
+        try:
+            submissions, complete = _get_all_submissions(
+                tin=tin, performance_year=performance_year, max_pages=len(npis))
+        except requests.exceptions.RequestException as error:
+            logger.warning('Could not prefetch measurement set IDs - {}'.format(error))
+            continue
+
+        measurement_set_ids = {}
+        for submission in submissions:
+            npi = submission.get('nationalProviderIdentifier')
+            # As in get_existing_submissions, only the first submission of a provider is used.
+            if npi is None or npi in measurement_set_ids:
+                continue
+            try:
+                measurement_set_ids[npi] = get_measurement_set_id_from_submission(submission)
+            except NoMatchingMeasurementSetsException:
+                measurement_set_ids[npi] = None
+
+        # Providers missing from partial results may be on the pages which were not fetched.
+        cached_npis = npis.union(measurement_set_ids) if complete else measurement_set_ids
+        for npi in cached_npis:
+            cache.set(tin, npi, performance_year, measurement_set_ids.get(npi))
+
+
 @newrelic.agent.function_trace(name='get-existing-submissions', group='Task')
 def get_existing_submissions(measurement_set):
     """
@@ -171,7 +365,7 @@ def get_existing_submissions(measurement_set):
     )
 
     # Look for matching submissions.
-    response = requests.get(endpoint_url, params=params, headers=headers)
+    response = _send_request('get', endpoint_url, params=params, headers=headers)
     # If the request failed, raise an error.
     _handle_http_error(response, 'get_existing_submissions')
     existing_submissions = response.json()['data']['submissions']
@@ -185,6 +379,11 @@ def get_existing_submissions(measurement_set):
 
 def get_measurement_set_id_from_submission(submission):
     """Return the C2Q measurement_set ID from a given JSON submission."""
+    return get_measurement_set_from_submission(submission)['id']
+
+
+def get_measurement_set_from_submission(submission):
+    """Return the C2Q measurement_set from a given JSON submission."""
     measurement_sets = [
         measurement_set for measurement_set in submission['measurementSets']
         if (
@@ -194,20 +393,22 @@ def get_measurement_set_id_from_submission(submission):
     ]
 
     if measurement_sets:
-        return measurement_sets[0]['id']
+        return measurement_sets[0]
     else:
         raise NoMatchingMeasurementSetsException
 
 
-def _patch_to_measurement_sets_api(measurement_set, existing_measurement_set_id):
+def _patch_to_measurement_sets_api(
+        measurement_set, existing_measurement_set_id, measurements=None):
     logger.debug('Making PATCH request to the measurement-sets API.')
 
     endpoint_url = urllib.parse.urljoin(config.get('submission.endpoint'), 'measurement-sets/')
     url = urllib.parse.urljoin(endpoint_url, str(existing_measurement_set_id))
 
-    return requests.patch(
+    return _send_request(
+        'patch',
         url=url,
-        data=measurement_set.to_json(),
+        data=measurement_set.to_json(measurements=measurements),
         headers=get_headers(),
     )
 
@@ -218,15 +419,21 @@ def _put_to_measurement_sets_api(measurement_set, existing_measurement_set_id):
     endpoint_url = urllib.parse.urljoin(config.get('submission.endpoint'), 'measurement-sets/')
     url = urllib.parse.urljoin(endpoint_url, str(existing_measurement_set_id))
 
-    return requests.put(
+    return _send_request(
+        'put',
         url=url,
         data=measurement_set.to_json(),
         headers=get_headers(),
     )
 
 
-def delete_measurement_set_api(measurement_set_id):
-    """Delete a measuremet set by id."""
+def delete_measurement_set_api(measurement_set_id, tin, npi, performance_year):
+    """
+    Delete a measuremet set by id.
+
+    The provider's cached measurement set ID and submission ledger entry are forgotten, so that
+    its next measurement set is submitted even if it has not changed.
+    """
     logger.warning('DELETING measurement {} set using the measurement-sets API.'.format(
         measurement_set_id)
     )
@@ -236,11 +443,15 @@ def delete_measurement_set_api(measurement_set_id):
     )
     url = urllib.parse.urljoin(endpoint_url, str(measurement_set_id))
 
-    response = requests.delete(
+    response = _send_request(
+        'delete',
         url=url,
         headers=get_headers()
     )
 
+    measurement_set_cache.get_cache().invalidate(tin, npi, performance_year)
+    submission_ledger.forget_submission(tin, npi, performance_year)
+
     _handle_http_error(response, 'delete_measurement_set')
 
 
@@ -249,7 +460,8 @@ def _post_to_measurement_sets_api(measurement_set):
 
     endpoint_url = urllib.parse.urljoin(config.get('submission.endpoint'), 'measurement-sets/')
 
-    return requests.post(
+    return _send_request(
+        'post',
         url=endpoint_url,
         data=measurement_set.to_json(),
         headers=get_headers()
@@ -277,7 +489,8 @@ def get_scoring_preview(measurement_set):
         config.get('submission.endpoint'),
         'submissions/score-preview'
     )
-    response = requests.post(
+    response = _send_request(
+        'post',
         url=endpoint_url,
         data=measurement_set.prepare_for_scoring(),
         headers=get_headers()
@@ -0,0 +1,88 @@
+"""
+Local cache of the IDs of existing claims measurement sets.
+
+Submitting a measurement set requires the ID of the provider's existing claims measurement set,
+if any, to PUT or PATCH it instead of POSTing a new one. The IDs of all the providers of a batch
+are prefetched with a few paginated submissions queries per TIN (see
+api_submitter.prefetch_measurement_set_ids), and kept here for `ttl_seconds`.
+
+The cache also records the providers known not to have a claims measurement set, so that
+their submissions can be POSTed without querying the API first.
+"""
+import threading
+import time
+
+from claims_to_quality.config import config
+
+# Returned by `get` when the cache has no entry for a provider.
+MISSING = object()
+
+
+class MeasurementSetIdCache(object):
+    """Thread-safe (tin, npi, performance year) --> measurement set ID cache with a TTL."""
+
+    def __init__(self, ttl_seconds, clock=time.monotonic):
+        """
+        Initialize a MeasurementSetIdCache.
+
+        :param ttl_seconds: Number of seconds an entry is used for
+        :type ttl_seconds: float
+        :param clock: Function returning the current time in seconds
+        """
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        """Return the number of entries, including expired ones."""
+        with self._lock:
+            return len(self._entries)
+
+    def get(self, tin, npi, performance_year):
+        """
+        Return the cached measurement set ID of a provider.
+
+        Returns None if the provider is known not to have a claims measurement set, and MISSING
+        if the cache has no valid entry for the provider.
+        """
+        key = (tin, npi, int(performance_year))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return MISSING
+            measurement_set_id, expiry = entry
+            if expiry <= self._clock():
+                del self._entries[key]
+                return MISSING
+            return measurement_set_id
+
+    def set(self, tin, npi, performance_year, measurement_set_id):
+        """Cache the measurement set ID of a provider, or None if they do not have one."""
+        with self._lock:
+            self._entries[(tin, npi, int(performance_year))] = (
+                measurement_set_id, self._clock() + self.ttl_seconds)
+
+    def invalidate(self, tin, npi, performance_year):
+        """Forget the measurement set ID of a provider."""
+        with self._lock:
+            self._entries.pop((tin, npi, int(performance_year)), None)
+
+    def clear(self):
+        """Forget all measurement set IDs."""
+        with self._lock:
+            self._entries = {}
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """Return the measurement set ID cache shared by the submitters of this process."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = MeasurementSetIdCache(
+                ttl_seconds=config.get('submission.measurement_set_cache.ttl_seconds'))
+        return _cache
@@ -1,5 +1,6 @@
 """Methods for submitting to the qpp-measurement-sets API."""
 import datetime
+import hashlib
 import json
 import re
 
@@ -223,9 +224,58 @@ class MeasurementSet(object):
 
         return True
 
-    def to_json(self, indent=None):
-        """Return a JSON string representation of the measurement set object."""
-        return json.dumps(self.data, indent=indent, default=self.date_handler)
+    def to_json(self, indent=None, measurements=None):
+        """
+        Return a JSON string representation of the measurement set object.
+
+        If measurements are given, they replace the measurement set's measurements, e.g. to
+        PATCH only the measurements which changed.
+        """
+        data = self.data if measurements is None else dict(self.data, measurements=measurements)
+        return json.dumps(data, indent=indent, default=self.date_handler)
+
+    def get_content_hash(self):
+        """
+        Return a SHA-256 hash of the measurement set's content.
+
+        Measurements are sorted by measure ID and strata by name, and dates are serialized as
+        YYYY-mm-dd, so that equal measurement sets have the same hash whatever the order in which
+        their measures were added.
+        """
+        measurements = sorted(
+            (_canonicalize_measurement(measurement) for measurement in self.data['measurements']),
+            key=lambda measurement: measurement['measureId']
+        )
+        canonical_json = json.dumps(
+            dict(self.data, measurements=measurements),
+            sort_keys=True,
+            separators=(',', ':'),
+            default=self.date_handler
+        )
+        return hashlib.sha256(canonical_json.encode('utf-8')).hexdigest()
+
+    def get_changed_measurements(self, previous_measurements):
+        """
+        Return the measurements which differ from, or are missing in, the previous measurements.
+
+        Previous measurements may come from the submissions API, so only the fields of the
+        measurement set's own measurements are compared.
+        """
+        previous_by_measure_id = {
+            measurement.get('measureId'): _canonicalize_measurement(measurement)
+            for measurement in previous_measurements
+        }
+        changed_measurements = []
+        for measurement in self.data['measurements']:
+            canonical_measurement = _canonicalize_measurement(measurement)
+            previous_measurement = previous_by_measure_id.get(measurement['measureId'])
+            if (
+                previous_measurement is None or
+                _restrict_to_shape(previous_measurement, canonical_measurement) !=
+                canonical_measurement
+            ):
+                changed_measurements.append(measurement)
+        return changed_measurements
 
     def prepare_for_scoring(self, indent=None):
         """Prepare MeasurementSets for scoring preview."""
@@ -242,3 +292,22 @@ class MeasurementSet(object):
             }]
         }
         return json.dumps(data, indent=indent, default=self.date_handler)
+
+
+def _canonicalize_measurement(measurement):
+    """Return a copy of a measurement with its strata sorted by name."""
+    value = measurement.get('value') or {}
+    if not value.get('strata'):
+        return measurement
+    strata = sorted(value['strata'], key=lambda stratum: stratum.get('stratum') or '')
+    return dict(measurement, value=dict(value, strata=strata))
+
+
+def _restrict_to_shape(value, template):
+    """Drop the dictionary keys of value which do not appear in template, recursively."""
+    if isinstance(value, dict) and isinstance(template, dict):
+        return {key: _restrict_to_shape(value.get(key), template[key]) for key in template}
+    if isinstance(value, list) and isinstance(template, list) and len(value) == len(template):
+        return [_restrict_to_shape(item, item_template) for item, item_template in zip(
+            value, template)]
+    return value
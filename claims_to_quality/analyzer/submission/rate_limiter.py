@@ -0,0 +1,127 @@
+"""
+Client-side rate limiting of the requests made to the submissions API.
+
+Requests take a token from a token bucket refilled at the current rate. The rate adapts to the
+API's responses (additive increase, multiplicative decrease): each successful response raises it
+by about `additive_increase` requests per second every second, and each rate-limiting or
+overload response (see api_submitter.STATUS_CODES_TO_RETRY_ON) divides it, at most once per
+`decrease_interval` seconds so that the responses of concurrent requests only count once.
+
+A single limiter is shared by all the submitters of a process.
+"""
+import threading
+import time
+
+from claims_to_quality.config import config
+from claims_to_quality.lib.qpp_logging import logging_config
+
+logger = logging_config.get_logger(__name__)
+
+
+class AdaptiveRateLimiter(object):
+    """Thread-safe token bucket whose rate is adjusted with AIMD."""
+
+    def __init__(
+            self,
+            initial_rate,
+            min_rate,
+            max_rate,
+            additive_increase=1.0,
+            decrease_factor=0.5,
+            decrease_interval=1.0,
+            burst=1,
+            clock=time.monotonic):
+        """
+        Initialize an AdaptiveRateLimiter.
+
+        :param initial_rate: Initial number of requests per second
+        :type initial_rate: float
+        :param min_rate: Lowest rate the limiter slows down to
+        :type min_rate: float
+        :param max_rate: Highest rate the limiter speeds up to
+        :type max_rate: float
+        :param additive_increase: Rate increase per second of successful responses
+        :type additive_increase: float
+        :param decrease_factor: Factor applied to the rate on rate-limiting responses
+        :type decrease_factor: float
+        :param decrease_interval: Minimum number of seconds between two rate decreases
+        :type decrease_interval: float
+        :param burst: Maximum number of tokens held by the bucket
+        :type burst: int
+        """
+        self.rate = float(initial_rate)
+        self.min_rate = float(min_rate)
+        self.max_rate = float(max_rate)
+        self.additive_increase = additive_increase
+        self.decrease_factor = decrease_factor
+        self.decrease_interval = decrease_interval
+        self.burst = burst
+        self._clock = clock
+        self._tokens = float(burst)
+        self._last_refill = clock()
+        self._last_decrease = None
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a request can be made."""
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait_seconds = (1 - self._tokens) / self.rate
+            time.sleep(wait_seconds)
+
+    def on_success(self):
+        """Increase the rate after a successful response."""
+        with self._lock:
+            self._refill()
+            # Divide by the rate so that the rate increases linearly with time, not requests.
+            self.rate = min(self.max_rate, self.rate + self.additive_increase / self.rate)
+
+    def on_throttled(self):
+        """Decrease the rate after a rate-limiting or overload response."""
+        with self._lock:
+            now = self._clock()
+            if (
+                self._last_decrease is not None and
+                now - self._last_decrease < self.decrease_interval
+            ):
+                return
+            self._refill()
+            self._last_decrease = now
+            self.rate = max(self.min_rate, self.rate * self.decrease_factor)
+            logger.info('Submissions API rate decreased to {:.2f} requests per second.'.format(
+                self.rate))
+
+    def _refill(self):
+        now = self._clock()
+        self._tokens = min(self.burst, self._tokens + (now - self._last_refill) * self.rate)
+        self._last_refill = now
+
+
+_rate_limiter = None
+_rate_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter():
+    """Return the rate limiter shared by the submitters of this process."""
+    global _rate_limiter
+    with _rate_limiter_lock:
+        if _rate_limiter is None:
+            _rate_limiter = AdaptiveRateLimiter(
+                initial_rate=config.get('submission.rate_limit.initial_rate'),
+                min_rate=config.get('submission.rate_limit.min_rate'),
+                max_rate=config.get('submission.rate_limit.max_rate'),
+                additive_increase=config.get('submission.rate_limit.additive_increase'),
+                decrease_factor=config.get('submission.rate_limit.decrease_factor'),
+            )
+        return _rate_limiter
+
+
+def reset_rate_limiter():
+    """Forget the shared rate limiter, so that it is recreated from the configuration."""
+    global _rate_limiter
+    with _rate_limiter_lock:
+        _rate_limiter = None
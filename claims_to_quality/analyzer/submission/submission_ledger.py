@@ -0,0 +1,138 @@
+"""
+Durable record of the measurement sets successfully submitted for each provider.
+
+The ledger stores the content hash (see MeasurementSet.get_content_hash) and the measurements of
+the last measurement set submitted for each (TIN, NPI, performance year) in a local SQLite
+database, so that reruns and SQS redeliveries can skip submitting measurement sets which have not
+changed, and PATCH updates can be restricted to the measurements which changed.
+
+The database is opened lazily, so that each worker process opens its own connection. Connections
+can be shared by the threads of a Submitter.
+
+Entries are forgotten when the provider's measurement set is deleted or found to be missing from
+the API, so that the provider is submitted again even if its results have not changed.
+"""
+import datetime
+import json
+import os
+import sqlite3
+import threading
+
+from claims_to_quality.config import config
+from claims_to_quality.lib.qpp_logging import logging_config
+
+logger = logging_config.get_logger(__name__)
+
+_CREATE_TABLE = """
+CREATE TABLE IF NOT EXISTS submissions (
+    tin TEXT NOT NULL,
+    npi TEXT NOT NULL,
+    performance_year INTEGER NOT NULL,
+    content_hash TEXT NOT NULL,
+    submitted_at TEXT NOT NULL,
+    measurements TEXT,
+    PRIMARY KEY (tin, npi, performance_year)
+)
+"""
+
+
+class SubmissionLedger(object):
+    """SQLite ledger of the measurement set last submitted for each provider."""
+
+    def __init__(self, path, timeout=30):
+        """
+        Initialize a SubmissionLedger.
+
+        :param path: Path of the SQLite database, created if needed
+        :type path: str
+        :param timeout: Seconds to wait for a lock held by another process
+        :type timeout: float
+        """
+        self.path = path
+        self.timeout = timeout
+        self._connection = None
+        self._lock = threading.Lock()
+
+    def get_hash(self, tin, npi, performance_year):
+        """Return the hash of the last measurement set submitted for a provider, or None."""
+        with self._lock:
+            row = self._get_connection().execute(
+                'SELECT content_hash FROM submissions '
+                'WHERE tin = ? AND npi = ? AND performance_year = ?',
+                (tin, npi, int(performance_year))
+            ).fetchone()
+        return row[0] if row else None
+
+    def get_measurements(self, tin, npi, performance_year):
+        """Return the measurements last submitted for a provider, or None."""
+        with self._lock:
+            row = self._get_connection().execute(
+                'SELECT measurements FROM submissions '
+                'WHERE tin = ? AND npi = ? AND performance_year = ?',
+                (tin, npi, int(performance_year))
+            ).fetchone()
+        return json.loads(row[0]) if row and row[0] else None
+
+    def record(self, tin, npi, performance_year, content_hash, measurements=None):
+        """Record a measurement set successfully submitted for a provider."""
+        with self._lock:
+            connection = self._get_connection()
+            with connection:
+                connection.execute(
+                    'INSERT OR REPLACE INTO submissions '
+                    '(tin, npi, performance_year, content_hash, submitted_at, measurements) '
+                    'VALUES (?, ?, ?, ?, ?, ?)',
+                    (tin, npi, int(performance_year), content_hash,
+                     datetime.datetime.utcnow().isoformat(),
+                     json.dumps(measurements) if measurements is not None else None)
+                )
+
+    def forget(self, tin, npi, performance_year):
+        """Forget the measurement set submitted for a provider, e.g. after it was deleted."""
+        with self._lock:
+            connection = self._get_connection()
+            with connection:
+                connection.execute(
+                    'DELETE FROM submissions WHERE tin = ? AND npi = ? AND performance_year = ?',
+                    (tin, npi, int(performance_year))
+                )
+
+    def close(self):
+        """Close the database connection."""
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+    def _get_connection(self):
+        if self._connection is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._connection = sqlite3.connect(
+                self.path, timeout=self.timeout, check_same_thread=False)
+            # Let the worker processes read while another one writes.
+            self._connection.execute('PRAGMA journal_mode=WAL')
+            with self._connection:
+                self._connection.execute(_CREATE_TABLE)
+                columns = {
+                    row[1] for row in self._connection.execute('PRAGMA table_info(submissions)')
+                }
+                # Ledgers created before measurements were recorded.
+                if 'measurements' not in columns:
+                    self._connection.execute(
+                        'ALTER TABLE submissions ADD COLUMN measurements TEXT')
+            logger.debug('Opened submission ledger {}.'.format(self.path))
+        return self._connection
+
+
+def forget_submission(tin, npi, performance_year, path=None):
+    """Forget a provider's submission in the ledger at the configured path, if there is one."""
+    path = path or config.get('submission.ledger_path')
+    if not os.path.exists(path):
+        return
+    ledger = SubmissionLedger(path)
+    try:
+        ledger.forget(tin, npi, performance_year)
+    finally:
+        ledger.close()
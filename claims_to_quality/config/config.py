@@ -185,6 +185,34 @@ CONFIG = {
     'hide_sensitive_information': True,
     'environment': _get_env_variable('ENV', default='TEST').upper(),
     'providers_batch_size': 50,
+    'worker_pool': {
+        'num_workers': int(_get_env_variable('NUM_WORKERS', default='1')),
+        'shutdown_timeout_seconds': 600
+    },
+    'queue_reader': {
+        # Number of SQS receive calls kept in flight by each worker.
+        'num_pollers': int(_get_env_variable('SQS_NUM_POLLERS', default='4')),
+        'wait_time_seconds': 20,
+        # Partial batches are processed once their first message has waited this long.
+        'max_batch_latency_seconds': 5
+    },
+    'idr_lookup_cache': {
+        # Cache of the discharge date, CT scan and MSSA lookups across batches.
+        'enabled': False,
+        'max_bytes': int(_get_env_variable(
+            'IDR_LOOKUP_CACHE_MAX_BYTES', default=str(256 * 1024 * 1024))),
+        # Optional SQLite database backing the cache.
+        'path': _get_env_variable('IDR_LOOKUP_CACHE_PATH', default=None)
+    },
+    'claim_reader': {
+        # Only query the split claims with a procedure code of the measures being calculated.
+        'procedure_code_pushdown': False
+    },
+    'sharding': {
+        # Providers with at least this many claims are sharded by beneficiary.
+        'min_claims': int(_get_env_variable('SHARD_MIN_CLAIMS', default='50000')),
+        'num_processes': int(_get_env_variable('NUM_SHARD_PROCESSES', default='4'))
+    },
     'logging': {
         'log_level': _get_env_variable('LOGLEVEL', default='CRITICAL'),
         'team': 'Bayes',
@@ -213,7 +241,32 @@ CONFIG = {
         'patch_update': False,
         'write_submissions_to_file': False,
         'api_token': _get_env_variable('SUBMISSION_API_TOKEN', default='access_token'),
-        'cookie': _get_env_variable('SUBMISSION_COOKIE', default=None)
+        'cookie': _get_env_variable('SUBMISSION_COOKIE', default=None),
+        # Maximum number of providers submitted concurrently, and of pooled connections.
+        'max_in_flight': int(_get_env_variable('SUBMISSION_MAX_IN_FLIGHT', default='8')),
+        # Client-side rate limit of the requests to the submissions API, in requests per second.
+        'rate_limit': {
+            'initial_rate': 5.0,
+            'min_rate': 0.1,
+            'max_rate': 50.0,
+            'additive_increase': 1.0,
+            'decrease_factor': 0.5,
+        },
+        # Delays before resubmitting a measurement set after a retryable error.
+        'retry': {
+            'max_attempts': 5,
+            'initial_delay_seconds': 60,
+            'max_delay_seconds': 15 * 60,
+        },
+        # Existing measurement set IDs, prefetched for each batch with paginated queries per TIN.
+        'measurement_set_cache': {
+            'ttl_seconds': 60 * 60,
+            'items_per_page': 1000,
+            # TINs with fewer NPIs in a batch are looked up NPI by NPI.
+            'min_npis_per_tin': 2,
+        },
+        # Hashes of the last measurement set successfully submitted for each provider.
+        'ledger_path': '/tmp/claims_to_quality/submission_ledger.sqlite',
     },
     'assets': {
         'qpp_single_source_json': {
@@ -221,7 +274,8 @@ CONFIG = {
                   'lib/assets/qpp_single_source_2017.json',
             2018: '/home/tduser/analyzer/claims_to_quality/'
                   'lib/assets/qpp-measures-data-2018.json'
-        }
+        },
+        'compiled_measures_dir': '/tmp/claims_to_quality/compiled_measures'
     },
     'aws': {
         'profile_name': None,
@@ -231,7 +285,14 @@ CONFIG = {
             'access_key_id': _get_env_variable(
                 'SQS_ACCESS_KEY_ID', 'sqs_access_key'),
             'secret_access_key': _get_env_variable(
-                'SQS_SECRET_ACCESS_KEY', 'sqs_secret_access_key')
+                'SQS_SECRET_ACCESS_KEY', 'sqs_secret_access_key'),
+            # Visibility timeout extensions of the messages being processed.
+            'visibility_heartbeat': {
+                'visibility_timeout_seconds': int(_get_env_variable(
+                    'SQS_VISIBILITY_TIMEOUT', default='300')),
+                'interval_seconds': 120,
+                'max_tracked_seconds': 6 * 3600
+            }
         }
     },
     'teradata': {
@@ -258,6 +319,14 @@ CONFIG = {
                 'OutputAsResultSet': 'YES',
                 'UseDataEncryption': 'YES'
             }
+        },
+        # Sessions shared by the queries executed without an explicit session.
+        'session_pool': {
+            'min_size': 1,
+            'max_size': int(_get_env_variable('TERADATA_SESSION_POOL_MAX_SIZE', default='4')),
+            'max_idle_seconds': 300,
+            'max_age_seconds': 3600,
+            'checkout_timeout_seconds': 600,
         }
     },
     'new_relic_insights': {
@@ -280,6 +349,12 @@ CONFIG_DEV = {
         'send_submissions': False,
         'write_submissions_to_file': False,
     },
+    'idr_lookup_cache': {
+        'enabled': True
+    },
+    'claim_reader': {
+        'procedure_code_pushdown': True
+    },
     'aws': {
         'sqs': {
             'queue_name': 'claims-to-quality-dev'
@@ -306,6 +381,12 @@ CONFIG_IMPL = {
         'send_submissions': True,
         'write_submissions_to_file': False,
     },
+    'idr_lookup_cache': {
+        'enabled': True
+    },
+    'claim_reader': {
+        'procedure_code_pushdown': True
+    },
     'aws': {
         'sqs': {
             'queue_name': 'claims-to-quality-impl'
@@ -332,6 +413,12 @@ CONFIG_PRD = {
         'send_submissions': True,
         'write_submissions_to_file': False,
     },
+    'idr_lookup_cache': {
+        'enabled': True
+    },
+    'claim_reader': {
+        'procedure_code_pushdown': True
+    },
     'aws': {
         'sqs': {
             'queue_name': 'claims-to-quality-prod'
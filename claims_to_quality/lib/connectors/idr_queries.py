@@ -23,7 +23,7 @@ class InputError(Exception):
     pass
 
 
-def get_access_layer_batch_query(tins, npis, start_date, end_date):
+def get_access_layer_batch_query(tins, npis, start_date, end_date, procedure_code_condition=None):
     """Populate the Teradata SQL statement to query the IDR for provider information in batches.
 
      Args:
@@ -31,6 +31,8 @@ def get_access_layer_batch_query(tins, npis, start_date, end_date):
         tins ([str]): Provider tax identification numbers to load.
         start_date (datetime): Start date of data to load.
         end_date (datetime): End date of data to load.
+        procedure_code_condition (str): If given, only split claims with at least one claim line
+            meeting this condition are returned (see measures_to_sql.py).
     Returns:
         SQL query to retrieve data from the IDR.
     """
@@ -39,7 +41,7 @@ def get_access_layer_batch_query(tins, npis, start_date, end_date):
 
     npi_tins = ['{}{}'.format(npi, tin) for npi, tin in zip(npis, tins)]
 
-    return ACCESS_LAYER_BASE_QUERY_BATCH.format(
+    batch_query = ACCESS_LAYER_BASE_QUERY_BATCH.format(
         npis=sql_formatting.to_sql_list(npis),
         tins=sql_formatting.to_sql_list(tins),
         npi_tins=sql_formatting.to_sql_list(npi_tins),
@@ -52,6 +54,62 @@ def get_access_layer_batch_query(tins, npis, start_date, end_date):
         medicare_vdm_name=config.get('teradata.medicare_vdm_name')
     )
 
+    if procedure_code_condition is None:
+        return batch_query
+
+    return RELEVANT_CLAIMS_BATCH_QUERY.format(
+        batch_query=batch_query,
+        procedure_code_condition=procedure_code_condition
+    )
+
+
+"""
+RELEVANT_CLAIMS_BATCH_QUERY
+This query wraps the batch query to keep only the split claims of each provider with at least one
+claim line meeting a condition, typically having a procedure code of one of the measures being
+calculated, so that claims which would be filtered out by the analyzer are not transferred from
+the IDR. The claim lines are filtered in a single pass over the batch query, with a window.
+Each row also holds the number of claim lines of its provider, and of the whole batch, before
+filtering.
+"""
+PROVIDER_ROW_COUNT_COLUMN = 'provider_row_count'
+BATCH_ROW_COUNT_COLUMN = 'batch_row_count'
+RELEVANT_CLAIMS_BATCH_QUERY = """
+SELECT batch_claims.*,
+    COUNT(*) OVER (
+        PARTITION BY clm_rndrg_prvdr_tax_num, clm_line_rndrg_prvdr_npi_num
+    ) AS provider_row_count,
+    COUNT(*) OVER () AS batch_row_count
+FROM ({batch_query}) AS batch_claims
+QUALIFY MAX(CASE WHEN {procedure_code_condition} THEN 1 ELSE 0 END) OVER (
+    PARTITION BY clm_rndrg_prvdr_tax_num, clm_line_rndrg_prvdr_npi_num, splt_clm_id
+) = 1
+"""
+
+
+"""
+ORDERED_BATCH_QUERY
+This query wraps the batch query to return claim lines ordered by provider and split claim ID,
+so that the rows of a provider can be consumed from the cursor as soon as they are complete.
+"""
+ORDERED_BATCH_QUERY = """
+SELECT * FROM ({batch_query}) AS batch_claims
+ORDER BY clm_rndrg_prvdr_tax_num, clm_line_rndrg_prvdr_npi_num, splt_clm_id
+"""
+
+
+def get_ordered_access_layer_batch_query(
+        tins, npis, start_date, end_date, procedure_code_condition=None):
+    """
+    Populate the batch query, ordered by (tin, npi, splt_clm_id).
+
+    Takes the same arguments as get_access_layer_batch_query.
+    """
+    return ORDERED_BATCH_QUERY.format(
+        batch_query=get_access_layer_batch_query(
+            tins, npis, start_date, end_date, procedure_code_condition=procedure_code_condition)
+    )
+
 
 """
 DISCHARGE_QUERY
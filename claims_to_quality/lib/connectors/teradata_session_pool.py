@@ -0,0 +1,245 @@
+"""
+Pool of Teradata sessions reused across queries.
+
+Logging on to Teradata takes much longer than most of the auxiliary queries made during measure
+calculation, so queries executed without an explicit session (see execute.py) check a session
+out of the pool of their process, and check it back in once their results have been read.
+
+- At most `max_size` sessions are open at once. Checkouts wait for a session to be checked in
+  when all of them are in use.
+- Sessions idle for more than `max_idle_seconds` are validated with a trivial query before being
+  reused, or closed if more than `min_size` sessions are open.
+- Sessions older than `max_age_seconds` are closed instead of being reused.
+- Sessions used by a query which failed with a TeradataError are closed.
+"""
+import contextlib
+import os
+import threading
+import time
+
+from claims_to_quality.config import config
+from claims_to_quality.lib.connectors import teradata_connector
+from claims_to_quality.lib.qpp_logging import logging_config
+from claims_to_quality.lib.teradata_methods import teradata_errors
+
+logger = logging_config.get_logger(__name__)
+
+VALIDATION_QUERY = 'SELECT 1'
+
+
+class TeradataSessionPool(object):
+    """Thread-safe pool of Teradata sessions."""
+
+    def __init__(
+            self,
+            min_size,
+            max_size,
+            max_idle_seconds,
+            max_age_seconds,
+            checkout_timeout=None,
+            clock=time.monotonic):
+        """
+        Initialize a TeradataSessionPool.
+
+        :param min_size: Number of sessions kept open, even when idle
+        :type min_size: int
+        :param max_size: Maximum number of sessions open at once
+        :type max_size: int
+        :param max_idle_seconds: Number of idle seconds after which sessions are validated
+        :type max_idle_seconds: float
+        :param max_age_seconds: Number of seconds after which sessions are recycled
+        :type max_age_seconds: float
+        :param checkout_timeout: Maximum number of seconds to wait for a session (default: none)
+        :type checkout_timeout: float
+        :param clock: Function returning the current time in seconds
+        """
+        self.min_size = min_size
+        self.max_size = max_size
+        self.max_idle_seconds = max_idle_seconds
+        self.max_age_seconds = max_age_seconds
+        self.checkout_timeout = checkout_timeout
+        self._clock = clock
+        self.pid = os.getpid()
+        # Idle sessions, as (session, created at, idle since), the most recently used last.
+        self._idle = []
+        # Creation time of the sessions checked out, by session ID.
+        self._created_at = {}
+        self._num_open = 0
+        self._closed = False
+        self._condition = threading.Condition()
+
+    @property
+    def num_open(self):
+        """Return the number of open sessions, idle or checked out."""
+        with self._condition:
+            return self._num_open
+
+    @property
+    def num_idle(self):
+        """Return the number of idle sessions."""
+        with self._condition:
+            return len(self._idle)
+
+    @contextlib.contextmanager
+    def session(self):
+        """Check a session out for the duration of the context, and check it back in."""
+        session = self.checkout()
+        try:
+            yield session
+        except teradata_errors.TeradataError:
+            # The session may be unusable.
+            self.discard(session)
+            raise
+        except BaseException:
+            self.checkin(session)
+            raise
+        self.checkin(session)
+
+    def checkout(self):
+        """Return an idle session, or a new one if fewer than `max_size` are open."""
+        deadline = None
+        if self.checkout_timeout is not None:
+            deadline = self._clock() + self.checkout_timeout
+
+        with self._condition:
+            while True:
+                if self._closed:
+                    raise teradata_errors.TeradataError('The Teradata session pool is closed.')
+
+                session = self._pop_idle_session()
+                if session is not None:
+                    return session
+
+                if self._num_open < self.max_size:
+                    self._num_open += 1
+                    break
+
+                wait_seconds = None
+                if deadline is not None:
+                    wait_seconds = deadline - self._clock()
+                    if wait_seconds <= 0:
+                        raise teradata_errors.TeradataError(
+                            'Timed out waiting for a Teradata session.')
+                self._condition.wait(wait_seconds)
+
+        # Log on outside of the lock, so that other sessions can be checked in meanwhile.
+        try:
+            session = teradata_connector.teradata_connection()
+        except BaseException:
+            with self._condition:
+                self._num_open -= 1
+                self._condition.notify()
+            raise
+
+        with self._condition:
+            self._created_at[id(session)] = self._clock()
+        logger.debug('Opened Teradata session ({} open).'.format(self.num_open))
+        return session
+
+    def checkin(self, session):
+        """Return a session to the pool, closing it if it is too old or the pool is closed."""
+        with self._condition:
+            created_at = self._created_at.pop(id(session), None)
+            if created_at is None:
+                return
+
+            now = self._clock()
+            if self._closed or now - created_at >= self.max_age_seconds:
+                self._num_open -= 1
+                self._condition.notify()
+            else:
+                self._idle.append((session, created_at, now))
+                self._condition.notify()
+                return
+
+        _close_session(session)
+
+    def discard(self, session):
+        """Close a checked out session instead of returning it to the pool."""
+        with self._condition:
+            if self._created_at.pop(id(session), None) is None:
+                return
+            self._num_open -= 1
+            self._condition.notify()
+        _close_session(session)
+
+    def close(self):
+        """Close the idle sessions. Sessions checked out are closed when checked in."""
+        with self._condition:
+            self._closed = True
+            idle_sessions = [session for session, _, _ in self._idle]
+            self._num_open -= len(self._idle)
+            self._idle = []
+            self._condition.notify_all()
+        for session in idle_sessions:
+            _close_session(session)
+
+    def _pop_idle_session(self):
+        """
+        Return the most recently used idle session which can be reused, or None.
+
+        Sessions which are too old, idle for too long beyond `min_size`, or which fail
+        validation are closed. Must be called with the lock held.
+        """
+        while self._idle:
+            session, created_at, idle_since = self._idle.pop()
+            now = self._clock()
+            reusable = now - created_at < self.max_age_seconds
+            if reusable and now - idle_since >= self.max_idle_seconds:
+                reusable = self._num_open <= self.min_size and _is_valid(session)
+
+            if reusable:
+                self._created_at[id(session)] = created_at
+                return session
+
+            self._num_open -= 1
+            _close_session(session)
+        return None
+
+
+def _is_valid(session):
+    """Return True if the session can still run queries."""
+    try:
+        with session.cursor() as cursor:
+            cursor.execute(VALIDATION_QUERY)
+            cursor.fetchall()
+    except Exception as error:
+        logger.warning('Idle Teradata session failed validation: {}'.format(error))
+        return False
+    return True
+
+
+def _close_session(session):
+    try:
+        session.close()
+    except Exception as error:
+        logger.warning('Error closing Teradata session: {}'.format(error))
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Return the session pool of this process."""
+    global _pool
+    with _pool_lock:
+        # Sessions cannot be shared with forked processes.
+        if _pool is None or _pool.pid != os.getpid():
+            _pool = TeradataSessionPool(
+                min_size=config.get('teradata.session_pool.min_size'),
+                max_size=config.get('teradata.session_pool.max_size'),
+                max_idle_seconds=config.get('teradata.session_pool.max_idle_seconds'),
+                max_age_seconds=config.get('teradata.session_pool.max_age_seconds'),
+                checkout_timeout=config.get('teradata.session_pool.checkout_timeout_seconds'),
+            )
+        return _pool
+
+
+def close_pool():
+    """Close the idle sessions of this process's pool, and forget the pool."""
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None and pool.pid == os.getpid():
+        pool.close()
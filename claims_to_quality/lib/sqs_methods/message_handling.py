@@ -108,6 +108,66 @@ def send_messages(messages, sqs_queue):
     return response_counter
 
 
+@newrelic.agent.function_trace(name='delete-sqs-messages', group='Task')
+def delete_messages(messages):
+    """
+    Delete messages from their queue, in groups of BOTO_MAX_SEND_LIMIT.
+
+    Args:
+        messages (list(boto3.Message)): Messages received from SQS.
+
+    Returns:
+        The list of messages which could not be deleted.
+    """
+    return _send_batch_requests(messages, 'delete_message_batch')
+
+
+@newrelic.agent.function_trace(name='change-sqs-messages-visibility', group='Task')
+def change_messages_visibility(messages, visibility_timeout):
+    """
+    Hide messages from the consumers of their queue for `visibility_timeout` seconds from now.
+
+    Args:
+        messages (list(boto3.Message)): Messages received from SQS.
+        visibility_timeout (int): Number of seconds before the messages become visible again.
+
+    Returns:
+        The list of messages whose visibility timeout could not be changed.
+    """
+    return _send_batch_requests(
+        messages, 'change_message_visibility_batch', VisibilityTimeout=visibility_timeout)
+
+
+def _send_batch_requests(messages, request_name, **entry_fields):
+    """Send a batch request for each group of BOTO_MAX_SEND_LIMIT messages of the same queue."""
+    messages_by_queue_url = collections.OrderedDict()
+    for message in messages:
+        messages_by_queue_url.setdefault(message.queue_url, []).append(message)
+
+    failed_messages = []
+    for queue_url, queue_messages in messages_by_queue_url.items():
+        client = queue_messages[0].meta.client
+        for message_group in grouper(queue_messages, chunk_size=BOTO_MAX_SEND_LIMIT):
+            message_group = [message for message in message_group if message is not None]
+            entries = [
+                dict(Id=str(index), ReceiptHandle=message.receipt_handle, **entry_fields)
+                for index, message in enumerate(message_group)
+            ]
+            try:
+                response = getattr(client, request_name)(QueueUrl=queue_url, Entries=entries)
+            except Exception as error:
+                logger.warning('SQS {} failed for {} messages: {}'.format(
+                    request_name, len(message_group), error))
+                failed_messages.extend(message_group)
+                continue
+
+            for failure in response.get('Failed', []):
+                logger.warning('SQS {} failed: {}'.format(request_name, failure))
+                failed_messages.append(message_group[int(failure['Id'])])
+
+    return failed_messages
+
+
 def did_any_messages_fail_to_be_sent(response_counter):
     """Return True if the result has > 0 failures, False otherwise."""
     return response_counter['failed_total']
@@ -1,13 +1,59 @@
 """Mock SQS message object."""
+import itertools
+import weakref
+
+MOCK_QUEUE_URL = 'https://queue.amazonaws.com/000000000000/mock-queue'
+
+
+class MockSQSClient():
+    """Mock SQS client handling the batch requests of MockMessages."""
+
+    def __init__(self):
+        """Initialize the client."""
+        self.messages = weakref.WeakValueDictionary()
+        self._receipt_handles = itertools.count()
+
+    def register(self, message):
+        """Return a new receipt handle for the message."""
+        receipt_handle = 'receipt-handle-{}'.format(next(self._receipt_handles))
+        self.messages[receipt_handle] = message
+        return receipt_handle
+
+    def delete_message_batch(self, QueueUrl, Entries):
+        """Mock delete_message_batch function."""
+        for entry in Entries:
+            self.messages[entry['ReceiptHandle']].delete()
+        return {'Successful': [{'Id': entry['Id']} for entry in Entries], 'Failed': []}
+
+    def change_message_visibility_batch(self, QueueUrl, Entries):
+        """Mock change_message_visibility_batch function."""
+        for entry in Entries:
+            self.messages[entry['ReceiptHandle']].visibility_timeout = entry['VisibilityTimeout']
+        return {'Successful': [{'Id': entry['Id']} for entry in Entries], 'Failed': []}
+
+
+class MockMeta():
+    """Mock boto3 resource metadata."""
+
+    def __init__(self, client):
+        """Initialize the metadata."""
+        self.client = client
+
+
+_client = MockSQSClient()
 
 
 class MockMessage():
     """Mock SQS message."""
 
-    def __init__(self, body):
+    def __init__(self, body, client=None):
         """Initialize the message."""
         self.body = body
         self.deleted = False
+        self.visibility_timeout = None
+        self.meta = MockMeta(client or _client)
+        self.queue_url = MOCK_QUEUE_URL
+        self.receipt_handle = self.meta.client.register(self)
 
     def delete(self):
         """Mock delete function."""
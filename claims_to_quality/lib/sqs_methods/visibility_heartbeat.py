@@ -0,0 +1,124 @@
+"""
+Extension of the visibility timeout of the SQS messages being processed.
+
+A message received from SQS is hidden from the other consumers of the queue until its visibility
+timeout expires, after which it is delivered again. Large batches can take longer than the
+timeout to process and submit, so a background thread extends the timeout of the tracked
+messages every `interval` seconds, until they are untracked (once deleted, or left on the queue
+to be read again).
+
+Messages tracked for more than `max_tracked_seconds` are untracked, so that messages which are
+never untracked (e.g. dropped because of an invalid format) end up being delivered again.
+"""
+import collections
+import threading
+import time
+
+from claims_to_quality.config import config
+from claims_to_quality.lib.qpp_logging import logging_config
+from claims_to_quality.lib.sqs_methods import message_handling
+
+logger = logging_config.get_logger(__name__)
+
+
+class VisibilityHeartbeat(object):
+    """Keep extending the visibility timeout of tracked SQS messages."""
+
+    def __init__(self, visibility_timeout, interval, max_tracked_seconds, clock=time.monotonic):
+        """
+        Initialize a VisibilityHeartbeat.
+
+        :param visibility_timeout: Number of seconds the messages are hidden for at each extension
+        :type visibility_timeout: int
+        :param interval: Number of seconds between two extensions
+        :type interval: float
+        :param max_tracked_seconds: Number of seconds after which messages are untracked
+        :type max_tracked_seconds: float
+        :param clock: Function returning the current time in seconds
+        """
+        self.visibility_timeout = visibility_timeout
+        self.interval = interval
+        self.max_tracked_seconds = max_tracked_seconds
+        self._clock = clock
+        # receipt handle --> (message, time tracked).
+        self._tracked = collections.OrderedDict()
+        self._condition = threading.Condition()
+        self._stopped = False
+        self._thread = None
+
+    def __len__(self):
+        """Return the number of tracked messages."""
+        with self._condition:
+            return len(self._tracked)
+
+    def track(self, messages):
+        """Start extending the visibility timeout of the messages."""
+        with self._condition:
+            if self._stopped:
+                return
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name='visibility-heartbeat', daemon=True)
+                self._thread.start()
+            now = self._clock()
+            for message in messages:
+                self._tracked[message.receipt_handle] = (message, now)
+
+    def untrack(self, messages):
+        """Stop extending the visibility timeout of the messages."""
+        with self._condition:
+            for message in messages:
+                self._tracked.pop(message.receipt_handle, None)
+
+    def stop(self):
+        """Stop extending the visibility timeout of all messages."""
+        with self._condition:
+            self._stopped = True
+            self._tracked.clear()
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join()
+
+    def extend(self):
+        """Extend the visibility timeout of the tracked messages."""
+        with self._condition:
+            now = self._clock()
+            expired = [
+                receipt_handle for receipt_handle, (_, tracked_at) in self._tracked.items()
+                if now - tracked_at >= self.max_tracked_seconds
+            ]
+            for receipt_handle in expired:
+                del self._tracked[receipt_handle]
+            messages = [message for message, _ in self._tracked.values()]
+
+        if expired:
+            logger.warning(
+                'Stopped extending the visibility of {} messages after {} seconds.'.format(
+                    len(expired), self.max_tracked_seconds))
+        if not messages:
+            return
+
+        failed_messages = message_handling.change_messages_visibility(
+            messages, self.visibility_timeout)
+        # Messages whose receipt handle is no longer valid (e.g. deleted) cannot be extended.
+        self.untrack(failed_messages)
+        logger.debug('Extended the visibility of {} messages.'.format(
+            len(messages) - len(failed_messages)))
+
+    def _run(self):
+        while True:
+            with self._condition:
+                if not self._stopped:
+                    self._condition.wait(self.interval)
+                if self._stopped:
+                    return
+            self.extend()
+
+
+def get_heartbeat():
+    """Return a VisibilityHeartbeat configured for the analyzer's queue."""
+    return VisibilityHeartbeat(
+        visibility_timeout=config.get('aws.sqs.visibility_heartbeat.visibility_timeout_seconds'),
+        interval=config.get('aws.sqs.visibility_heartbeat.interval_seconds'),
+        max_tracked_seconds=config.get('aws.sqs.visibility_heartbeat.max_tracked_seconds'),
+    )
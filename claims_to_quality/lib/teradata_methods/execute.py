@@ -1,5 +1,5 @@
 """Methods for executing queries against a Teradata connection."""
-from claims_to_quality.lib.connectors import teradata_connector
+from claims_to_quality.lib.connectors import teradata_session_pool
 from claims_to_quality.lib.helpers import iterators
 from claims_to_quality.lib.qpp_logging import logging_config
 from claims_to_quality.lib.teradata_methods import teradata_errors
@@ -12,9 +12,14 @@ logger = logging_config.get_logger(__name__)
 
 
 def execute(command, session=None):
-    """Wrapper for SQL executions in a context manager."""
-    session_needs_to_be_closed = session is None
-    session = session or teradata_connector.teradata_connection()
+    """
+    Wrapper for SQL executions in a context manager.
+
+    Without a session, a session is checked out of the Teradata session pool for the query.
+    """
+    if session is None:
+        with teradata_session_pool.get_pool().session() as pooled_session:
+            return execute(command, session=pooled_session)
 
     try:
         with session.cursor() as cursor:
@@ -24,9 +29,6 @@ def execute(command, session=None):
     except teradata.api.DatabaseError:
         raise teradata_errors.TeradataError('DatabaseError')
 
-    if session_needs_to_be_closed:
-        session.close()
-
     logger.debug('Teradata execute returned {} rows.'.format(len(results)))
     return results
 
@@ -65,25 +67,38 @@ def execute_with_batch_fetch_and_output(command, session=None, db_fetch_size=100
     The query results are not stored in memory, so the session must remain open.
     """
     return iterators.iterate_in_slices(
-        iterable=_execute_iterator(command, session=session, arraysize=db_fetch_size),
+        iterable=execute_iterator(command, session=session, arraysize=db_fetch_size),
         batch_size=batch_size
     )
 
 
-def _execute_iterator(command, arraysize, session=None):
-    """Iterator for fetching query results from the database in batches."""
-    session_needs_to_be_closed = session is None
-    session = session or teradata_connector.teradata_connection()
+def execute_iterator(command, arraysize, session=None):
+    """
+    Iterator for fetching query results from the database in batches.
+
+    The query results are not stored in memory, so the session must remain open until
+    the iterator is exhausted. Without a session, a session is checked out of the Teradata
+    session pool until then.
+    """
+    if session is None:
+        with teradata_session_pool.get_pool().session() as pooled_session:
+            yield from execute_iterator(command, arraysize=arraysize, session=pooled_session)
+        return
 
-    with session.cursor() as cursor:
-        cursor.execute(command)
-        # TODO: Improve this by adding a more meaningful loop condition.
-        while True:
-            results = cursor.fetchmany(arraysize)
-            if not results:
-                break
-            for result in results:
-                yield result
+    row_count = 0
+
+    try:
+        with session.cursor() as cursor:
+            cursor.arraysize = arraysize
+            cursor.execute(command)
+            while True:
+                results = cursor.fetchmany(arraysize)
+                if not results:
+                    break
+                row_count += len(results)
+                for result in results:
+                    yield result
+    except teradata.api.DatabaseError:
+        raise teradata_errors.TeradataError('DatabaseError')
 
-    if session_needs_to_be_closed:
-        session.close()
+    logger.debug('Teradata execute iterator returned {} rows.'.format(row_count))
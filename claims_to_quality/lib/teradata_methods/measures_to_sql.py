@@ -5,3 +5,12 @@ from claims_to_quality.lib.teradata_methods import sql_formatting
 def _convert_procedure_codes_to_sql_condition(procedure_codes):
     """Convert a list of procedure codes to a SQL condition."""
     return 'CLM_LINE_HCPCS_CD IN {}'.format(sql_formatting.to_sql_list(procedure_codes))
+
+
+def get_relevant_claim_lines_condition(measure_definitions):
+    """Return a SQL condition on claim lines with a procedure code of any of the measures."""
+    procedure_codes = sorted({
+        code for measure in measure_definitions
+        for code in measure.procedure_code_map
+    })
+    return _convert_procedure_codes_to_sql_condition(procedure_codes)
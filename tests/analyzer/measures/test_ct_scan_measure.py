@@ -1,7 +1,10 @@
 """Tests for the CT Scan measure class (measures 415 and 416)."""
 import datetime
 
+from claims_to_quality.analyzer.calculation import ct_scan_measure
 from claims_to_quality.analyzer.calculation.ct_scan_measure import CTScanMeasure
+from claims_to_quality.analyzer.datasource import lookup_cache
+from claims_to_quality.analyzer.models import claim_batch
 from claims_to_quality.analyzer.models.claim import Claim
 from claims_to_quality.analyzer.models.measures.eligibility_option import EligibilityOption
 from claims_to_quality.analyzer.models.measures.measure_code import MeasureCode
@@ -154,3 +157,87 @@ class TestCTScanMeasure:
         }
 
         assert output == expected
+
+
+class TestGetBatchCTScanDates:
+    """Tests for the batch query of CT scans shared by measures 415 and 416."""
+
+    def setup(self):
+        """Build two CT scan measures and a batch of claims."""
+        self.measures = [get_test_measure(), get_test_measure()]
+        self.claim = get_test_claim_with_october_date()
+        self.batch_claims_data = {
+            ('tin_1', 'npi_1'): [self.claim],
+            ('tin_2', 'npi_2'): [get_test_claim_with_june_date()],
+        }
+
+    @mock.patch('claims_to_quality.lib.teradata_methods.execute.execute')
+    def test_single_query_shared_by_measures(self, execute):
+        """The CT scans of the batch are queried once, and used by all measures."""
+        execute.return_value = get_test_ct_query_results()
+
+        ct_scan_measure.get_batch_ct_scan_dates(self.measures, self.batch_claims_data)
+
+        assert execute.call_count == 1
+        assert self.measures[0].ct_scan_benes_and_dates is (
+            self.measures[1].ct_scan_benes_and_dates)
+        for measure in self.measures:
+            assert measure._filter_by_ct_scan([self.claim]) == [self.claim]
+            assert not measure._filter_by_ct_scan([get_test_claim_with_june_date()])
+        assert execute.call_count == 1
+
+    @mock.patch('claims_to_quality.lib.teradata_methods.execute.execute')
+    def test_claim_batch(self, execute):
+        """The CT scans of a ClaimBatch are queried for the same beneficiaries and dates."""
+        execute.return_value = get_test_ct_query_results()
+        ct_scan_measure.get_batch_ct_scan_dates(self.measures, self.batch_claims_data)
+        expected_benes_and_dates = self.measures[0].queried_benes_and_dates
+        assert expected_benes_and_dates
+
+        ct_scan_measure.get_batch_ct_scan_dates(
+            self.measures, claim_batch.ClaimBatch(self.batch_claims_data))
+
+        assert execute.call_count == 2
+        for measure in self.measures:
+            assert measure.queried_benes_and_dates == expected_benes_and_dates
+            assert measure._filter_by_ct_scan([self.claim]) == [self.claim]
+        assert execute.call_count == 2
+
+    @mock.patch('claims_to_quality.lib.teradata_methods.execute.execute')
+    def test_missing_dates_are_queried(self, execute):
+        """Beneficiaries and dates missing from the batch results are queried during calculation."""
+        execute.return_value = []
+        ct_scan_measure.get_batch_ct_scan_dates(self.measures, {})
+
+        execute.return_value = get_test_ct_query_results()
+        assert self.measures[0]._filter_by_ct_scan([self.claim]) == [self.claim]
+        assert execute.call_count == 1
+
+    @mock.patch('claims_to_quality.lib.teradata_methods.execute.execute')
+    def test_ct_scans_are_cached_across_batches(self, execute):
+        """CT scans found in a previous batch are not queried again for later dates."""
+        cache = lookup_cache.IDRLookupCache(max_bytes=10000)
+        for measure in self.measures:
+            measure.lookup_cache = cache
+        execute.return_value = get_test_ct_query_results()
+        ct_scan_measure.get_batch_ct_scan_dates(
+            self.measures, {('tin_1', 'npi_1'): [get_test_claim_with_june_date()]})
+
+        ct_scan_measure.get_batch_ct_scan_dates(
+            self.measures, {('tin_1', 'npi_1'): [self.claim]})
+
+        assert execute.call_count == 1
+        assert self.measures[0]._filter_by_ct_scan([self.claim]) == [self.claim]
+
+    @mock.patch('claims_to_quality.lib.teradata_methods.execute.execute')
+    def test_ct_scans_before_the_cached_dates_are_queried(self, execute):
+        """Dates before the first date queried for a beneficiary are queried again."""
+        self.measures[0].lookup_cache = lookup_cache.IDRLookupCache(max_bytes=10000)
+        execute.return_value = get_test_ct_query_results()
+        ct_scan_measure.get_batch_ct_scan_dates(
+            self.measures[:1], {('tin_1', 'npi_1'): [self.claim]})
+
+        ct_scan_measure.get_batch_ct_scan_dates(
+            self.measures[:1], {('tin_1', 'npi_1'): [get_test_claim_with_june_date()]})
+
+        assert execute.call_count == 2
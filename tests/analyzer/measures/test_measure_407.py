@@ -2,7 +2,8 @@
 from datetime import date
 
 from claims_to_quality.analyzer.calculation import measure_407
-from claims_to_quality.analyzer.models import claim
+from claims_to_quality.analyzer.datasource import lookup_cache
+from claims_to_quality.analyzer.models import claim, claim_batch
 from claims_to_quality.analyzer.models.measures.eligibility_option import EligibilityOption
 from claims_to_quality.analyzer.models.measures.measure_code import MeasureCode
 from claims_to_quality.analyzer.models.measures.measure_definition import MeasureDefinition
@@ -173,6 +174,80 @@ class TestVisitMeasure407():
 
         assert self.measure._get_mssa_episode_date_ranges(self.claims) == expected
 
+    @mock.patch('claims_to_quality.lib.teradata_methods.execute.execute')
+    def test_get_batch_mssa_date_ranges(self, execute):
+        """MSSA episodes are queried once per batch, and not again during calculation."""
+        execute.return_value = [
+            {'bene_sk': 'bene_1', 'min_date': date(2017, 1, 1), 'max_date': date(2017, 1, 1)},
+            {'bene_sk': 'bene_1', 'min_date': date(2017, 1, 2), 'max_date': date(2017, 1, 5)},
+            {'bene_sk': 'bene_2', 'min_date': date(2017, 1, 1), 'max_date': date(2017, 1, 3)}
+        ]
+        batch_claims_data = {
+            ('tin_1', 'npi_1'): [self.bene_1_claim_1, self.bene_1_claim_2],
+            ('tin_2', 'npi_2'): [self.bene_2_claim_2],
+            ('tin_3', 'npi_3'): [self.bene_3_claim_1],
+        }
+
+        self.measure.get_batch_mssa_date_ranges(batch_claims_data)
+        episodes = self.measure.get_eligible_instances(
+            [self.bene_1_claim_1, self.bene_1_claim_2, self.bene_2_claim_2])
+
+        assert execute.call_count == 1
+        assert self.measure.mssa_episode_date_ranges_by_beneficiary == {
+            'bene_1': [DateRange(date(2017, 1, 1), date(2017, 1, 5))],
+            'bene_2': [DateRange(date(2017, 1, 1), date(2017, 1, 3))]
+        }
+        assert episodes == [[self.bene_1_claim_1, self.bene_1_claim_2], [self.bene_2_claim_2]]
+
+    @mock.patch('claims_to_quality.lib.teradata_methods.execute.execute')
+    def test_get_batch_mssa_date_ranges_from_claim_batch(self, execute):
+        """Only the candidate claims of providers with quality codes are read from a ClaimBatch."""
+        execute.return_value = [
+            {'bene_sk': 'bene_1', 'min_date': date(2017, 1, 2), 'max_date': date(2017, 1, 5)},
+        ]
+        batch = claim_batch.ClaimBatch({
+            ('tin_1', 'npi_1'): [self.bene_1_claim_1, self.bene_1_claim_2],
+            ('tin_2', 'npi_2'): [self.bene_2_claim_2],
+            ('tin_3', 'npi_3'): [self.bene_3_claim_1],
+        })
+
+        with mock.patch.object(
+                batch, 'get_view', wraps=batch.get_view) as get_view:
+            self.measure.get_batch_mssa_date_ranges(batch)
+
+        assert execute.call_count == 1
+        assert self.measure.queried_bene_sks == {'bene_1', 'bene_2'}
+        assert self.measure.mssa_episode_date_ranges_by_beneficiary == {
+            'bene_1': [DateRange(date(2017, 1, 2), date(2017, 1, 5))],
+        }
+        assert ('tin_3', 'npi_3') not in [call[0][0] for call in get_view.call_args_list]
+
+    @mock.patch('claims_to_quality.lib.teradata_methods.execute.execute')
+    def test_get_batch_mssa_date_ranges_without_quality_codes(self, execute):
+        """Providers who did not submit quality codes for Measure 407 are not queried."""
+        self.measure.get_batch_mssa_date_ranges({('tin_3', 'npi_3'): [self.bene_3_claim_1]})
+
+        assert not execute.called
+        assert self.measure.queried_bene_sks == set()
+
+    @mock.patch('claims_to_quality.lib.teradata_methods.execute.execute')
+    def test_mssa_episodes_are_cached_across_batches(self, execute):
+        """MSSA episodes found in a previous batch are not queried again."""
+        self.measure.lookup_cache = lookup_cache.IDRLookupCache(max_bytes=10000)
+        execute.return_value = [
+            {'bene_sk': 'bene_1', 'min_date': date(2017, 1, 1), 'max_date': date(2017, 1, 5)}
+        ]
+        batch_claims_data = {('tin_1', 'npi_1'): [self.bene_1_claim_1, self.bene_2_claim_2]}
+
+        self.measure.get_batch_mssa_date_ranges(batch_claims_data)
+        self.measure.get_batch_mssa_date_ranges(batch_claims_data)
+
+        assert execute.call_count == 1
+        assert self.measure.queried_bene_sks == {'bene_1', 'bene_2'}
+        assert self.measure.mssa_episode_date_ranges_by_beneficiary == {
+            'bene_1': [DateRange(date(2017, 1, 1), date(2017, 1, 5))]
+        }
+
     def test_find_episode_id(self):
         """Test _find_episode_id."""
         date_ranges = [DateRange(date(2017, 1, 1), date(2017, 1, 1))]
@@ -3,7 +3,9 @@ from datetime import date
 
 from claims_to_quality.analyzer import measure_mapping
 from claims_to_quality.analyzer.calculation import measure_46
+from claims_to_quality.analyzer.datasource import lookup_cache
 from claims_to_quality.analyzer.models import claim
+from claims_to_quality.analyzer.models import claim_batch
 from claims_to_quality.analyzer.models import claim_line
 from claims_to_quality.analyzer.models.measures.eligibility_option import EligibilityOption
 from claims_to_quality.analyzer.models.measures.measure_code import MeasureCode
@@ -388,3 +390,36 @@ class TestMeasure46EligibilityFiltering():
         execute.return_value = [{'bene_sk': 'bene_3', 'clm_line_from_dt': date(2017, 1, 1)}]
         filtered_claims = self.measure.filter_by_eligibility_criteria(claims)
         assert filtered_claims == []
+
+    @mock.patch(
+        'claims_to_quality.analyzer.calculation.measure_46.'
+        'Measure46._get_discharge_dates_by_provider')
+    def test_get_batch_discharge_dates_from_claim_batch(self, _get_discharge_dates_by_provider):
+        """The beneficiaries of a ClaimBatch are read from its columns."""
+        batch_claims_data = {
+            ('tin_1', 'npi_1'): [self.bene_1_claim_1, self.bene_2_claim_2],
+            ('tin_2', 'npi_2'): [self.bene_3_claim_1],
+        }
+        self.measure.get_batch_discharge_dates(batch_claims_data)
+        with mock.patch.object(claim_batch.ClaimBatchView, 'to_claims') as to_claims:
+            self.measure.get_batch_discharge_dates(claim_batch.ClaimBatch(batch_claims_data))
+
+        assert not to_claims.called
+        dict_call, batch_call = _get_discharge_dates_by_provider.call_args_list
+        for call in (dict_call, batch_call):
+            assert call[1]['tins'] == ['tin_1']
+            assert call[1]['npis'] == ['npi_1']
+            assert sorted(call[1]['bene_sks']) == ['bene_1', 'bene_2']
+
+    @mock.patch('claims_to_quality.lib.teradata_methods.execute.execute')
+    def test_discharge_dates_are_cached_across_batches(self, execute):
+        """Discharge dates found in a previous batch are not queried again."""
+        self.measure.lookup_cache = lookup_cache.IDRLookupCache(max_bytes=10000)
+        execute.return_value = [{'bene_sk': 'bene_1', 'clm_line_from_dt': date(2017, 1, 1)}]
+        self.measure.filter_by_eligibility_criteria(self.claims)
+
+        self.measure.clear_discharge_date_cache()
+        filtered_claims = self.measure.filter_by_eligibility_criteria(self.claims)
+
+        assert execute.call_count == 1
+        assert filtered_claims == [self.bene_1_claim_1, self.bene_1_claim_2]
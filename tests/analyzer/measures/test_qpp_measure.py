@@ -9,6 +9,8 @@ from claims_to_quality.analyzer.models.measures.measure_code import MeasureCode
 from claims_to_quality.analyzer.models.measures.measure_definition import MeasureDefinition
 from claims_to_quality.analyzer.models.measures.performance_option import PerformanceOption
 
+import mock
+
 import pytest
 
 
@@ -395,6 +397,52 @@ class TestGetMostAdvantageous():
 
         assert output == expected
 
+    def test_performance_markers_are_computed_once_per_claim(self):
+        """Test that performance markers are reused until the cache is reset."""
+        test_claim = claim.Claim({'claim_lines': [{'clm_line_hcpcs_cd': 'pn_code'}]})
+
+        with mock.patch.object(
+                self.measure, '_compute_performance_markers',
+                wraps=self.measure._compute_performance_markers) as compute_markers:
+            self.measure.filter_by_presence_of_quality_codes([test_claim])
+            output = self.measure.get_most_advantageous_claim([test_claim])
+            assert compute_markers.call_count == 1
+
+            self.measure.reset_performance_marker_cache()
+            self.measure._assign_performance_markers(test_claim)
+            assert compute_markers.call_count == 2
+
+        assert output == (test_claim, 'performanceMet')
+
+    def test_performance_marker_cache_is_reset_on_execute(self):
+        """Test that the cache does not carry over from one provider to the next."""
+        test_claim = claim.Claim({'claim_lines': [{'clm_line_hcpcs_cd': 'pn_code'}]})
+        self.measure._assign_performance_markers(test_claim)
+        self.measure.fields_to_group_by = ['bene_sk']
+
+        self.measure.execute([])
+
+        assert self.measure._performance_markers_by_claim_id == {}
+
+    def test_performance_marker_cache_is_released_after_execute(self):
+        """Test that the provider's claims are not kept once its measure has been calculated."""
+        test_claim = claim.Claim({'claim_lines': [{'clm_line_hcpcs_cd': 'pn_code'}]})
+        self.measure.fields_to_group_by = ['bene_sk']
+
+        with mock.patch.object(
+                self.measure, 'filter_by_eligibility_criteria', side_effect=lambda claims: claims):
+            with mock.patch.object(
+                    self.measure, 'get_eligible_instances', side_effect=lambda claims: [claims]):
+                output = self.measure.execute([test_claim])
+        assert output['performance_met'] == 1
+        assert self.measure._performance_markers_by_claim_id == {}
+
+        with mock.patch.object(
+                self.measure, 'score_eligible_instances', side_effect=ValueError('error')):
+            with pytest.raises(ValueError):
+                self.measure.execute([test_claim])
+        assert self.measure._performance_markers_by_claim_id == {}
+
     def test_get_most_advantageous_claim(self):
         """Test of get_most_advantageous_claim."""
         best_claim = claim.Claim({'claim_lines': [{'clm_line_hcpcs_cd': 'pn_code'}]})
@@ -1,8 +1,10 @@
 """Test date handling and filtering for claims."""
 import datetime
 
+from claims_to_quality.analyzer.datasource import code_reader
 from claims_to_quality.analyzer.models.claim import Claim
 from claims_to_quality.analyzer.models.claim_line import ClaimLine
+from claims_to_quality.analyzer.models.claim_record import ClaimLineRecord, ClaimRecord
 from claims_to_quality.analyzer.models.measures.eligibility_option import EligibilityOption
 from claims_to_quality.analyzer.models.measures.measure_definition import MeasureDefinition
 from claims_to_quality.analyzer.processing import claim_filtering
@@ -87,3 +89,25 @@ class TestClaimFiltering():
         )
 
         assert filtered_claims == [self.claim_with_relevant_procedure_code]
+
+    def test_quality_codes_with_code_bits(self):
+        """Claims carrying vocabulary bitsets should be filtered in the same way."""
+        vocabulary = code_reader.get_code_vocabulary()
+        claim_with_quality_code = ClaimRecord(
+            clm_from_dt=datetime.date(self.performance_year, 1, 1),
+            claim_lines=[ClaimLineRecord(clm_line_hcpcs_cd='G9607')],
+            procedure_code_bits=vocabulary.to_bitset({'G9607'}))
+        claim_without_quality_code = ClaimRecord(
+            clm_from_dt=datetime.date(self.performance_year, 1, 1),
+            claim_lines=[ClaimLineRecord(clm_line_hcpcs_cd='not_a_real_code')],
+            procedure_code_bits=vocabulary.to_bitset({'not_a_real_code'}))
+
+        assert claim_filtering.do_any_claims_have_quality_codes([claim_with_quality_code])
+        assert not claim_filtering.do_any_claims_have_quality_codes([claim_without_quality_code])
+        # Codes that are not in the measure definitions fall back to comparing strings.
+        assert claim_filtering.does_claim_have_quality_codes(
+            claim_without_quality_code, quality_codes={'not_a_real_code'})
+        assert claim_filtering.filter_claims_by_measure_procedure_codes(
+            claims_data=[claim_with_quality_code, claim_without_quality_code],
+            measure_definitions=[self.measure_definition]
+        ) == [claim_with_quality_code]
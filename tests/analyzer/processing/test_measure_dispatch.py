@@ -0,0 +1,103 @@
+"""Tests for the measure dispatch index."""
+import datetime
+
+from claims_to_quality.analyzer import measure_mapping
+from claims_to_quality.analyzer.models.claim_record import ClaimLineRecord, ClaimRecord
+from claims_to_quality.analyzer.processing import measure_dispatch
+
+
+def _build_claim(splt_clm_id, lines, dx_codes=(), sex_code='2'):
+    return ClaimRecord(
+        splt_clm_id=splt_clm_id,
+        bene_sk='bene_sk_{}'.format(splt_clm_id),
+        clm_ptnt_birth_dt=datetime.date(1948, 1, 1),
+        clm_bene_sex_cd=sex_code,
+        clm_from_dt=datetime.date(2018, 6, 1),
+        clm_thru_dt=datetime.date(2018, 6, 1),
+        dx_codes=list(dx_codes),
+        claim_lines=[
+            ClaimLineRecord(
+                clm_line_num=line_number,
+                clm_line_hcpcs_cd=code,
+                mdfr_cds=list(modifiers),
+                clm_pos_code=pos_code,
+                clm_line_from_dt=datetime.date(2018, 6, 1),
+                clm_line_thru_dt=datetime.date(2018, 6, 1))
+            for line_number, (code, modifiers, pos_code) in enumerate(lines)
+        ]
+    )
+
+
+def _build_matching_line(measure_code):
+    return (
+        measure_code.code,
+        measure_code.modifiers[:1] if measure_code.modifiers else [],
+        measure_code.places_of_service[0] if measure_code.places_of_service else None
+    )
+
+
+def _build_claims_for_calculators(measure_calculators):
+    """Build claims exercising the eligibility options of every measure."""
+    claims = [_build_claim('no_codes', [('not_a_code', [], None)])]
+    for calculator in measure_calculators.values():
+        for option in calculator.eligibility_options:
+            procedure_codes = option.procedure_codes or []
+            additional_codes = option.additional_procedure_codes or []
+            dx_codes = (option.diagnosis_codes or [])[:1] + (
+                option.additional_diagnosis_codes or [])[:1]
+            for measure_code in procedure_codes[:2] + additional_codes[:2]:
+                lines = [_build_matching_line(measure_code)]
+                # Also build claims matching both lists, and claims with excluded modifiers.
+                if additional_codes and procedure_codes:
+                    lines.append(_build_matching_line(additional_codes[0]))
+                    lines.append(_build_matching_line(procedure_codes[0]))
+                claims.append(_build_claim(str(len(claims)), lines, dx_codes))
+                if measure_code.modifier_exclusions:
+                    claims.append(_build_claim(
+                        str(len(claims)),
+                        [(measure_code.code, measure_code.modifier_exclusions[:1], None)],
+                        dx_codes))
+    return claims
+
+
+class TestMeasureDispatchIndex():
+    """Tests for MeasureDispatchIndex."""
+
+    @classmethod
+    def setup_class(cls):
+        # Loading every measure calculator is slow, so only do it once.
+        cls.measure_calculators = measure_mapping.get_measure_calculators(
+            measure_mapping.get_all_measure_ids())
+        cls.index = measure_dispatch.MeasureDispatchIndex(cls.measure_calculators)
+
+    def test_measures_using_all_claims(self):
+        assert {'046', '407', '415', '416'} <= self.index.measures_using_all_claims
+        assert '047' not in self.index.measures_using_all_claims
+
+    def test_get_candidate_claims(self):
+        line_047 = _build_matching_line(
+            self.measure_calculators['047'].eligibility_options[0].procedure_codes[0])
+        claim_047 = _build_claim('047', [line_047])
+        claim_without_codes = _build_claim('no_codes', [('not_a_code', [], None)])
+
+        candidate_claims = self.index.get_candidate_claims([claim_047, claim_without_codes])
+
+        assert candidate_claims['047'] == [claim_047]
+        assert candidate_claims['046'] == [claim_047, claim_without_codes]
+        assert all(claim_without_codes not in candidate_claims[measure_number]
+                   for measure_number in candidate_claims
+                   if measure_number not in self.index.measures_using_all_claims)
+
+    def test_candidates_have_the_same_eligible_claims(self):
+        """Eligibility filters should select the same claims from candidates and all claims."""
+        claims = _build_claims_for_calculators(self.measure_calculators)
+        candidate_claims = self.index.get_candidate_claims(claims)
+
+        for measure_number, calculator in self.measure_calculators.items():
+            if measure_number in self.index.measures_using_all_claims:
+                continue
+            calculators = getattr(calculator, 'submeasures', {'': calculator}).values()
+            for measure in calculators:
+                assert measure.filter_by_eligibility_criteria(claims) == (
+                    measure.filter_by_eligibility_criteria(
+                        candidate_claims.get(measure_number, [])))
@@ -0,0 +1,161 @@
+"""Tests for the pipelined fetch, compute and submit driver."""
+import threading
+
+from claims_to_quality.analyzer.processing import pipeline
+from claims_to_quality.lib.sqs_methods.mock_message import MockMessage
+
+import mock
+
+import pytest
+
+
+def _get_batches(num_batches, batch_size=2):
+    return [
+        [
+            MockMessage('{{"tin": "tin_{}", "npi": "npi_{}"}}'.format(batch, index))
+            for index in range(batch_size)
+        ]
+        for batch in range(num_batches)
+    ]
+
+
+class FakeQueueReader(object):
+    """Queue reader yielding the given batches of messages."""
+
+    def __init__(self, batches):
+        """Store the batches to yield."""
+        self.batches = batches
+
+    def read_batch(self, batch_size, stop_event=None):
+        """Yield the batches."""
+        for batch in self.batches:
+            yield batch
+
+
+class IdleQueueReader(object):
+    """Queue reader waiting for messages until it is stopped."""
+
+    def read_batch(self, batch_size, stop_event=None):
+        """Wait for the stop event without yielding any batch."""
+        stop_event.wait()
+        return
+        yield
+
+
+class FakeProcessor(object):
+    """Processor recording the batches it loads and calculates."""
+
+    def __init__(self, fail_batch_for_tins=()):
+        """Initialize a FakeProcessor."""
+        self.fail_batch_for_tins = fail_batch_for_tins
+        self.batches_in_flight = 0
+        self.max_batches_in_flight = 0
+        self.lock = threading.Lock()
+
+    def _safe_get_batch(self, providers):
+        if any(provider['tin'] in self.fail_batch_for_tins for provider in providers):
+            raise ValueError('Teradata is down.')
+        with self.lock:
+            self.batches_in_flight += 1
+            self.max_batches_in_flight = max(self.max_batches_in_flight, self.batches_in_flight)
+        return {(provider['tin'], provider['npi']): ['claim'] for provider in providers}
+
+    def _process_providers(self, batch_claims_data, providers):
+        with self.lock:
+            self.batches_in_flight -= 1
+        for provider in providers:
+            provider['measurement_set'] = 'measurement_set'
+            provider['processing_error'] = False
+        return providers
+
+
+class TestPipeline():
+    """Tests for the Pipeline class."""
+
+    def setup(self):
+        """Initialize the pipeline dependencies."""
+        self.submitter = mock.MagicMock()
+        self.processor = FakeProcessor()
+
+    def _get_submitted_providers(self):
+        return [
+            provider
+            for call in self.submitter.submit_batch.call_args_list
+            for provider in call[0][0]
+        ]
+
+    def test_all_batches_are_submitted_in_order(self):
+        batches = _get_batches(5)
+        pipeline.Pipeline(
+            FakeQueueReader(batches), self.processor, self.submitter, batch_size=2
+        ).run()
+
+        submitted_providers = self._get_submitted_providers()
+        assert [provider['message'] for provider in submitted_providers] == [
+            message for batch in batches for message in batch
+        ]
+        assert all(
+            provider['measurement_set'] == 'measurement_set' for provider in submitted_providers)
+
+    def test_max_batches(self):
+        test_pipeline = pipeline.Pipeline(
+            FakeQueueReader(_get_batches(5)), self.processor, self.submitter, batch_size=2)
+        test_pipeline.run(max_batches=2)
+
+        assert self.submitter.submit_batch.call_count == 2
+        assert test_pipeline.metrics['fetch'].batches == 2
+
+    def test_queues_are_bounded(self):
+        """Fetched batches wait for the compute stage instead of accumulating."""
+        test_pipeline = pipeline.Pipeline(
+            FakeQueueReader(_get_batches(10)), self.processor, self.submitter,
+            batch_size=2, queue_size=1)
+        test_pipeline.run()
+
+        # One batch being computed, one waiting in the queue and one held by the fetch stage.
+        assert self.processor.max_batches_in_flight <= 3
+
+    def test_stop_on_idle_queue(self):
+        """Stopping the pipeline interrupts a reader waiting for messages."""
+        test_pipeline = pipeline.Pipeline(
+            IdleQueueReader(), self.processor, self.submitter, batch_size=2)
+        thread = threading.Thread(target=test_pipeline.run, daemon=True)
+        thread.start()
+
+        test_pipeline.stop()
+        thread.join(timeout=5)
+
+        assert not thread.is_alive()
+        assert not self.submitter.submit_batch.called
+
+    def test_failed_fetch_marks_providers_as_errored(self):
+        processor = FakeProcessor(fail_batch_for_tins={'tin_1'})
+        pipeline.Pipeline(
+            FakeQueueReader(_get_batches(3)), processor, self.submitter, batch_size=2
+        ).run()
+
+        submitted_providers = self._get_submitted_providers()
+        assert [provider['processing_error'] for provider in submitted_providers] == [
+            False, False, True, True, False, False
+        ]
+
+    def test_stage_error_is_raised_after_all_stages_stop(self):
+        self.submitter.submit_batch.side_effect = RuntimeError('Submission failed.')
+        test_pipeline = pipeline.Pipeline(
+            FakeQueueReader(_get_batches(5)), self.processor, self.submitter, batch_size=2)
+
+        with pytest.raises(RuntimeError):
+            test_pipeline.run()
+
+        assert self.submitter.submit_batch.call_count == 1
+
+    def test_metrics(self):
+        test_pipeline = pipeline.Pipeline(
+            FakeQueueReader(_get_batches(3)), self.processor, self.submitter, batch_size=2)
+        test_pipeline.run()
+
+        metrics = test_pipeline.get_metrics()
+        assert set(metrics['stages']) == {'fetch', 'compute', 'submit'}
+        assert all(stage['batches'] == 3 for stage in metrics['stages'].values())
+        assert all(0.0 <= stage['occupancy'] <= 1.0 for stage in metrics['stages'].values())
+        assert metrics['queue_sizes'] == {'compute': 0, 'submit': 0}
@@ -2,11 +2,12 @@
 from datetime import date
 
 from claims_to_quality.analyzer.datasource import claim_reader
+from claims_to_quality.analyzer.models import claim_batch
 from claims_to_quality.analyzer.processing import process
 from claims_to_quality.analyzer.submission import qpp_measurement_set
 from claims_to_quality.lib.helpers import mocking_config
 from claims_to_quality.lib.sqs_methods.mock_message import MockMessage
-from claims_to_quality.lib.teradata_methods import row_handling
+from claims_to_quality.lib.teradata_methods import row_handling, teradata_errors
 
 import mock
 
@@ -130,6 +131,43 @@ class TestProcessBatchMessages:
 
         safe_process_provider.assert_called_once_with(expected_batch_claims_data, expected_provider)
 
+    @mock.patch('claims_to_quality.analyzer.processing.process.Processor._safe_process_provider')
+    @mock.patch('claims_to_quality.analyzer.datasource.claim_reader.config')
+    @mock.patch(
+        'claims_to_quality.analyzer.datasource.claim_reader.'
+        'stream_claims_from_teradata_batch_provider')
+    @mock.patch(
+        'claims_to_quality.lib.connectors.teradata_connector.test_teradata_connection')
+    def test_process_batch_messages_columnar(
+            self, test_connection, stream_claims_from_teradata_batch_provider,
+            mock_config, safe_process_provider):
+        """Test process_batch_messages builds the batch as a ClaimBatch if configured to."""
+        test_connection.return_value = True
+
+        _, rows = row_handling.csv_to_query_output('tests/assets/test_single_claim.csv')
+        stream_claims_from_teradata_batch_provider.return_value = iter(rows)
+
+        mock_config.get.side_effect = mocking_config.config_side_effect({
+            'teradata.access_layer_name': 'access_layer_name',
+            'hide_sensitive_information': False
+        })
+
+        processor = self.processor
+        processor.columnar_batches = True
+        processor.claim_reader.hide_sensitive_information = False
+
+        mock_message = MockMessage(
+            body='{{"tin": "{tin}", "npi": "{npi}"}}'.format(tin='tax_num', npi='npi_num'))
+
+        processor.process_batch_messages([mock_message])
+
+        expected_provider = {'tin': 'tax_num', 'npi': 'npi_num', 'message': mock_message}
+        expected_batch_claims_data = {('tax_num', 'npi_num'): get_single_claim_with_quality_codes()}
+
+        safe_process_provider.assert_called_once_with(expected_batch_claims_data, expected_provider)
+        batch_claims_data = safe_process_provider.call_args[0][0]
+        assert isinstance(batch_claims_data, claim_batch.ClaimBatch)
+
     @mock.patch('claims_to_quality.analyzer.processing.process.Processor._safe_process_provider')
     @mock.patch('claims_to_quality.analyzer.datasource.claim_reader.config')
     @mock.patch(
@@ -161,6 +199,95 @@ class TestProcessBatchMessages:
         assert not safe_process_provider.called
 
 
+class TestProcessStreamedBatch:
+    """Test process_batch_messages when streaming batches."""
+
+    def setup(self):
+        """Setup resources for process batch messages."""
+        self.processor = get_processor()
+        self.processor.stream_batches = True
+        self.provider_message = MockMessage(
+            body='{{"tin": "{tin}", "npi": "{npi}"}}'.format(tin='tax_num', npi='npi_num'))
+        self.missing_provider_message = MockMessage(
+            body='{{"tin": "{tin}", "npi": "{npi}"}}'.format(tin='tax_num', npi='other_npi'))
+
+    @mock.patch('claims_to_quality.analyzer.processing.process.Processor._safe_process_provider')
+    @mock.patch(
+        'claims_to_quality.analyzer.datasource.claim_reader.ClaimsDataReader.stream_batch_from_db')
+    def test_process_streamed_batch(self, stream_batch_from_db, safe_process_provider):
+        """Providers should be processed as they are streamed, then those without claims."""
+        claims = get_single_claim_with_quality_codes()
+        stream_batch_from_db.return_value = iter([(('tax_num', 'npi_num'), claims)])
+
+        self.processor.process_batch_messages(
+            [self.missing_provider_message, self.provider_message])
+
+        expected_provider = {'tin': 'tax_num', 'npi': 'npi_num', 'message': self.provider_message}
+        expected_missing_provider = {
+            'tin': 'tax_num', 'npi': 'other_npi', 'message': self.missing_provider_message}
+        assert safe_process_provider.call_args_list == [
+            mock.call({('tax_num', 'npi_num'): claims}, expected_provider),
+            mock.call({}, expected_missing_provider),
+        ]
+
+    @mock.patch('claims_to_quality.analyzer.processing.process.Processor._safe_process_provider')
+    @mock.patch('claims_to_quality.analyzer.calculation.ct_scan_measure.get_batch_ct_scan_dates')
+    @mock.patch(
+        'claims_to_quality.analyzer.calculation.measure_407.Measure407.get_batch_mssa_date_ranges')
+    @mock.patch(
+        'claims_to_quality.analyzer.calculation.measure_46.Measure46.get_batch_discharge_dates')
+    @mock.patch(
+        'claims_to_quality.analyzer.datasource.claim_reader.ClaimsDataReader.stream_batch_from_db')
+    @mock.patch('claims_to_quality.lib.connectors.teradata_connector.teradata_connection')
+    def test_process_streamed_batch_lookups(
+            self, teradata_connection, stream_batch_from_db, get_batch_discharge_dates,
+            get_batch_mssa_date_ranges, get_batch_ct_scan_dates, safe_process_provider):
+        """The batch lookups are made for each provider as it is streamed."""
+        processor = process.Processor(
+            start_date=date(2017, 1, 1),
+            end_date=date.today(),
+            measures=['046', '407', '415', '416'],
+            infer_performance_period=False,
+            stream_batches=True)
+        other_provider_message = MockMessage(
+            body='{{"tin": "{tin}", "npi": "{npi}"}}'.format(tin='tax_num', npi='other_npi'))
+        claims = get_single_claim_with_quality_codes()
+        stream_batch_from_db.return_value = iter([
+            (('tax_num', 'npi_num'), claims), (('tax_num', 'other_npi'), claims)])
+
+        processor.process_batch_messages([self.provider_message, other_provider_message])
+
+        batches = [{('tax_num', 'npi_num'): claims}, {('tax_num', 'other_npi'): claims}]
+        assert get_batch_discharge_dates.call_args_list == [mock.call(batch) for batch in batches]
+        assert get_batch_mssa_date_ranges.call_args_list == [mock.call(batch) for batch in batches]
+        assert get_batch_ct_scan_dates.call_args_list == [
+            mock.call(processor.ct_scan_calculators, batch) for batch in batches]
+
+    @mock.patch('claims_to_quality.analyzer.processing.process.Processor._safe_process_provider')
+    @mock.patch('claims_to_quality.analyzer.processing.process.Processor._get_batch')
+    @mock.patch('claims_to_quality.lib.connectors.teradata_connector.teradata_connection')
+    @mock.patch(
+        'claims_to_quality.analyzer.datasource.claim_reader.ClaimsDataReader.stream_batch_from_db')
+    def test_process_streamed_batch_error(
+            self, stream_batch_from_db, teradata_connection, get_batch, safe_process_provider):
+        """If streaming fails, the remaining providers should be loaded as a batch."""
+        claims = get_single_claim_with_quality_codes()
+
+        def stream(*args, **kwargs):
+            yield ('tax_num', 'npi_num'), claims
+            raise teradata_errors.TeradataError('DatabaseError')
+
+        stream_batch_from_db.side_effect = stream
+        get_batch.return_value = {}
+
+        self.processor.process_batch_messages(
+            [self.provider_message, self.missing_provider_message])
+
+        get_batch.assert_called_once_with(tin_list=('tax_num',), npi_list=('other_npi',))
+        assert teradata_connection.called
+        assert safe_process_provider.call_count == 2
+
+
 class TestSafeProcessProvider:
     """Tests for _safe_process_provider."""
 
@@ -186,9 +313,11 @@ class TestSafeProcessProvider:
         processor = self.processor
         initial_count = processor.count
         processor.remove_messages = True
-        processor.claim_reader.hide_sensitive_information = False
 
-        batch_claims_data = processor.claim_reader.load_batch_from_db(
+        # Load claims without the reader's code filters, which would drop every test claim.
+        reader = claim_reader.ClaimsDataReader()
+        reader.hide_sensitive_information = False
+        batch_claims_data = reader.load_batch_from_db(
             ['tax_num'], ['npi_num'], date.today(), date.today())
 
         mock_message = MockMessage(
@@ -324,3 +453,25 @@ class TestProcessProvider:
             claims_data=claims_data,
         )
         assert not measurement_set.is_empty()
+
+    def test_calculate_measures_sharded(self):
+        """Test that sharded measures use the results of the sharded executor."""
+        claims_data = get_single_claim_with_quality_codes()
+        sharded_results = {
+            'eligible_population_exclusion': 0,
+            'eligible_population_exception': 0,
+            'performance_met': 1,
+            'performance_not_met': 0,
+            'eligible_population': 1
+        }
+        self.processor.sharded_executor = mock.MagicMock()
+        self.processor.sharded_executor.execute.return_value = {'047': sharded_results}
+
+        with mock.patch.object(self.processor, '_calculate_measure') as calculate_measure:
+            measurement_set = self.processor._calculate_measures(
+                get_empty_measurement_set(), claims_data, 'tin', 'npi',
+                date(2017, 1, 1), date(2017, 12, 31))
+
+        calculate_measure.assert_not_called()
+        self.processor.sharded_executor.should_shard.assert_called_once_with(claims_data)
+        assert measurement_set.data['measurements'][0]['value']['performanceMet'] == 1
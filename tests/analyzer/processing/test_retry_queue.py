@@ -0,0 +1,43 @@
+"""Tests for the delayed retry queue."""
+import concurrent.futures
+import threading
+
+from claims_to_quality.analyzer.processing import retry_queue
+
+
+class TestDelayedRetryQueue():
+    """Tests for the DelayedRetryQueue class."""
+
+    def setup(self):
+        """Create a retry queue running on a thread pool."""
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=2)
+        self.queue = retry_queue.DelayedRetryQueue(self.executor)
+
+    def teardown(self):
+        """Stop the queue and its executor."""
+        self.queue.close()
+        self.executor.shutdown()
+
+    def test_retries_run_in_due_order(self):
+        calls = []
+        done = threading.Event()
+
+        def record(name):
+            calls.append(name)
+            if len(calls) == 2:
+                done.set()
+
+        assert self.queue.schedule(0.2, record, 'second')
+        assert self.queue.schedule(0.0, record, 'first')
+
+        assert done.wait(timeout=5)
+        assert calls == ['first', 'second']
+
+    def test_close_discards_retries_not_due(self):
+        calls = []
+        self.queue.schedule(60, calls.append, 'retry')
+
+        assert len(self.queue) == 1
+        assert self.queue.close() == 1
+        assert not self.queue.schedule(0, calls.append, 'retry')
+        assert calls == []
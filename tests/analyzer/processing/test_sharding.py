@@ -0,0 +1,102 @@
+"""Tests for the beneficiary-sharded calculation of measures."""
+import datetime
+
+from claims_to_quality.analyzer import measure_mapping
+from claims_to_quality.analyzer.models import claim_record
+from claims_to_quality.analyzer.processing import sharding
+
+
+def _get_claim(bene_sk, procedure_codes):
+    # Claims are sent to the pool processes, so they must be picklable claim records.
+    return claim_record.ClaimRecord(
+        bene_sk=bene_sk,
+        clm_from_dt=datetime.date(2018, 1, 1),
+        clm_ptnt_birth_dt=datetime.date(2000, 1, 1),
+        claim_lines=[
+            claim_record.ClaimLineRecord(clm_line_hcpcs_cd=code) for code in procedure_codes
+        ]
+    )
+
+
+def _get_claims(num_beneficiaries):
+    """Return claims scoring differently across the strata of measure 226."""
+    quality_codes = [['G9902'], ['G9902', 'G9906'], ['G9903'], []]
+    return [
+        _get_claim('bene_{}'.format(index), ['90791'] + quality_codes[index % len(quality_codes)])
+        for index in range(num_beneficiaries)
+    ]
+
+
+class TestBeneficiaryShardedExecutor():
+    """Tests for the BeneficiaryShardedExecutor class."""
+
+    def setup(self):
+        """Initialize the measure calculators."""
+        self.measure_calculators = measure_mapping.get_measure_calculators(['226', '407'])
+        self.executor = sharding.BeneficiaryShardedExecutor(
+            self.measure_calculators, min_claims=10, num_processes=2)
+
+    def teardown(self):
+        """Stop the process pool."""
+        self.executor.close()
+
+    def test_shardable_measures(self):
+        assert self.executor.shardable_measures == {'226'}
+
+    def test_start(self):
+        """The pool is forked once, ahead of the first sharded provider."""
+        self.executor.start()
+        pool = self.executor._pool
+        self.executor.start()
+
+        assert pool is not None
+        assert self.executor._get_pool() is pool
+
+    def test_should_shard(self):
+        assert self.executor.should_shard(_get_claims(10))
+        assert not self.executor.should_shard(_get_claims(9))
+
+    def test_sharded_results_equal_unsharded_results(self):
+        claims = _get_claims(20)
+        sharded_results = self.executor.execute({'226': claims, '407': claims})
+
+        assert set(sharded_results) == {'226'}
+        assert sharded_results['226'] == self.measure_calculators['226'].execute(claims)
+
+    def test_shards_without_claims(self):
+        claims = _get_claims(1)
+        sharded_results = self.executor.execute({'226': claims})
+
+        assert sharded_results['226'] == self.measure_calculators['226'].execute(claims)
+
+
+def test_get_shard_is_stable():
+    assert sharding.get_shard('bene_1', 4) == sharding.get_shard('bene_1', 4)
+    assert {sharding.get_shard('bene_{}'.format(index), 4) for index in range(100)} == {
+        0, 1, 2, 3}
+
+
+def test_merge_results():
+    shard_results = [
+        {'performance_met': 1, 'performance_not_met': 0, 'eligible_population': 1},
+        {'performance_met': 2, 'performance_not_met': 3, 'eligible_population': 5},
+    ]
+    assert sharding.merge_results(shard_results) == {
+        'performance_met': 3, 'performance_not_met': 3, 'eligible_population': 6}
+
+
+def test_merge_results_with_multiple_strata():
+    shard_results = [
+        [
+            {'name': 'overall', 'results': {'performance_met': 1}},
+            {'name': 'intervention', 'results': {'performance_met': 0}},
+        ],
+        [
+            {'name': 'intervention', 'results': {'performance_met': 2}},
+            {'name': 'overall', 'results': {'performance_met': 3}},
+        ],
+    ]
+    assert sharding.merge_results(shard_results) == [
+        {'name': 'overall', 'results': {'performance_met': 4}},
+        {'name': 'intervention', 'results': {'performance_met': 2}},
+    ]
@@ -1,13 +1,20 @@
 """Test processing provider."""
+import json
+import threading
 from datetime import date
 
 from claims_to_quality.analyzer.processing import submit
 from claims_to_quality.analyzer.submission import qpp_measurement_set
 from claims_to_quality.config import config
+from claims_to_quality.lib.helpers import mocking_config
 from claims_to_quality.lib.sqs_methods.mock_message import MockMessage
 
 import mock
 
+import pytest
+
+import requests
+
 
 def get_submitter():
     """Build a Submitter object to use in tests."""
@@ -106,7 +113,7 @@ class TestSendSubmissions:
         measurement_set = get_measurement_set()
         self.submitter._send_submissions('tin', 'npi', measurement_set)
         mock_api_submitter.submit_to_measurement_sets_api.assert_called_once_with(
-            measurement_set, patch_update=False
+            measurement_set, patch_update=False, previous_measurements=None
         )
 
     def test_process_after_submission_delete(self):
@@ -117,8 +124,23 @@ class TestSendSubmissions:
         }
         self.submitter.remove_messages = True
         self.submitter._process_after_submission(mock_provider_processed)
+        assert mock_provider_processed['message'].deleted is False
+
+        self.submitter.flush_deletes()
         assert mock_provider_processed['message'].deleted is True
 
+    def test_process_after_submission_deletes_in_groups(self):
+        """Deletions are flushed once a full DeleteMessageBatch group is pending."""
+        self.submitter.remove_messages = True
+        providers = [
+            {'npi': str(index), 'message': MockMessage(body='{}'), 'processing_error': False}
+            for index in range(11)
+        ]
+        for provider in providers:
+            self.submitter._process_after_submission(provider)
+
+        assert [provider['message'].deleted for provider in providers] == [True] * 10 + [False]
+
     def test_process_after_submission_no_delete(self):
         """Remove message after submission."""
         self.submitter.remove_messages = False
@@ -171,7 +193,214 @@ class TestSendSubmissions:
 
         self.submitter.submit_batch(providers)
 
-        assert len(mock_api_submitter.mock_calls) == 1
+        mock_api_submitter.prefetch_measurement_set_ids.assert_called_once_with(
+            [mock_provider_processed['measurement_set']])
+        assert mock_api_submitter.submit_to_measurement_sets_api.call_count == 1
         assert mock_provider_processed['message'].deleted is True
         assert mock_provider_processed_no_measurement_set['message'].deleted is True
         assert mock_provider_processed_empty_measurement_set['message'].deleted is True
+
+    @mock.patch('claims_to_quality.analyzer.processing.submit.api_submitter')
+    def test_submit_batch_http_error(self, mock_api_submitter):
+        """Messages of providers whose submission failed are not deleted."""
+        self.submitter.send_submissions = True
+        self.submitter.remove_messages = True
+        providers = [
+            {
+                'tin': 'tax_num', 'npi': npi, 'processing_error': False,
+                'measurement_set': get_measurement_set(), 'message': MockMessage(body='{}')
+            }
+            for npi in ('npi_0', 'npi_1', 'npi_2')
+        ]
+        mock_api_submitter.submit_to_measurement_sets_api.side_effect = [
+            None, requests.exceptions.HTTPError('HTTP error 500.'), None
+        ]
+
+        self.submitter.submit_batch(providers)
+
+        assert [provider['message'].deleted for provider in providers] == [True, False, True]
+
+    @mock.patch('claims_to_quality.analyzer.processing.submit.api_submitter')
+    def test_submit_batch_connection_error(self, mock_api_submitter):
+        """Other providers of the batch are handled before non-retryable errors are raised."""
+        heartbeat = mock.Mock()
+        submitter = submit.Submitter(
+            remove_messages=True, send_submissions=True, heartbeat=heartbeat)
+        providers = [
+            {
+                'tin': 'tax_num', 'npi': npi, 'processing_error': False,
+                'measurement_set': get_measurement_set(), 'message': MockMessage(body='{}')
+            }
+            for npi in ('npi_0', 'npi_1', 'npi_2')
+        ]
+        mock_api_submitter.is_retryable_error.return_value = False
+        mock_api_submitter.submit_to_measurement_sets_api.side_effect = [
+            requests.exceptions.ConnectionError('Connection refused.'), None, None
+        ]
+
+        with pytest.raises(requests.exceptions.ConnectionError):
+            submitter.submit_batch(providers)
+
+        assert [provider['message'].deleted for provider in providers] == [False, True, True]
+        untracked = [message for call in heartbeat.untrack.call_args_list for message in call[0][0]]
+        assert sorted(message.receipt_handle for message in untracked) == sorted(
+            provider['message'].receipt_handle for provider in providers)
+        submitter.close()
+
+    @mock.patch('claims_to_quality.analyzer.processing.submit.api_submitter')
+    def test_submit_batch_untracks_processed_messages(self, mock_api_submitter):
+        """The visibility of messages is no longer extended once their provider is processed."""
+        heartbeat = mock.Mock()
+        submitter = submit.Submitter(
+            remove_messages=True, send_submissions=True, heartbeat=heartbeat)
+        providers = [
+            {
+                'tin': 'tax_num', 'npi': npi, 'processing_error': processing_error,
+                'measurement_set': get_measurement_set(), 'message': MockMessage(body='{}')
+            }
+            for npi, processing_error in (('npi_0', True), ('npi_1', False))
+        ]
+
+        submitter.submit_batch(providers)
+        submitter.close()
+
+        heartbeat.untrack.assert_has_calls([
+            mock.call([providers[0]['message']]), mock.call([providers[1]['message']])
+        ])
+        assert [provider['message'].deleted for provider in providers] == [False, True]
+
+    @mock.patch('claims_to_quality.analyzer.processing.submit.api_submitter')
+    def test_submit_batch_concurrently(self, mock_api_submitter):
+        """Providers of a batch are submitted concurrently, up to max_in_flight."""
+        submitter = submit.Submitter(
+            remove_messages=True, send_submissions=True, max_in_flight=2)
+        # Both submissions must be in flight at the same time for the barrier to be passed.
+        barrier = threading.Barrier(2, timeout=5)
+        mock_api_submitter.submit_to_measurement_sets_api.side_effect = (
+            lambda *args, **kwargs: barrier.wait())
+        providers = [
+            {
+                'tin': 'tax_num', 'npi': npi, 'processing_error': False,
+                'measurement_set': get_measurement_set(), 'message': MockMessage(body='{}')
+            }
+            for npi in ('npi_0', 'npi_1')
+        ]
+
+        submitter.submit_batch(providers)
+        submitter.close()
+
+        assert all(provider['message'].deleted for provider in providers)
+
+    @mock.patch('claims_to_quality.analyzer.processing.submit.api_submitter')
+    def test_submit_batch_retries_later(self, mock_api_submitter):
+        """Measurement sets failing with a retryable error are resubmitted in the background."""
+        submitter = submit.Submitter(remove_messages=True, send_submissions=True)
+        submitter.retry_initial_delay = 0
+        mock_api_submitter.is_retryable_error.return_value = True
+        mock_api_submitter.submit_to_measurement_sets_api.side_effect = [
+            requests.exceptions.HTTPError('HTTP error 429.'), None
+        ]
+        message = MockMessage(body='{}')
+        deleted = threading.Event()
+        message.delete = deleted.set
+        provider = {
+            'tin': 'tax_num', 'npi': 'npi_num', 'processing_error': False,
+            'measurement_set': get_measurement_set(), 'message': message
+        }
+
+        submitter.submit_batch([provider])
+
+        assert deleted.wait(timeout=5)
+        assert mock_api_submitter.submit_to_measurement_sets_api.call_count == 2
+        submitter.close()
+
+    @mock.patch('claims_to_quality.analyzer.processing.submit.api_submitter')
+    def test_submit_batch_gives_up_after_max_attempts(self, mock_api_submitter):
+        submitter = submit.Submitter(remove_messages=True, send_submissions=True)
+        submitter.retry_initial_delay = 0
+        submitter.retry_max_attempts = 1
+        mock_api_submitter.is_retryable_error.return_value = True
+        mock_api_submitter.submit_to_measurement_sets_api.side_effect = (
+            requests.exceptions.HTTPError('HTTP error 429.'))
+        provider = {
+            'tin': 'tax_num', 'npi': 'npi_num', 'processing_error': False,
+            'measurement_set': get_measurement_set(), 'message': MockMessage(body='{}')
+        }
+
+        submitter.submit_batch([provider])
+        submitter.close()
+
+        assert mock_api_submitter.submit_to_measurement_sets_api.call_count == 1
+        assert provider['message'].deleted is False
+
+    @mock.patch('claims_to_quality.analyzer.processing.submit.config')
+    @mock.patch('claims_to_quality.analyzer.processing.submit.api_submitter')
+    def test_send_submissions_skips_unchanged(self, mock_api_submitter, mock_config, tmpdir):
+        """Measurement sets identical to the last submitted one are not resubmitted."""
+        mock_config.get.side_effect = mocking_config.config_side_effect({
+            'submission.ledger_path': str(tmpdir.join('ledger.sqlite'))
+        })
+        submitter = submit.Submitter(
+            remove_messages=True, send_submissions=True, skip_unchanged_submissions=True)
+        measurement_set = get_measurement_set()
+
+        submitter._send_submissions('tin', 'npi', measurement_set)
+        submitter._send_submissions('tin', 'npi', measurement_set)
+        assert mock_api_submitter.submit_to_measurement_sets_api.call_count == 1
+        assert submitter.count_skipped == 1
+
+        measurement_set.data['measurements'][0]['value']['performanceMet'] += 1
+        submitter._send_submissions('tin', 'npi', measurement_set)
+        assert mock_api_submitter.submit_to_measurement_sets_api.call_count == 2
+        submitter.close()
+
+    @mock.patch('claims_to_quality.analyzer.processing.submit.config')
+    @mock.patch('claims_to_quality.analyzer.processing.submit.api_submitter')
+    def test_send_submissions_forgets_missing_measurement_set(
+            self, mock_api_submitter, mock_config, tmpdir):
+        """A measurement set not found by the API is submitted again, even if unchanged."""
+        mock_config.get.side_effect = mocking_config.config_side_effect({
+            'submission.ledger_path': str(tmpdir.join('ledger.sqlite'))
+        })
+        submitter = submit.Submitter(
+            remove_messages=True, send_submissions=True, skip_unchanged_submissions=True)
+        measurement_set = get_measurement_set()
+        submitter._send_submissions('tin', 'npi', measurement_set)
+
+        measurement_set.data['measurements'][0]['value']['performanceMet'] += 1
+        mock_api_submitter.submit_to_measurement_sets_api.side_effect = (
+            requests.exceptions.HTTPError('HTTP error 404', response=mock.Mock(status_code=404)))
+        with pytest.raises(requests.exceptions.HTTPError):
+            submitter._send_submissions('tin', 'npi', measurement_set)
+
+        measurement_set.data['measurements'][0]['value']['performanceMet'] -= 1
+        mock_api_submitter.submit_to_measurement_sets_api.side_effect = None
+        submitter._send_submissions('tin', 'npi', measurement_set)
+
+        assert mock_api_submitter.submit_to_measurement_sets_api.call_count == 3
+        assert submitter.count_skipped == 0
+        submitter.close()
+
+    @mock.patch('claims_to_quality.analyzer.processing.submit.config')
+    @mock.patch('claims_to_quality.analyzer.processing.submit.api_submitter')
+    def test_send_submissions_patches_from_ledger(
+            self, mock_api_submitter, mock_config, tmpdir):
+        """PATCH updates are computed from the measurements last submitted."""
+        mock_config.get.side_effect = mocking_config.config_side_effect({
+            'submission.ledger_path': str(tmpdir.join('ledger.sqlite'))
+        })
+        submitter = submit.Submitter(
+            remove_messages=True, send_submissions=True, patch_update=True,
+            skip_unchanged_submissions=True)
+        measurement_set = get_measurement_set()
+        submitted_measurements = json.loads(json.dumps(measurement_set.data['measurements']))
+
+        submitter._send_submissions('tin', 'npi', measurement_set)
+        measurement_set.data['measurements'][0]['value']['performanceMet'] += 1
+        submitter._send_submissions('tin', 'npi', measurement_set)
+
+        assert mock_api_submitter.submit_to_measurement_sets_api.call_args_list[0][1][
+            'previous_measurements'] is None
+        assert mock_api_submitter.submit_to_measurement_sets_api.call_args_list[1][1][
+            'previous_measurements'] == submitted_measurements
+        submitter.close()
@@ -0,0 +1,124 @@
+"""Tests for the multi-process worker pool."""
+import multiprocessing
+import threading
+
+from claims_to_quality.analyzer.processing import worker_pool
+
+import mock
+
+
+def _get_worker_pool(num_workers=2, shutdown_timeout=5):
+    return worker_pool.WorkerPool(
+        queue_name='queue',
+        batch_size=2,
+        processor_kwargs={},
+        submitter_kwargs={},
+        num_workers=num_workers,
+        shutdown_timeout=shutdown_timeout
+    )
+
+
+def _count_until_stopped(settings, stop_event, counters):
+    """Worker counting one processed provider, then waiting for the stop event."""
+    worker_pool._add_counts(counters, {'count': 1, 'count_no_claims': 0, 'count_errors': 0})
+    stop_event.wait()
+
+
+def _ignore_stop(settings, stop_event, counters):
+    """Worker which never stops by itself."""
+    threading.Event().wait()
+
+
+class FakeProcessor(object):
+    """Processor counting the providers of each batch."""
+
+    def __init__(self, **kwargs):
+        """Initialize a FakeProcessor with a mock session."""
+        self.session = mock.MagicMock()
+        self.sharded_executor = None
+        self.count = 0
+        self.count_no_claims = 0
+        self.count_errors = 0
+
+    def process_batch_messages(self, messages):
+        self.count += len(messages)
+        self.count_errors += 1
+        return messages
+
+
+class FakeQueueReader(object):
+    """Queue reader yielding three batches, then waiting to be stopped."""
+
+    def __init__(self, queue_name, pull_batch_size, heartbeat=None):
+        """Initialize a FakeQueueReader."""
+
+    def read_batch(self, batch_size, stop_event=None):
+        for batch in (['a', 'b'], ['c', 'd'], ['e']):
+            yield batch
+        stop_event.set()
+
+
+@mock.patch('claims_to_quality.analyzer.processing.worker_pool.submit.Submitter')
+@mock.patch(
+    'claims_to_quality.analyzer.processing.worker_pool.process.Processor', new=FakeProcessor)
+@mock.patch(
+    'claims_to_quality.analyzer.processing.worker_pool.queue_reader.PrefetchingQueueReader',
+    new=FakeQueueReader)
+def test_run_worker(submitter):
+    """Workers process and submit batches until stopped, and report their counts."""
+    pool = _get_worker_pool()
+    stop_event = multiprocessing.Event()
+
+    worker_pool.run_worker(pool._get_worker_settings(), stop_event, pool.counters)
+
+    assert submitter.return_value.submit_batch.call_count == 3
+    assert pool.get_counts() == {'count': 5, 'count_no_claims': 0, 'count_errors': 3}
+
+
+@mock.patch('claims_to_quality.analyzer.processing.worker_pool.submit.Submitter')
+@mock.patch('claims_to_quality.analyzer.processing.worker_pool.visibility_heartbeat')
+@mock.patch('claims_to_quality.analyzer.processing.worker_pool.process.Processor')
+@mock.patch(
+    'claims_to_quality.analyzer.processing.worker_pool.queue_reader.PrefetchingQueueReader')
+def test_run_worker_starts_sharding_pool_first(
+        queue_reader, processor, visibility_heartbeat, submitter):
+    """The sharding pool is forked before the worker starts any thread."""
+    calls = mock.Mock()
+    calls.attach_mock(processor.return_value.sharded_executor.start, 'start_sharding_pool')
+    calls.attach_mock(visibility_heartbeat.get_heartbeat, 'get_heartbeat')
+    calls.attach_mock(queue_reader, 'queue_reader')
+    calls.attach_mock(submitter, 'submitter')
+    queue_reader.return_value.read_batch.return_value = []
+    pool = _get_worker_pool()
+
+    worker_pool.run_worker(pool._get_worker_settings(), multiprocessing.Event(), pool.counters)
+
+    assert [call[0] for call in calls.mock_calls][:4] == [
+        'start_sharding_pool', 'get_heartbeat', 'queue_reader', 'submitter']
+    assert processor.return_value.sharded_executor.close.called
+
+
+@mock.patch('claims_to_quality.analyzer.processing.worker_pool._start_worker')
+def test_counts_are_aggregated_across_workers(start_worker):
+    start_worker.side_effect = _count_until_stopped
+    pool = _get_worker_pool(num_workers=3)
+
+    pool.start()
+    pool.stop()
+    pool.join()
+
+    assert pool.get_counts() == {'count': 3, 'count_no_claims': 0, 'count_errors': 0}
+    assert [worker.exitcode for worker in pool.workers] == [0, 0, 0]
+
+
+@mock.patch('claims_to_quality.analyzer.processing.worker_pool._start_worker')
+def test_workers_are_terminated_after_shutdown_timeout(start_worker):
+    start_worker.side_effect = _ignore_stop
+    pool = _get_worker_pool(num_workers=1, shutdown_timeout=0.1)
+
+    pool.start()
+    pool.stop()
+    pool.join()
+
+    assert not pool.workers[0].is_alive()
+    assert pool.workers[0].exitcode != 0
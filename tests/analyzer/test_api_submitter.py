@@ -1,9 +1,11 @@
 """Test api_submitter methods."""
 # TODO: Add test for bad data format returned by get requests?
 import datetime
+import json
 
-from claims_to_quality.analyzer.submission import api_submitter
+from claims_to_quality.analyzer.submission import api_submitter, measurement_set_cache
 from claims_to_quality.analyzer.submission import qpp_measurement_set
+from claims_to_quality.config import config
 from claims_to_quality.lib.helpers import mocking_config
 
 import mock
@@ -32,7 +34,7 @@ class MockResponse:
 
 
 def mocked_requests_get(*args, **kwargs):
-    """Function to mock requests.get."""
+    """Function to mock Session.get."""
     data_perfyear_2017 = {
         'data': {
             'submissions': [
@@ -81,6 +83,7 @@ class TestAPISubmitterFunctions():
 
     def setup(self):
         """Setup base submission object for these tests."""
+        measurement_set_cache.get_cache().clear()
         self.measurement_set = qpp_measurement_set.MeasurementSet(
             tin='9' * 9,
             npi='8' * 10,
@@ -111,7 +114,7 @@ class TestAPISubmitterFunctions():
         actual = api_submitter.get_headers()
         assert actual == self.cookie_header
 
-    @mock.patch('requests.post')
+    @mock.patch('requests.Session.post')
     @mock.patch('claims_to_quality.analyzer.submission.api_submitter.config')
     def test_post_to_measurement_sets_api(self, mock_config, mock_post):
         mock_config.get.side_effect = mocking_config.config_side_effect({
@@ -126,7 +129,7 @@ class TestAPISubmitterFunctions():
             data=self.measurement_set.to_json(),
             headers=self.no_cookie_header)
 
-    @mock.patch('requests.put')
+    @mock.patch('requests.Session.put')
     @mock.patch('claims_to_quality.analyzer.submission.api_submitter.config')
     def test_put_to_measurement_sets_api(self, mock_config, mock_put):
         mock_config.get.side_effect = mocking_config.config_side_effect({
@@ -144,7 +147,28 @@ class TestAPISubmitterFunctions():
             data=self.measurement_set.to_json(),
             headers=self.no_cookie_header)
 
-    @mock.patch('requests.get')
+    @mock.patch('claims_to_quality.analyzer.submission.submission_ledger.forget_submission')
+    @mock.patch('requests.Session.delete')
+    @mock.patch('claims_to_quality.analyzer.submission.api_submitter.config')
+    def test_delete_measurement_set_api(self, mock_config, mock_delete, forget_submission):
+        """Deleting a measurement set forgets the provider's cached ID and ledger entry."""
+        mock_config.get.side_effect = mocking_config.config_side_effect({
+            'submission.api_token': 'api_token',
+            'submission.cookie': None,
+            'submission.endpoint': 'http://test_endpoint/'
+        })
+        mock_delete.return_value = MockResponse({}, 200)
+        measurement_set_cache.get_cache().set('tin', 'npi', 2017, 10)
+
+        api_submitter.delete_measurement_set_api(10, 'tin', 'npi', 2017)
+
+        mock_delete.assert_called_with(
+            url='http://test_endpoint/measurement-sets/10', headers=self.no_cookie_header)
+        assert measurement_set_cache.get_cache().get(
+            'tin', 'npi', 2017) is measurement_set_cache.MISSING
+        forget_submission.assert_called_once_with('tin', 'npi', 2017)
+
+    @mock.patch('requests.Session.get')
     @mock.patch('claims_to_quality.analyzer.submission.api_submitter.config')
     def test_get_existing_submissions_exists(self, mock_config, mock_get):
         mock_config.get.side_effect = mocking_config.config_side_effect({
@@ -178,7 +202,7 @@ class TestAPISubmitterFunctions():
 
         assert existing_submissions_in_same_year == {'performanceYear': 2017}
 
-    @mock.patch('requests.get')
+    @mock.patch('requests.Session.get')
     @mock.patch('claims_to_quality.analyzer.submission.api_submitter.config')
     def test_get_existing_submissions_does_not_exist(self, mock_config, mock_get):
         mock_config.get.side_effect = mocking_config.config_side_effect({
@@ -268,6 +292,58 @@ class TestAPISubmitterFunctions():
         assert response.status_code == 200
         mock_patch_to_api.assert_called_with(self.measurement_set, '007')
 
+    @mock.patch('claims_to_quality.analyzer.submission.api_submitter.get_existing_submissions')
+    @mock.patch(
+        'claims_to_quality.analyzer.submission.api_submitter._patch_to_measurement_sets_api')
+    def test_submit_to_measurement_sets_api_patches_changed_measurements(
+            self, mock_patch_to_api, mock_get_submission):
+        """Only the measurements which differ from the existing measurement set are patched."""
+        measure_results = {
+            'eligible_population_exclusion': 0,
+            'eligible_population_exception': 0,
+            'performance_met': 1,
+            'performance_not_met': 1,
+            'eligible_population': 42
+        }
+        self.measurement_set.add_measure('047', measure_results)
+        self.measurement_set.add_measure('130', measure_results)
+        existing_measurements = json.loads(json.dumps(self.measurement_set.data['measurements']))
+        existing_measurements[1]['value']['performanceMet'] = 0
+        mock_get_submission.return_value = {
+            'measurementSets': [{
+                'category': 'quality', 'submissionMethod': 'claims', 'id': '007',
+                'measurements': existing_measurements
+            }]
+        }
+        mock_patch_to_api.return_value = MockResponse(json_data={}, status_code=200)
+
+        api_submitter._submit_to_measurement_sets_api(self.measurement_set, patch_update=True)
+        mock_patch_to_api.assert_called_once_with(
+            self.measurement_set, '007', measurements=self.measurement_set.data['measurements'][1:])
+
+        # Nothing is sent if no measurement changed.
+        mock_patch_to_api.reset_mock()
+        response = api_submitter._submit_to_measurement_sets_api(
+            self.measurement_set,
+            patch_update=True,
+            previous_measurements=self.measurement_set.data['measurements']
+        )
+        assert response is None
+        mock_patch_to_api.assert_not_called()
+
+    @mock.patch('requests.Session.patch')
+    @mock.patch('claims_to_quality.analyzer.submission.api_submitter.config')
+    def test_patch_to_measurement_sets_api_with_measurements(self, mock_config, mock_patch):
+        mock_config.get.side_effect = mocking_config.config_side_effect({
+            'submission.api_token': 'api_token',
+            'submission.cookie': None,
+            'submission.endpoint': 'http://test_endpoint/'
+        })
+        api_submitter._patch_to_measurement_sets_api(
+            self.measurement_set, 10, measurements=[{'measureId': '047'}])
+        assert json.loads(mock_patch.call_args[1]['data'])['measurements'] == [
+            {'measureId': '047'}]
+
     @mock.patch('claims_to_quality.analyzer.submission.api_submitter.get_existing_submissions')
     @mock.patch('claims_to_quality.analyzer.submission.api_submitter._post_to_measurement_sets_api')
     def test_submit_to_measurement_sets_api_no_data_exists(
@@ -307,7 +383,129 @@ class TestAPISubmitterFunctions():
             )
         mock_post_to_api.assert_called_with(self.measurement_set)
 
-    @mock.patch('requests.post')
+    @mock.patch('claims_to_quality.analyzer.submission.api_submitter._get_submissions')
+    @mock.patch('claims_to_quality.analyzer.submission.api_submitter.config')
+    def test_prefetch_measurement_set_ids(self, mock_config, mock_get_submissions):
+        """Measurement set IDs are fetched page by page, once per TIN."""
+        mock_config.get.side_effect = mocking_config.config_side_effect({
+            'submission.measurement_set_cache.items_per_page': 2
+        })
+        measurement_sets = [
+            qpp_measurement_set.MeasurementSet(
+                tin='000999999',
+                npi=npi,
+                performance_start=datetime.date(2017, 1, 1),
+                performance_end=datetime.date(2017, 12, 31))
+            for npi in ('0888888888', '0777777777', '0666666666')
+        ]
+        tin = measurement_sets[0].data['submission']['taxpayerIdentificationNumber']
+        npis = [
+            measurement_set.data['submission']['nationalProviderIdentifier']
+            for measurement_set in measurement_sets
+        ]
+
+        def get_submission(npi, measurement_set_id):
+            return {
+                'nationalProviderIdentifier': npi,
+                'measurementSets': [
+                    {'category': 'quality', 'submissionMethod': 'claims', 'id': measurement_set_id}
+                ]
+            }
+
+        mock_get_submissions.side_effect = [
+            {'data': {'submissions': [
+                get_submission('other_npi', 'other_id'), get_submission(npis[0], 'id_0')]}},
+            {'data': {'submissions': [
+                {'nationalProviderIdentifier': npis[1], 'measurementSets': []}]}},
+        ]
+
+        api_submitter.prefetch_measurement_set_ids(measurement_sets)
+        cache = measurement_set_cache.get_cache()
+
+        assert mock_get_submissions.call_count == 2
+        assert mock_get_submissions.call_args[1]['start_index'] == 2
+        assert cache.get(tin, 'other_npi', 2017) == 'other_id'
+        assert cache.get(tin, npis[0], 2017) == 'id_0'
+        assert cache.get(tin, npis[1], 2017) is None
+        assert cache.get(tin, npis[2], 2017) is None
+
+        # All the providers are cached, so the API is not queried again.
+        api_submitter.prefetch_measurement_set_ids(measurement_sets)
+        assert mock_get_submissions.call_count == 2
+
+    @mock.patch('claims_to_quality.analyzer.submission.api_submitter._get_submissions')
+    def test_prefetch_measurement_set_ids_single_npi(self, mock_get_submissions):
+        """TINs with a single NPI in the batch are not paged through."""
+        api_submitter.prefetch_measurement_set_ids([self.measurement_set])
+
+        assert not mock_get_submissions.called
+        assert measurement_set_cache.get_cache().get(
+            *self._get_provider_key()) is measurement_set_cache.MISSING
+
+    @mock.patch('claims_to_quality.analyzer.submission.api_submitter._get_submissions')
+    @mock.patch('claims_to_quality.analyzer.submission.api_submitter.config')
+    def test_prefetch_measurement_set_ids_large_tin(self, mock_config, mock_get_submissions):
+        """Paging stops when a TIN has more pages of submissions than NPIs in the batch."""
+        mock_config.get.side_effect = mocking_config.config_side_effect({
+            'submission.measurement_set_cache.items_per_page': 2
+        })
+        measurement_sets = [
+            qpp_measurement_set.MeasurementSet(
+                tin='000999999',
+                npi=npi,
+                performance_start=datetime.date(2017, 1, 1),
+                performance_end=datetime.date(2017, 12, 31))
+            for npi in ('0888888888', '0777777777')
+        ]
+        tin = measurement_sets[0].data['submission']['taxpayerIdentificationNumber']
+        npis = [
+            measurement_set.data['submission']['nationalProviderIdentifier']
+            for measurement_set in measurement_sets
+        ]
+        mock_get_submissions.return_value = {'data': {'totalItems': 5000, 'submissions': [
+            {'nationalProviderIdentifier': 'other_npi', 'measurementSets': []},
+            {'nationalProviderIdentifier': npis[0], 'measurementSets': []},
+        ]}}
+
+        api_submitter.prefetch_measurement_set_ids(measurement_sets)
+        cache = measurement_set_cache.get_cache()
+
+        assert mock_get_submissions.call_count == 1
+        assert cache.get(tin, npis[0], 2017) is None
+        # The NPI may be on a page which was not fetched.
+        assert cache.get(tin, npis[1], 2017) is measurement_set_cache.MISSING
+
+    def _get_provider_key(self):
+        submission = self.measurement_set.data['submission']
+        return (
+            submission['taxpayerIdentificationNumber'],
+            submission['nationalProviderIdentifier'],
+            submission['performanceYear'],
+        )
+
+    @mock.patch('claims_to_quality.analyzer.submission.api_submitter.get_existing_submissions')
+    @mock.patch('claims_to_quality.analyzer.submission.api_submitter._put_to_measurement_sets_api')
+    def test_submit_to_measurement_sets_api_cached_id(self, mock_put_to_api, mock_get_submission):
+        """Prefetched measurement set IDs are used without querying the submissions."""
+        measurement_set_cache.get_cache().set(*self._get_provider_key(), '007')
+        mock_put_to_api.return_value = MockResponse(json_data={}, status_code=200)
+        api_submitter._submit_to_measurement_sets_api(self.measurement_set, patch_update=False)
+
+        mock_get_submission.assert_not_called()
+        mock_put_to_api.assert_called_with(self.measurement_set, '007')
+
+    @mock.patch('claims_to_quality.analyzer.submission.api_submitter._post_to_measurement_sets_api')
+    def test_submit_to_measurement_sets_api_invalidates_created_id(self, mock_post_to_api):
+        """Providers known to have no measurement set are POSTed, then looked up again."""
+        cache = measurement_set_cache.get_cache()
+        cache.set(*self._get_provider_key(), None)
+        mock_post_to_api.return_value = MockResponse(json_data={}, status_code=200)
+        api_submitter._submit_to_measurement_sets_api(self.measurement_set, patch_update=False)
+
+        mock_post_to_api.assert_called_with(self.measurement_set)
+        assert cache.get(*self._get_provider_key()) is measurement_set_cache.MISSING
+
+    @mock.patch('requests.Session.post')
     def test_scoring_preview(self, mock_post):
         """Test scoring preview."""
         json_data = {'test_key': 'test_value'}
@@ -319,7 +517,7 @@ class TestAPISubmitterFunctions():
 
         assert response_json == json_data
 
-    @mock.patch('requests.post')
+    @mock.patch('requests.Session.post')
     def test_scoring_preview_bad_response(self, mock_post):
         """Test scoring preview."""
         json_data = {'test_key': 'test_value'}
@@ -328,6 +526,19 @@ class TestAPISubmitterFunctions():
             api_submitter.get_scoring_preview(self.measurement_set)
 
 
+def test_get_session():
+    """The HTTP session is shared until it is closed."""
+    api_submitter.close_session()
+    session = api_submitter.get_session()
+
+    assert api_submitter.get_session() is session
+    assert session.get_adapter('https://qpp.cms.gov')._pool_maxsize == config.get(
+        'submission.max_in_flight')
+
+    api_submitter.close_session()
+    assert api_submitter.get_session() is not session
+
+
 def test_retry_on_fixable_request_errors():
     """Test that the retry condition returns True for relevant status codes."""
     response = mocked_requests_get('http://rate_limiting/')
@@ -337,3 +548,24 @@ def test_retry_on_fixable_request_errors():
         exception = exc
 
     assert api_submitter._retry_on_fixable_request_errors(exception)
+
+
+def test_retry_on_fixable_request_errors_without_response():
+    """HTTP errors without a response are not retried."""
+    assert not api_submitter._retry_on_fixable_request_errors(
+        requests.exceptions.HTTPError('HTTP error.'))
+
+
+@mock.patch('claims_to_quality.analyzer.submission.api_submitter.rate_limiter')
+@mock.patch('requests.Session.get')
+def test_send_request_adjusts_rate(mock_get, mock_rate_limiter):
+    """Requests are paced by the rate limiter, which slows down on rate-limiting responses."""
+    limiter = mock_rate_limiter.get_rate_limiter.return_value
+    mock_get.return_value = MockResponse({}, 429)
+    api_submitter._send_request('get', 'http://test_endpoint/submissions')
+    limiter.acquire.assert_called_once_with()
+    limiter.on_throttled.assert_called_once_with()
+
+    mock_get.return_value = MockResponse({}, 200)
+    api_submitter._send_request('get', 'http://test_endpoint/submissions')
+    limiter.on_success.assert_called_once_with()
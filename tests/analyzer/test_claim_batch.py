@@ -0,0 +1,194 @@
+"""Tests for the columnar ClaimBatch representation."""
+import datetime
+
+from claims_to_quality.analyzer.datasource import code_reader
+from claims_to_quality.analyzer.models.claim_batch import ClaimBatch, ClaimBatchBuilder
+from claims_to_quality.analyzer.models.claim_record import ClaimRecord
+from claims_to_quality.analyzer.processing import claim_filtering
+
+import numpy as np
+
+import pytest
+
+
+def _build_claim(tin, npi, splt_clm_id, bene_sk, procedure_codes, dx_codes, sex_code='1'):
+    claim = ClaimRecord.from_dict({
+        'splt_clm_id': splt_clm_id,
+        'bene_sk': bene_sk,
+        'clm_rndrg_prvdr_npi_num': npi,
+        'clm_rndrg_prvdr_tax_num': tin,
+        'clm_ptnt_birth_dt': datetime.date(1950, 1, 1),
+        'clm_bene_sex_cd': sex_code,
+        'clm_from_dt': datetime.date(2018, 3, 1),
+        'clm_thru_dt': datetime.date(2018, 3, 2),
+        'dx_codes': dx_codes,
+        'claim_lines': [
+            {
+                'clm_line_num': line_number + 1,
+                'clm_line_hcpcs_cd': code,
+                'mdfr_cds': ['GQ'] if line_number else [],
+                'clm_pos_code': '11' if line_number else None,
+                'clm_line_from_dt': datetime.date(2018, 3, 1),
+                'clm_line_thru_dt': datetime.date(2018, 3, 2),
+            }
+            for line_number, code in enumerate(procedure_codes)
+        ]
+    })
+    # Claims built by claim_reader have their procedure codes aggregated.
+    claim.get_procedure_codes()
+    return claim
+
+
+class TestClaimBatch():
+
+    def setup(self):
+        self.claims_by_provider = {
+            ('tin_1', 'npi_1'): [
+                _build_claim('tin_1', 'npi_1', '1', 'bene_a', ['99201', 'G8482'], ['I10']),
+                _build_claim('tin_1', 'npi_1', '2', 'bene_b', [], ['E119', 'I10'], sex_code='2'),
+            ],
+            ('tin_2', 'npi_2'): [
+                _build_claim('tin_2', 'npi_2', '3', 'bene_a', ['99213'], []),
+            ],
+            ('tin_3', 'npi_3'): [],
+        }
+        self.batch = ClaimBatch(self.claims_by_provider)
+
+    def test_mapping_interface(self):
+        assert len(self.batch) == 3
+        assert list(self.batch) == list(self.claims_by_provider)
+        assert self.batch.num_claims == 3
+        assert self.batch.get(('tin_4', 'npi_4')) is None
+        assert self.batch[('tin_3', 'npi_3')] == []
+
+    def test_claims_round_trip(self):
+        for identifier, claims in self.claims_by_provider.items():
+            assert self.batch[identifier] == claims
+
+    def test_accepts_generator(self):
+        batch = ClaimBatch(pair for pair in self.claims_by_provider.items())
+        assert dict(batch) == self.claims_by_provider
+
+    def test_views_share_memory(self):
+        view = self.batch.get_view(('tin_2', 'npi_2'))
+        assert len(view) == 1
+        assert np.shares_memory(view.clm_from_dt, self.batch.clm_from_dt)
+        assert view.to_claims() == self.claims_by_provider[('tin_2', 'npi_2')]
+
+    def test_beneficiary_keys_are_interned(self):
+        assert self.batch.bene_keys[0] == self.batch.bene_keys[2]
+        assert self.batch.bene_keys[0] != self.batch.bene_keys[1]
+
+    def test_procedure_code_mask(self):
+        mask = self.batch.claims_with_any_procedure_code({'G8482', '99213'})
+        assert mask.tolist() == [True, False, True]
+
+        view = self.batch.get_view(('tin_1', 'npi_1'))
+        assert view.claims_with_any_procedure_code({'99213'}).tolist() == [False, False]
+        assert view.has_any_procedure_code({'G8482'})
+        assert not view.has_any_procedure_code({'99213', 'unknown_code'})
+
+    def test_claim_level_masks(self):
+        assert self.batch.claims_with_any_diagnosis_code(['E119']).tolist() == [
+            False, True, False]
+        assert self.batch.claims_with_sex_code('2').tolist() == [False, True, False]
+        assert self.batch.claims_in_age_range(65, 70).all()
+        assert not self.batch.claims_in_date_range(
+            datetime.date(2018, 4, 1), datetime.date(2018, 12, 31)).any()
+
+    def test_select(self):
+        mask = self.batch.claims_with_any_procedure_code({'99201', '99213'})
+        selected = self.batch.select(mask)
+        assert list(selected) == list(self.batch)
+        assert selected.num_claims == 2
+        assert selected[('tin_1', 'npi_1')] == self.claims_by_provider[('tin_1', 'npi_1')][:1]
+        assert selected.to_claims() == self.batch.to_claims(mask)
+
+    def test_claims_are_materialized_once_per_provider(self):
+        claims = self.batch[('tin_1', 'npi_1')]
+        assert self.batch[('tin_1', 'npi_1')] is claims
+
+        # Only the claims of the provider accessed last are kept.
+        self.batch[('tin_2', 'npi_2')]
+        assert self.batch[('tin_1', 'npi_1')] is not claims
+        assert self.batch[('tin_1', 'npi_1')] == claims
+
+    def test_procedure_code_bits(self):
+        """Bitsets are only set on claims interned with the process-wide vocabulary."""
+        claims = self.claims_by_provider[('tin_1', 'npi_1')]
+        assert self.batch[('tin_1', 'npi_1')][0].procedure_code_bits is None
+        assert claim_filtering.do_any_claims_have_quality_codes(
+            self.batch[('tin_1', 'npi_1')], quality_codes={'G8482'})
+
+        batch = ClaimBatch(
+            self.claims_by_provider, code_vocabulary=code_reader.get_code_vocabulary())
+        materialized_claims = batch[('tin_1', 'npi_1')]
+        assert materialized_claims[0].procedure_code_bits is not None
+        assert materialized_claims[0].procedure_code_bits == (
+            code_reader.get_code_vocabulary().to_bitset(claims[0].get_procedure_codes()))
+
+    def test_iter_claims(self):
+        mask = self.batch.claims_with_any_procedure_code({'99201', '99213'})
+        assert list(self.batch.iter_claims(mask)) == [
+            (('tin_1', 'npi_1'), self.claims_by_provider[('tin_1', 'npi_1')][:1]),
+            (('tin_2', 'npi_2'), self.claims_by_provider[('tin_2', 'npi_2')]),
+        ]
+        assert dict(self.batch.iter_claims()) == self.claims_by_provider
+
+    def test_claims_of_providers_with_any(self):
+        mask = self.batch.claims_with_any_procedure_code({'G8482'})
+        assert self.batch.claims_of_providers_with_any(mask).tolist() == [True, True, False]
+
+    def test_view_bene_sks(self):
+        assert self.batch.get_view(('tin_1', 'npi_1')).get_bene_sks() == {'bene_a', 'bene_b'}
+        assert self.batch.get_view(('tin_3', 'npi_3')).get_bene_sks() == set()
+
+
+class TestClaimBatchBuilder():
+
+    def test_build_from_claim_values(self):
+        """Claims given as dictionaries of raw values are converted like ClaimRecords."""
+        claim = _build_claim('tin_1', 'npi_1', '1', 'bene_a', ['99201', 'G8482'], ['I10'])
+        claim_values = {
+            'splt_clm_id': 1,
+            'bene_sk': 'bene_a',
+            'clm_ptnt_birth_dt': '1950-01-01',
+            'clm_bene_sex_cd': 1,
+            'clm_from_dt': '2018-03-01',
+            'clm_thru_dt': '2018-03-02',
+            'dx_codes': ['I10'],
+            'claim_lines': [
+                {
+                    'clm_line_num': '1',
+                    'clm_line_hcpcs_cd': '99201',
+                    'mdfr_cds': [],
+                    'clm_pos_code': None,
+                    'clm_line_from_dt': '2018-03-01',
+                    'clm_line_thru_dt': '2018-03-02',
+                },
+                {
+                    'clm_line_num': '2',
+                    'clm_line_hcpcs_cd': 'G8482',
+                    'mdfr_cds': ['GQ'],
+                    'clm_pos_code': 11,
+                    'clm_line_from_dt': '2018-03-01',
+                    'clm_line_thru_dt': '2018-03-02',
+                },
+            ],
+        }
+
+        builder = ClaimBatchBuilder()
+        builder.add_provider(('tin_1', 'npi_1'))
+        builder.add_claim(claim_values)
+        builder.add_provider(('tin_2', 'npi_2'))
+        batch = builder.build()
+
+        assert dict(batch) == {('tin_1', 'npi_1'): [claim], ('tin_2', 'npi_2'): []}
+        assert batch.bene_age.tolist() == [claim.bene_age]
+
+    def test_providers_must_be_contiguous(self):
+        builder = ClaimBatchBuilder()
+        builder.add_provider(('tin_1', 'npi_1'))
+        builder.add_provider(('tin_2', 'npi_2'))
+        with pytest.raises(ValueError):
+            builder.add_provider(('tin_1', 'npi_1'))
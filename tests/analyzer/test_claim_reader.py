@@ -2,6 +2,8 @@
 import datetime
 
 from claims_to_quality.analyzer.datasource import claim_reader
+from claims_to_quality.analyzer.models import claim_batch
+from claims_to_quality.lib.connectors import idr_queries
 from claims_to_quality.lib.helpers import mocking_config
 from claims_to_quality.lib.teradata_methods import row_handling
 
@@ -306,3 +308,277 @@ class TestQueryClaimsFromTeradata():
             datetime.date.today(), datetime.date.today())
 
         assert output == {}
+
+
+class TestStreamBatchFromDb():
+    """Test stream_batch_from_db function."""
+
+    def setup(self):
+        _, self.rows = row_handling.csv_to_query_output(TWO_CLAIMS_CSV_PATH)
+        _, other_rows = row_handling.csv_to_query_output(TWO_CLAIMS_CSV_PATH)
+        for row in other_rows:
+            row['clm_line_rndrg_prvdr_npi_num'] = 'other_npi_num'
+        self.other_rows = other_rows
+
+    @mock.patch(
+        'claims_to_quality.analyzer.datasource.claim_reader.'
+        'stream_claims_from_teradata_batch_provider')
+    @mock.patch('claims_to_quality.analyzer.datasource.claim_reader.config')
+    def test_stream_batch(self, mock_config, stream_claims_from_teradata_batch_provider):
+        """Each provider's claims should be yielded in the order of the query results."""
+        mock_config.get.side_effect = mocking_config.config_side_effect(
+            {'hide_sensitive_information': False}
+        )
+        stream_claims_from_teradata_batch_provider.return_value = iter(
+            self.rows + self.other_rows)
+
+        reader = claim_reader.ClaimsDataReader()
+        output = list(reader.stream_batch_from_db(
+            ['tax_num', 'tax_num'], ['npi_num', 'other_npi_num'],
+            datetime.date.today(), datetime.date.today()))
+
+        assert [identifier for identifier, _ in output] == [
+            ('tax_num', 'npi_num'), ('tax_num', 'other_npi_num')]
+        assert [len(claims) for _, claims in output] == [2, 2]
+        assert output[0][1] == reader._group_claim_by_lines(
+            self.rows, self.rows[0].columns, 'splt_clm_id')
+
+    @mock.patch(
+        'claims_to_quality.analyzer.datasource.claim_reader.'
+        'stream_claims_from_teradata_batch_provider')
+    @mock.patch('claims_to_quality.analyzer.datasource.claim_reader.config')
+    def test_stream_batch_not_contiguous(
+            self, mock_config, stream_claims_from_teradata_batch_provider):
+        """Rows of a provider that are not contiguous should raise an error."""
+        mock_config.get.side_effect = mocking_config.config_side_effect(
+            {'hide_sensitive_information': False}
+        )
+        stream_claims_from_teradata_batch_provider.return_value = iter(
+            self.rows[:1] + self.other_rows + self.rows[1:])
+
+        reader = claim_reader.ClaimsDataReader()
+        with pytest.raises(AssertionError):
+            list(reader.stream_batch_from_db(
+                ['tax_num', 'tax_num'], ['npi_num', 'other_npi_num'],
+                datetime.date.today(), datetime.date.today()))
+
+    @mock.patch(
+        'claims_to_quality.analyzer.datasource.claim_reader.'
+        'stream_claims_from_teradata_batch_provider')
+    @mock.patch('claims_to_quality.analyzer.datasource.claim_reader.config')
+    def test_load_claim_batch(self, mock_config, stream_claims_from_teradata_batch_provider):
+        """The columnar batch should hold the same claims as the streamed claim records."""
+        mock_config.get.side_effect = mocking_config.config_side_effect(
+            {'hide_sensitive_information': False}
+        )
+        stream_claims_from_teradata_batch_provider.side_effect = lambda *args, **kwargs: iter(
+            self.rows + self.other_rows)
+
+        reader = claim_reader.ClaimsDataReader()
+        batch = reader.load_claim_batch_from_db(
+            ['tax_num', 'tax_num'], ['npi_num', 'other_npi_num'],
+            datetime.date.today(), datetime.date.today())
+        expected_output = reader.stream_batch_from_db(
+            ['tax_num', 'tax_num'], ['npi_num', 'other_npi_num'],
+            datetime.date.today(), datetime.date.today())
+
+        assert isinstance(batch, claim_batch.ClaimBatch)
+        assert list(batch.items()) == list(expected_output)
+
+    @mock.patch('claims_to_quality.lib.teradata_methods.execute.execute_iterator')
+    @mock.patch('claims_to_quality.analyzer.datasource.claim_reader.config')
+    def test_stream_query(self, mock_config, mock_execute_iterator):
+        """The streaming query should order rows by provider and split claim ID."""
+        mock_config.get.side_effect = mocking_config.config_side_effect(
+            {'hide_sensitive_information': False}
+        )
+        mock_execute_iterator.return_value = iter(self.rows)
+        output = claim_reader.stream_claims_from_teradata_batch_provider(
+            provider_tins=['tin'],
+            provider_npis=['npi'],
+            start_date=datetime.date.today(),
+            end_date=datetime.date.today())
+
+        assert list(output) == self.rows
+        query = mock_execute_iterator.call_args[0][0]
+        assert 'ORDER BY clm_rndrg_prvdr_tax_num, clm_line_rndrg_prvdr_npi_num' in query
+
+
+class TestProcedureCodePushdown():
+    """Test pushing the procedure code filter down to the batch query."""
+
+    def setup(self):
+        self.columns, self.rows = row_handling.csv_to_query_output(TWO_CLAIMS_CSV_PATH)
+        self.condition = "CLM_LINE_HCPCS_CD IN ('hcpcs1')"
+
+    def _get_pushdown_rows(self, provider_row_count, batch_row_count):
+        """Return the rows with the counts added by the pushdown query."""
+        columns = list(self.columns) + [
+            idr_queries.PROVIDER_ROW_COUNT_COLUMN, idr_queries.BATCH_ROW_COUNT_COLUMN]
+        return row_handling.convert_list_of_lists_to_teradata_rows(
+            [list(row.values) + [provider_row_count, batch_row_count] for row in self.rows],
+            columns)
+
+    @mock.patch('claims_to_quality.lib.teradata_methods.execute.execute')
+    @mock.patch('claims_to_quality.analyzer.datasource.claim_reader.config')
+    def test_batch_query_with_condition(self, mock_config, mock_execute):
+        """The batch query should filter split claims in a single pass over the base query."""
+        mock_config.get.side_effect = mocking_config.config_side_effect(
+            {'hide_sensitive_information': False}
+        )
+        mock_execute.return_value = []
+        claim_reader.query_claims_from_teradata_batch_provider(
+            provider_tins=['tin'],
+            provider_npis=['npi'],
+            start_date=datetime.date.today(),
+            end_date=datetime.date.today(),
+            procedure_code_condition=self.condition)
+
+        query = mock_execute.call_args[0][0]
+        assert query.count(idr_queries.ACCESS_LAYER_BASE_QUERY_BATCH) == 1
+        assert 'QUALIFY MAX(CASE WHEN {} THEN 1 ELSE 0 END)'.format(self.condition) in query
+
+    @mock.patch('claims_to_quality.lib.teradata_methods.execute.execute_iterator')
+    @mock.patch('claims_to_quality.analyzer.datasource.claim_reader.config')
+    def test_stream_query_with_condition(self, mock_config, mock_execute_iterator):
+        """The ordered batch query should wrap the batch query with the condition."""
+        mock_config.get.side_effect = mocking_config.config_side_effect(
+            {'hide_sensitive_information': False}
+        )
+        mock_execute_iterator.return_value = iter([])
+        claim_reader.stream_claims_from_teradata_batch_provider(
+            provider_tins=['tin'],
+            provider_npis=['npi'],
+            start_date=datetime.date.today(),
+            end_date=datetime.date.today(),
+            procedure_code_condition=self.condition)
+
+        query = mock_execute_iterator.call_args[0][0]
+        assert query.count(idr_queries.ACCESS_LAYER_BASE_QUERY_BATCH) == 1
+        assert 'CASE WHEN {} THEN 1'.format(self.condition) in query
+        assert query.strip().endswith(
+            'ORDER BY clm_rndrg_prvdr_tax_num, clm_line_rndrg_prvdr_npi_num, splt_clm_id')
+
+    @mock.patch('claims_to_quality.lib.teradata_methods.execute.execute')
+    @mock.patch('claims_to_quality.analyzer.datasource.claim_reader.config')
+    def test_log_pushdown_row_counts(self, mock_config, mock_execute):
+        """The claim lines transferred should be compared to the lines of the whole batch."""
+        mock_config.get.side_effect = mocking_config.config_side_effect(
+            {'hide_sensitive_information': False}
+        )
+        mock_execute.return_value = self._get_pushdown_rows(
+            provider_row_count=10, batch_row_count=10)
+
+        reader = claim_reader.ClaimsDataReader(procedure_code_condition=self.condition)
+        with mock.patch('claims_to_quality.analyzer.datasource.claim_reader.logger') as logger:
+            reader.load_batch_from_db(
+                ['tax_num'], ['npi_num'], datetime.date.today(), datetime.date.today())
+
+        assert mock_execute.call_count == 1
+        logger.info.assert_called_once_with(
+            'Procedure code pushdown transferred 4 of 10 claim lines (6 fewer).')
+
+    @mock.patch(
+        'claims_to_quality.analyzer.datasource.claim_reader.'
+        'stream_claims_from_teradata_batch_provider')
+    @mock.patch('claims_to_quality.analyzer.datasource.claim_reader.config')
+    def test_stream_passes_condition(self, mock_config, stream_claims_from_teradata_batch_provider):
+        """The reader's condition should be passed to the streaming query."""
+        mock_config.get.side_effect = mocking_config.config_side_effect(
+            {'hide_sensitive_information': False}
+        )
+        stream_claims_from_teradata_batch_provider.return_value = iter(
+            self._get_pushdown_rows(provider_row_count=4, batch_row_count=8))
+
+        reader = claim_reader.ClaimsDataReader(procedure_code_condition=self.condition)
+        with mock.patch('claims_to_quality.analyzer.datasource.claim_reader.logger') as logger:
+            output = list(reader.stream_batch_from_db(
+                ['tax_num'], ['npi_num'], datetime.date.today(), datetime.date.today()))
+
+        assert len(output) == 1
+        assert stream_claims_from_teradata_batch_provider.call_args[1][
+            'procedure_code_condition'] == self.condition
+        logger.info.assert_called_once_with(
+            'Procedure code pushdown transferred 4 of 8 claim lines (4 fewer).')
+
+    @mock.patch('claims_to_quality.analyzer.datasource.claim_reader.config')
+    def test_sensitive_information_threshold_uses_unfiltered_rows(self, mock_config):
+        """Providers should be hidden based on their claim lines before the pushdown."""
+        mock_config.get.side_effect = mocking_config.config_side_effect(
+            {'hide_sensitive_information': True}
+        )
+        reader = claim_reader.ClaimsDataReader(procedure_code_condition=self.condition)
+
+        # Fewer than 50 lines after filtering, but not before: the provider is kept.
+        rows = self._get_pushdown_rows(provider_row_count=60, batch_row_count=60)
+        assert len(reader._group_claim_by_lines(rows, rows[0].columns, 'splt_clm_id')) == 2
+
+        # Fewer than 50 lines before filtering: the provider is hidden.
+        rows = self._get_pushdown_rows(provider_row_count=49, batch_row_count=60)
+        assert reader._group_claim_by_lines(rows, rows[0].columns, 'splt_clm_id') == []
+
+        # Without the pushdown, the lines are counted as they are.
+        assert reader._group_claim_by_lines(self.rows, self.columns, 'splt_clm_id') == []
+
+
+class TestPreAssemblyFilter():
+    """Test filtering rows by procedure and quality codes before building claims."""
+
+    def setup(self):
+        self.columns, self.rows = row_handling.csv_to_query_output(TWO_CLAIMS_CSV_PATH)
+        # The second claim has a single, irrelevant procedure code.
+        for row in self.rows[2:]:
+            row['clm_line_hcpcs_cd'] = 'hcpcs3'
+
+    @mock.patch(
+        'claims_to_quality.analyzer.datasource.claim_reader.'
+        'query_claims_from_teradata_batch_provider')
+    @mock.patch('claims_to_quality.analyzer.datasource.claim_reader.config')
+    def test_filter_claims_without_procedure_codes(
+            self, mock_config, query_claims_from_teradata_batch_provider):
+        """Split claims without relevant procedure codes should be skipped and counted."""
+        mock_config.get.side_effect = mocking_config.config_side_effect(
+            {'hide_sensitive_information': False}
+        )
+        query_claims_from_teradata_batch_provider.return_value = (self.columns, self.rows)
+
+        reader = claim_reader.ClaimsDataReader(procedure_codes={'hcpcs1'}, quality_codes={'hcpcs2'})
+        with mock.patch('claims_to_quality.analyzer.datasource.claim_reader.logger') as logger:
+            output = reader.load_batch_from_db(
+                ['tax_num'], ['npi_num'], datetime.date.today(), datetime.date.today())
+
+        claims = output[('tax_num', 'npi_num')]
+        assert [claim.splt_clm_id for claim in claims] == ['splt_clm_id_1']
+        logger.info.assert_called_once_with(
+            'Skipped 2 claim lines, 1 claims and 0 providers without relevant codes in this batch.')
+        assert not reader.skipped_counts
+
+    @mock.patch('claims_to_quality.analyzer.datasource.claim_reader.config')
+    def test_filter_providers_without_quality_codes(self, mock_config):
+        """Providers without quality codes on relevant claims should be skipped entirely."""
+        mock_config.get.side_effect = mocking_config.config_side_effect(
+            {'hide_sensitive_information': False}
+        )
+        reader = claim_reader.ClaimsDataReader(procedure_codes={'hcpcs1'}, quality_codes={'hcpcs3'})
+
+        with mock.patch.object(reader, '_lines_to_claim') as lines_to_claim:
+            claims = reader._group_claim_by_lines(self.rows, self.columns, 'splt_clm_id')
+
+        assert claims == []
+        assert not lines_to_claim.called
+        assert reader.skipped_counts == {'rows': 4, 'claims': 2, 'providers': 1}
+
+        reader._log_skipped_counts()
+        assert not reader.skipped_counts
+
+    @mock.patch('claims_to_quality.analyzer.datasource.claim_reader.config')
+    def test_no_filter_by_default(self, mock_config):
+        """Without codes, all claims should be built."""
+        mock_config.get.side_effect = mocking_config.config_side_effect(
+            {'hide_sensitive_information': False}
+        )
+        reader = claim_reader.ClaimsDataReader()
+        claims = reader._group_claim_by_lines(self.rows, self.columns, 'splt_clm_id')
+
+        assert len(claims) == 2
+        assert not +reader.skipped_counts
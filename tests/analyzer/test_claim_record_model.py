@@ -0,0 +1,85 @@
+"""Tests for the slotted claim record types."""
+import datetime
+
+from claims_to_quality.analyzer.models.claim import Claim
+from claims_to_quality.analyzer.models.claim_record import ClaimLineRecord, ClaimRecord
+
+import pytest
+
+CLAIM_DATA = {
+    'splt_clm_id': 123456789,
+    'bene_sk': 'bene_sk',
+    'clm_rndrg_prvdr_npi_num': '0' * 10,
+    'clm_ptnt_birth_dt': datetime.date(1990, 1, 1),
+    'clm_bene_sex_cd': '1',
+    'clm_from_dt': datetime.date(2017, 7, 1),
+    'clm_thru_dt': datetime.date(2017, 7, 1),
+    'dx_codes': ['dx1', 'dx2'],
+    'claim_lines': [
+        {'clm_line_hcpcs_cd': '99210', 'mdfr_cds': ['GQ'], 'clm_pos_code': '24',
+         'clm_line_num': 1},
+        {'clm_line_hcpcs_cd': 'G8482', 'mdfr_cds': [], 'clm_line_num': 2}
+    ]
+}
+
+
+class TestClaimRecord():
+
+    def setup(self):
+        self.claim = ClaimRecord.from_dict(CLAIM_DATA)
+        self.model = Claim(CLAIM_DATA)
+
+    def test_attributes_match_claim_model(self):
+        """The record should expose the same attribute values as the schematics model."""
+        for field in ClaimRecord._fields:
+            if field == 'claim_lines':
+                continue
+            assert getattr(self.claim, field) == getattr(self.model, field)
+        assert self.claim.bene_age == self.model.bene_age
+        for record_line, model_line in zip(self.claim.claim_lines, self.model.claim_lines):
+            for field in ClaimLineRecord._fields:
+                assert getattr(record_line, field) == getattr(model_line, field)
+
+    def test_converts_string_values(self):
+        """String dates and line numbers should be converted as in the schematics model."""
+        claim = ClaimRecord(
+            splt_clm_id='1',
+            clm_ptnt_birth_dt='1920-01-01',
+            clm_from_dt='2017-02-23',
+            claim_lines=[ClaimLineRecord(clm_line_num='2', clm_line_from_dt='2017-02-23')]
+        )
+        assert claim.clm_from_dt == datetime.date(2017, 2, 23)
+        assert claim.claim_lines[0].clm_line_num == 2
+        assert claim.claim_lines[0].clm_line_from_dt == datetime.date(2017, 2, 23)
+
+    def test_invalid_date_raises(self):
+        with pytest.raises(ValueError):
+            ClaimRecord(clm_ptnt_birth_dt='not_a_date', clm_from_dt='2017-02-23')
+
+    def test_item_access(self):
+        assert self.claim['clm_from_dt'] == datetime.date(2017, 7, 1)
+        self.claim['bene_sk'] = 'other_bene_sk'
+        assert self.claim.bene_sk == 'other_bene_sk'
+        with pytest.raises(KeyError):
+            self.claim['unknown_field']
+        with pytest.raises(KeyError):
+            self.claim['unknown_field'] = 1
+
+    def test_slots_prevent_new_attributes(self):
+        with pytest.raises(AttributeError):
+            self.claim.unknown_field = 1
+
+    def test_equality(self):
+        assert self.claim == ClaimRecord.from_dict(CLAIM_DATA)
+        other_data = dict(CLAIM_DATA, bene_sk='other_bene_sk')
+        assert self.claim != ClaimRecord.from_dict(other_data)
+
+    def test_get_procedure_codes(self):
+        """The method should return a dict of procedure codes and set the claim's attribute."""
+        expected = {'99210': True, 'G8482': True}
+        assert self.claim.get_procedure_codes() == expected
+        assert self.claim.aggregated_procedure_codes == expected
+
+    def test_str_method(self):
+        assert self.claim.__str__() == self.model.__str__()
+        assert self.claim.claim_lines[0].__str__() == 'ClaimLine - line_number: 1'
@@ -0,0 +1,38 @@
+"""Tests for the CodeVocabulary."""
+import pickle
+
+from claims_to_quality.analyzer.models.code_vocabulary import CodeVocabulary, MISSING_CODE
+
+
+class TestCodeVocabulary():
+
+    def setup(self):
+        self.vocabulary = CodeVocabulary(['99213', 'G8482', 'E119'])
+
+    def test_reference_codes_come_first(self):
+        assert self.vocabulary.intern('G8482') == 1
+        assert self.vocabulary.intern('new_code') == 3
+        assert self.vocabulary.num_reference_codes == 3
+        assert len(self.vocabulary) == 4
+        assert 'new_code' in self.vocabulary
+
+    def test_lookup(self):
+        assert self.vocabulary.lookup(self.vocabulary.intern('E119')) == 'E119'
+        assert self.vocabulary.intern(None) == MISSING_CODE
+        assert self.vocabulary.lookup(MISSING_CODE) is None
+        assert self.vocabulary.get_ids(['99213', 'unknown']) == {0}
+
+    def test_bitsets(self):
+        self.vocabulary.intern('new_code')
+        assert self.vocabulary.to_bitset(['99213', 'E119', 'new_code', 'unknown']) == 0b101
+        assert self.vocabulary.to_reference_bitset(['99213', 'G8482']) == 0b011
+        assert self.vocabulary.to_reference_bitset(['99213', 'new_code']) is None
+
+    def test_serialization(self):
+        self.vocabulary.intern('new_code')
+        for copy in (
+                CodeVocabulary.from_dict(self.vocabulary.to_dict()),
+                pickle.loads(pickle.dumps(self.vocabulary))):
+            assert copy.codes == self.vocabulary.codes
+            assert copy.code_ids == self.vocabulary.code_ids
+            assert copy.num_reference_codes == self.vocabulary.num_reference_codes
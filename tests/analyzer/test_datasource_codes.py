@@ -13,3 +13,30 @@ def test_load_measure_definition_missing_file():
     """Test that load_quality_codes throws the expected error if file is missing."""
     with pytest.raises(IOError):
         code_reader.load_quality_codes(json_path='missing_path')
+
+
+def test_load_code_vocabulary():
+    """Reference codes should be interned first, in a deterministic order."""
+    vocabulary = code_reader.load_code_vocabulary()
+    quality_codes = code_reader.load_quality_codes()
+
+    assert vocabulary.codes == code_reader.load_code_vocabulary().codes
+    assert vocabulary.num_reference_codes == len(vocabulary)
+    assert vocabulary.to_reference_bitset(quality_codes) is not None
+    # Procedure and quality codes come first so that their bitsets stay small.
+    assert max(vocabulary.get_ids(quality_codes)) < len(vocabulary) / 2
+    # Diagnosis codes are stored without dots.
+    assert not any('.' in code for code in vocabulary.codes)
+
+
+def test_get_code_vocabulary():
+    """The process-wide vocabulary should be loaded once and can be replaced."""
+    vocabulary = code_reader.get_code_vocabulary()
+    assert code_reader.get_code_vocabulary() is vocabulary
+
+    other_vocabulary = code_reader.CodeVocabulary(['code'])
+    code_reader.set_code_vocabulary(other_vocabulary)
+    try:
+        assert code_reader.get_code_vocabulary() is other_vocabulary
+    finally:
+        code_reader.set_code_vocabulary(vocabulary)
@@ -0,0 +1,77 @@
+"""Tests for the cache of IDR lookups."""
+import pickle
+from datetime import date
+
+from claims_to_quality.analyzer.datasource import lookup_cache
+
+import mock
+
+WINDOW = (date(2017, 1, 1), date(2017, 12, 31))
+
+
+class TestIDRLookupCache():
+    """Tests for the IDRLookupCache class."""
+
+    def test_get_many(self):
+        cache = lookup_cache.IDRLookupCache(max_bytes=10000)
+        cache.set_many(
+            'kind', {'bene_1': frozenset([date(2017, 1, 1)]), 'bene_2': frozenset()}, WINDOW)
+
+        assert cache.get_many('kind', ['bene_1', 'bene_2', 'bene_3'], WINDOW) == {
+            'bene_1': frozenset([date(2017, 1, 1)]), 'bene_2': frozenset()}
+        assert cache.get_metrics()['hits'] == 2
+        assert cache.get_metrics()['misses'] == 1
+
+    def test_keys_include_kind_and_window(self):
+        cache = lookup_cache.IDRLookupCache(max_bytes=10000)
+        cache.set_many('kind', {'bene_1': 1}, WINDOW)
+
+        assert cache.get_many('other_kind', ['bene_1'], WINDOW) == {}
+        assert cache.get_many('kind', ['bene_1'], (date(2018, 1, 1), date(2018, 12, 31))) == {}
+
+    @mock.patch('claims_to_quality.analyzer.datasource.lookup_cache.config')
+    def test_keys_include_as_was_date(self, mock_config):
+        cache = lookup_cache.IDRLookupCache(max_bytes=10000)
+        mock_config.get.return_value = date(2018, 1, 1)
+        cache.set_many('kind', {'bene_1': 1}, WINDOW)
+
+        mock_config.get.return_value = date(2018, 2, 1)
+        assert cache.get_many('kind', ['bene_1'], WINDOW) == {}
+
+    def test_least_recently_used_values_are_evicted(self):
+        value_size = len(pickle.dumps(1, pickle.HIGHEST_PROTOCOL))
+        cache = lookup_cache.IDRLookupCache(max_bytes=2 * value_size)
+        cache.set_many('kind', {'bene_1': 1, 'bene_2': 2}, WINDOW)
+        cache.get_many('kind', ['bene_1'], WINDOW)
+        cache.set_many('kind', {'bene_3': 3}, WINDOW)
+
+        assert cache.get_many('kind', ['bene_1', 'bene_2', 'bene_3'], WINDOW) == {
+            'bene_1': 1, 'bene_3': 3}
+        assert cache.nbytes == 2 * value_size
+        assert cache.get_metrics()['evictions'] == 1
+
+    def test_values_larger_than_budget_are_not_held(self):
+        cache = lookup_cache.IDRLookupCache(max_bytes=10)
+        cache.set_many('kind', {'bene_1': 'x' * 100}, WINDOW)
+
+        assert len(cache) == 0
+        assert cache.nbytes == 0
+
+    def test_sqlite_backing(self, tmpdir):
+        path = str(tmpdir.join('lookups.sqlite'))
+        cache = lookup_cache.IDRLookupCache(max_bytes=10000, path=path)
+        cache.set_many('kind', {'bene_1': (date(2017, 1, 1),)}, WINDOW)
+        cache.close()
+
+        reopened_cache = lookup_cache.IDRLookupCache(max_bytes=10000, path=path)
+        assert reopened_cache.get_many('kind', ['bene_1', 'bene_2'], WINDOW) == {
+            'bene_1': (date(2017, 1, 1),)}
+        assert reopened_cache.get_metrics()['disk_hits'] == 1
+        assert len(reopened_cache) == 1
+        reopened_cache.close()
+
+
+@mock.patch('claims_to_quality.analyzer.datasource.lookup_cache.config')
+def test_get_lookup_cache_disabled(mock_config):
+    mock_config.get.return_value = False
+    assert lookup_cache.get_lookup_cache() is None
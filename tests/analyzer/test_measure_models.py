@@ -3,6 +3,8 @@ import datetime
 
 from claims_to_quality.analyzer.models import claim
 from claims_to_quality.analyzer.models import claim_line
+from claims_to_quality.analyzer.models.claim_record import ClaimLineRecord
+from claims_to_quality.analyzer.models.measures import measure_code
 from claims_to_quality.analyzer.models.measures.eligibility_option import EligibilityOption
 from claims_to_quality.analyzer.models.measures.measure_code import MeasureCode
 from claims_to_quality.analyzer.models.measures.measure_definition import MeasureDefinition
@@ -219,6 +221,43 @@ def test_does_claim_meet_additional_procedure_criteria():
     assert not (option._does_claim_meet_additional_procedure_criteria(claim_measure_code_only))
 
 
+class TestMeasureCodeCanonicalization():
+    """Tests for sharing measure codes and their line matches across measures."""
+
+    def setup(self):
+        """Initialize eligibility options sharing a measure code."""
+        self.option = EligibilityOption({
+            'procedureCodes': [MeasureCode({'code': 'shared_code', 'modifiers': ['GQ', 'GT']})],
+        })
+        self.other_option = EligibilityOption({
+            'procedureCodes': [MeasureCode({'code': 'shared_code', 'modifiers': ['GT', 'GQ']})],
+        })
+        measure_code.reset_match_cache_stats()
+
+    def test_options_share_measure_code_instances(self):
+        assert self.option.procedure_codes[0] is self.other_option.procedure_codes[0]
+        assert self.option.procedure_codes[0].canonical_id is not None
+
+    def test_different_constraints_are_not_shared(self):
+        option = EligibilityOption({
+            'procedureCodes': [MeasureCode({'code': 'shared_code', 'modifiers': ['GQ']})],
+        })
+        assert option.procedure_codes[0] is not self.option.procedure_codes[0]
+
+    def test_line_matches_are_reused(self):
+        line = ClaimLineRecord(clm_line_hcpcs_cd='shared_code', mdfr_cds=['GT'])
+        assert self.option.procedure_codes[0].matches_line(line)
+        assert self.other_option.procedure_codes[0].matches_line(line)
+        assert measure_code.match_cache_stats == {'hits': 1, 'misses': 1}
+        assert measure_code.get_match_cache_hit_rate() == 0.5
+
+    def test_claim_line_models_are_matched_directly(self):
+        line = claim_line.ClaimLine({'clm_line_hcpcs_cd': 'shared_code', 'mdfr_cds': ['GQ']})
+        assert self.option.procedure_codes[0].matches_line(line)
+        assert self.other_option.procedure_codes[0].matches_line(line)
+        assert measure_code.get_match_cache_hit_rate() == 0.0
+
+
 def test_does_claim_meet_sex_criteria():
     """"Check that the eligibility option can determine what claims match its sex criteria."""
     matching_claim = claim.Claim({'clm_bene_sex_cd': '1'})
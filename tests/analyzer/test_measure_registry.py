@@ -0,0 +1,82 @@
+"""Tests for the compiled measure registry."""
+import os
+
+from claims_to_quality.analyzer.datasource import measure_registry
+from claims_to_quality.lib.helpers import mocking_config
+
+import mock
+
+import ujson as json
+
+SINGLE_SOURCE = [
+    {'measureId': '001', 'performanceOptions': [{'qualityCodes': [{'code': 'G0001'}]}]},
+    {'measureId': '002'},
+]
+
+
+def _write_single_source(tmpdir, single_source):
+    json_path = tmpdir.join('single_source.json')
+    json_path.write(json.dumps(single_source))
+    return str(json_path)
+
+
+@mock.patch('claims_to_quality.analyzer.datasource.measure_registry.config')
+class TestMeasureRegistry():
+    """Tests for loading and compiling the single source file."""
+
+    def setup(self):
+        """Forget the registries loaded by other tests."""
+        measure_registry.clear_registries()
+
+    def teardown(self):
+        """Forget the registries loaded by this test."""
+        measure_registry.clear_registries()
+
+    @staticmethod
+    def _set_compiled_measures_dir(mock_config, tmpdir):
+        mock_config.get.side_effect = mocking_config.config_side_effect(
+            {'assets.compiled_measures_dir': str(tmpdir.join('compiled'))}
+        )
+
+    def test_only_claims_based_measures_are_loaded(self, mock_config, tmpdir):
+        self._set_compiled_measures_dir(mock_config, tmpdir)
+        registry = measure_registry.load_registry(_write_single_source(tmpdir, SINGLE_SOURCE))
+
+        assert list(registry) == ['001']
+
+    def test_registry_is_loaded_once_per_process(self, mock_config, tmpdir):
+        self._set_compiled_measures_dir(mock_config, tmpdir)
+        json_path = _write_single_source(tmpdir, SINGLE_SOURCE)
+
+        assert measure_registry.load_registry(json_path) is measure_registry.load_registry(
+            json_path)
+
+    def test_compiled_registry_is_reused(self, mock_config, tmpdir):
+        self._set_compiled_measures_dir(mock_config, tmpdir)
+        json_path = _write_single_source(tmpdir, SINGLE_SOURCE)
+        registry = measure_registry.load_registry(json_path)
+        assert len(os.listdir(str(tmpdir.join('compiled')))) == 1
+
+        measure_registry.clear_registries()
+        with mock.patch.object(measure_registry, 'json') as mock_json:
+            assert measure_registry.load_registry(json_path) == registry
+        mock_json.loads.assert_not_called()
+
+    def test_compiled_registry_is_invalidated_when_the_file_changes(self, mock_config, tmpdir):
+        self._set_compiled_measures_dir(mock_config, tmpdir)
+        measure_registry.load_registry(_write_single_source(tmpdir, SINGLE_SOURCE))
+
+        measure_registry.clear_registries()
+        registry = measure_registry.load_registry(_write_single_source(
+            tmpdir, SINGLE_SOURCE + [{'measureId': '003', 'performanceOptions': []}]))
+
+        assert sorted(registry) == ['001', '003']
+        assert len(os.listdir(str(tmpdir.join('compiled')))) == 2
+
+    def test_unwritable_compiled_measures_dir(self, mock_config, tmpdir):
+        """The registry is still loaded if the compiled registry cannot be written."""
+        tmpdir.join('compiled').write('not a directory')
+        self._set_compiled_measures_dir(mock_config, tmpdir)
+        registry = measure_registry.load_registry(_write_single_source(tmpdir, SINGLE_SOURCE))
+
+        assert list(registry) == ['001']
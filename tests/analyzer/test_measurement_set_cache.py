@@ -0,0 +1,37 @@
+"""Tests for the measurement set ID cache."""
+from claims_to_quality.analyzer.submission import measurement_set_cache
+
+
+class TestMeasurementSetIdCache():
+    """Tests for the MeasurementSetIdCache class."""
+
+    def setup(self):
+        """Create a cache with a fake clock."""
+        self.now = 0.0
+        self.cache = measurement_set_cache.MeasurementSetIdCache(
+            ttl_seconds=10, clock=lambda: self.now)
+
+    def test_get_missing(self):
+        assert self.cache.get('tin', 'npi', 2017) is measurement_set_cache.MISSING
+
+    def test_set_and_get(self):
+        self.cache.set('tin', 'npi', 2017, 'measurement_set_id')
+        self.cache.set('tin', 'other_npi', '2017', None)
+
+        assert self.cache.get('tin', 'npi', '2017') == 'measurement_set_id'
+        assert self.cache.get('tin', 'other_npi', 2017) is None
+        assert self.cache.get('tin', 'npi', 2018) is measurement_set_cache.MISSING
+
+    def test_entries_expire(self):
+        self.cache.set('tin', 'npi', 2017, 'measurement_set_id')
+        self.now = 10.0
+
+        assert self.cache.get('tin', 'npi', 2017) is measurement_set_cache.MISSING
+        assert len(self.cache) == 0
+
+    def test_invalidate(self):
+        self.cache.set('tin', 'npi', 2017, 'measurement_set_id')
+        self.cache.invalidate('tin', 'npi', 2017)
+        self.cache.invalidate('tin', 'unknown_npi', 2017)
+
+        assert self.cache.get('tin', 'npi', 2017) is measurement_set_cache.MISSING
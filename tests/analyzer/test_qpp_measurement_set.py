@@ -262,6 +262,78 @@ class TestMeasurementSet():
         assert measurement_set_dict['performanceStart'] == '2017-01-01'
         assert measurement_set_dict['performanceEnd'] == '2017-12-31'
 
+    def _get_measurement_set_with_measures(
+            self, measure_numbers, strata_names, performance_end=datetime.date(2017, 12, 31)):
+        measurement_set = qpp_measurement_set.MeasurementSet(
+            tin='000999999',
+            npi='0888888888',
+            performance_start=self.start_date,
+            performance_end=performance_end)
+        for measure_number in measure_numbers:
+            measurement_set.add_measure(measure_number, {
+                'performance_met': int(measure_number),
+                'performance_not_met': 1,
+                'eligible_population_exclusion': 0,
+                'eligible_population_exception': 0,
+                'eligible_population': 100
+            })
+        measurement_set.add_measure_with_multiple_strata('226', [
+            {'name': name, 'results': {
+                'performance_met': 1,
+                'performance_not_met': 0,
+                'eligible_population_exclusion': 0,
+                'eligible_population_exception': 0,
+                'eligible_population': len(name)
+            }}
+            for name in strata_names
+        ])
+        return measurement_set
+
+    def test_get_content_hash(self):
+        """The content hash does not depend on the order in which measures are added."""
+        content_hash = self._get_measurement_set_with_measures(
+            ['047', '130'], ['overall', 'intervention']).get_content_hash()
+
+        assert re.match(r'^[0-9a-f]{64}$', content_hash)
+        assert self._get_measurement_set_with_measures(
+            ['130', '047'], ['intervention', 'overall']).get_content_hash() == content_hash
+
+    def test_get_content_hash_changes_with_content(self):
+        content_hash = self._get_measurement_set_with_measures(
+            ['047', '130'], ['overall']).get_content_hash()
+
+        assert self._get_measurement_set_with_measures(
+            ['047'], ['overall']).get_content_hash() != content_hash
+        assert self._get_measurement_set_with_measures(
+            ['047', '130'], ['overall'], performance_end=datetime.date(2017, 12, 30)
+        ).get_content_hash() != content_hash
+
+    def test_get_changed_measurements(self):
+        measurement_set = self._get_measurement_set_with_measures(
+            ['047', '130'], ['overall', 'intervention'])
+        measurement_047, measurement_130, measurement_226 = measurement_set.data['measurements']
+        # Measurements returned by the submissions API have additional fields.
+        previous_measurements = [
+            dict(measurement_047, id='measurement_id'),
+            {'measureId': '130', 'value': dict(measurement_130['value'], performanceMet=0)},
+            {'measureId': '226', 'value': dict(
+                measurement_226['value'], strata=measurement_226['value']['strata'][::-1])},
+        ]
+
+        assert measurement_set.get_changed_measurements(previous_measurements) == [
+            measurement_130]
+        assert measurement_set.get_changed_measurements(previous_measurements[:1]) == [
+            measurement_130, measurement_226]
+
+    def test_to_json_with_measurements(self):
+        measurement_set = self._get_measurement_set_with_measures(['047', '130'], ['overall'])
+        measurements = measurement_set.data['measurements'][1:2]
+
+        measurement_set_dict = json.loads(measurement_set.to_json(measurements=measurements))
+
+        assert measurement_set_dict['measurements'] == measurements
+        assert len(measurement_set.data['measurements']) == 3
+
     def test_prepare_for_scoring(self):
         """Test that to_json serializes the MeasurementSet object dates properly."""
         measure_results = {
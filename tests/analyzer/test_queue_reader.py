@@ -0,0 +1,120 @@
+"""Tests for the SQS queue readers."""
+import threading
+import time
+
+from claims_to_quality.analyzer.queue_reader import queue_reader
+from claims_to_quality.lib.sqs_methods.mock_message import MockMessage
+
+import mock
+
+
+class FakeQueue(object):
+    """Queue returning the given messages, then long polling an empty queue."""
+
+    def __init__(self, messages, wait_seconds=0.01):
+        """Initialize a FakeQueue."""
+        self.messages = list(messages)
+        self.wait_seconds = wait_seconds
+        self.lock = threading.Lock()
+
+    def receive_messages(self, MaxNumberOfMessages, WaitTimeSeconds):
+        with self.lock:
+            messages = self.messages[:MaxNumberOfMessages]
+            self.messages = self.messages[MaxNumberOfMessages:]
+        if not messages:
+            time.sleep(self.wait_seconds)
+        return messages
+
+
+class TestPrefetchingQueueReader():
+    """Tests for the PrefetchingQueueReader class."""
+
+    def setup(self):
+        """Patch the SQS connection, which is also used by the poller threads."""
+        self.get_queue_patcher = mock.patch(
+            'claims_to_quality.analyzer.queue_reader.queue_reader.sqs_connector.get_queue')
+        self.get_queue = self.get_queue_patcher.start()
+
+    def teardown(self):
+        """Stop patching the SQS connection."""
+        self.get_queue_patcher.stop()
+
+    def _get_reader(self, sqs_queue, **kwargs):
+        self.get_queue.return_value = sqs_queue
+        return queue_reader.PrefetchingQueueReader(
+            queue_name='queue', pull_batch_size=10, num_pollers=3, wait_time_seconds=1, **kwargs)
+
+    def test_read_batch_fills_batches(self):
+        messages = [MockMessage(body='{}') for _ in range(25)]
+        reader = self._get_reader(FakeQueue(messages), max_latency_seconds=10)
+        stop_event = threading.Event()
+
+        batches = reader.read_batch(12, stop_event=stop_event)
+        first_batches = [next(batches), next(batches)]
+        stop_event.set()
+        remaining_batches = list(batches)
+
+        assert [len(batch) for batch in first_batches] == [12, 12]
+        assert [len(batch) for batch in remaining_batches] == [1]
+        assert sorted(
+            message.receipt_handle for batch in first_batches + remaining_batches
+            for message in batch
+        ) == sorted(message.receipt_handle for message in messages)
+
+    def test_read_batch_flushes_partial_batch_after_max_latency(self):
+        messages = [MockMessage(body='{}') for _ in range(3)]
+        reader = self._get_reader(FakeQueue(messages), max_latency_seconds=0.05)
+
+        batches = reader.read_batch(50)
+        batch = next(batches)
+        batches.close()
+
+        assert len(batch) == 3
+        assert reader.get_metrics()['batches'] == 1
+        assert reader.get_metrics()['messages'] == 3
+        assert reader.get_metrics()['queue_wait_seconds'] > 0
+
+    def test_read_batch_tracks_messages(self):
+        messages = [MockMessage(body='{}') for _ in range(3)]
+        heartbeat = mock.Mock()
+        reader = self._get_reader(
+            FakeQueue(messages), max_latency_seconds=0.05, heartbeat=heartbeat)
+
+        batches = reader.read_batch(50)
+        next(batches)
+        batches.close()
+
+        tracked = [message for call in heartbeat.track.call_args_list for message in call[0][0]]
+        assert sorted(message.receipt_handle for message in tracked) == sorted(
+            message.receipt_handle for message in messages)
+
+    def test_read_batch_stops_pollers(self):
+        reader = self._get_reader(FakeQueue([]))
+        stop_event = threading.Event()
+        stop_event.set()
+
+        assert list(reader.read_batch(10, stop_event=stop_event)) == []
+        assert reader._pollers == []
+
+    def test_read_batch_releases_buffered_messages(self):
+        messages = [MockMessage(body='{}') for _ in range(25)]
+        heartbeat = mock.Mock()
+        reader = self._get_reader(
+            FakeQueue(messages), max_latency_seconds=10, heartbeat=heartbeat)
+
+        batches = reader.read_batch(12)
+        batch = next(batches)
+        deadline = time.monotonic() + 5
+        while len(reader._buffer) < 13 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        batches.close()
+
+        passed_on = {message.receipt_handle for message in batch}
+        leftover_messages = [
+            message for message in messages if message.receipt_handle not in passed_on]
+        assert len(leftover_messages) == 13
+        assert all(message.visibility_timeout == 0 for message in leftover_messages)
+        assert all(message.visibility_timeout is None for message in batch)
+        untracked = heartbeat.untrack.call_args[0][0]
+        assert sorted(message.receipt_handle for message in untracked) == sorted(
+            message.receipt_handle for message in leftover_messages)
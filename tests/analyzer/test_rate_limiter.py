@@ -0,0 +1,73 @@
+"""Tests for the adaptive rate limiter of the submissions API."""
+from claims_to_quality.analyzer.submission import rate_limiter
+
+import mock
+
+
+class FakeClock(object):
+    """Clock advanced by the tests, and by the limiter when it sleeps."""
+
+    def __init__(self):
+        """Start the clock at zero."""
+        self.now = 0.0
+
+    def __call__(self):
+        """Return the current time."""
+        return self.now
+
+    def sleep(self, seconds):
+        """Advance the clock."""
+        self.now += seconds
+
+
+class TestAdaptiveRateLimiter():
+    """Tests for the AdaptiveRateLimiter class."""
+
+    def setup(self):
+        """Create a limiter with a fake clock."""
+        self.clock = FakeClock()
+        self.limiter = rate_limiter.AdaptiveRateLimiter(
+            initial_rate=2.0, min_rate=0.5, max_rate=4.0, additive_increase=1.0,
+            decrease_factor=0.5, decrease_interval=1.0, clock=self.clock)
+
+    @mock.patch('claims_to_quality.analyzer.submission.rate_limiter.time.sleep')
+    def test_acquire_waits_for_tokens(self, sleep):
+        sleep.side_effect = self.clock.sleep
+        for _ in range(5):
+            self.limiter.acquire()
+
+        # One token is available at once, then one every half second.
+        assert self.clock.now == 2.0
+
+    def test_additive_increase(self):
+        self.limiter.on_success()
+        assert self.limiter.rate == 2.5
+
+        for _ in range(10):
+            self.limiter.on_success()
+        assert self.limiter.rate == 4.0
+
+    def test_multiplicative_decrease(self):
+        self.limiter.on_throttled()
+        assert self.limiter.rate == 1.0
+
+        # Responses to requests sent before the first decrease are not counted again.
+        self.limiter.on_throttled()
+        assert self.limiter.rate == 1.0
+
+        self.clock.now += 1.0
+        self.limiter.on_throttled()
+        assert self.limiter.rate == 0.5
+
+        self.clock.now += 1.0
+        self.limiter.on_throttled()
+        assert self.limiter.rate == 0.5
+
+
+def test_get_rate_limiter_is_shared():
+    rate_limiter.reset_rate_limiter()
+    limiter = rate_limiter.get_rate_limiter()
+    assert rate_limiter.get_rate_limiter() is limiter
+
+    rate_limiter.reset_rate_limiter()
+    assert rate_limiter.get_rate_limiter() is not limiter
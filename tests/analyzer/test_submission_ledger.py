@@ -0,0 +1,55 @@
+"""Tests for the submission ledger."""
+from claims_to_quality.analyzer.submission import submission_ledger
+
+
+class TestSubmissionLedger():
+    """Tests for the SubmissionLedger class."""
+
+    def _get_ledger(self, tmpdir):
+        return submission_ledger.SubmissionLedger(str(tmpdir.join('ledger', 'ledger.sqlite')))
+
+    def test_record_and_get_hash(self, tmpdir):
+        ledger = self._get_ledger(tmpdir)
+        assert ledger.get_hash('tin', 'npi', 2017) is None
+
+        ledger.record('tin', 'npi', 2017, 'hash_1')
+        ledger.record('tin', 'npi', '2017', 'hash_2')
+
+        assert ledger.get_hash('tin', 'npi', 2017) == 'hash_2'
+        assert ledger.get_hash('tin', 'npi', 2018) is None
+
+    def test_ledger_is_durable(self, tmpdir):
+        ledger = self._get_ledger(tmpdir)
+        ledger.record('tin', 'npi', 2017, 'hash_1')
+        ledger.close()
+
+        assert self._get_ledger(tmpdir).get_hash('tin', 'npi', 2017) == 'hash_1'
+
+    def test_forget(self, tmpdir):
+        ledger = self._get_ledger(tmpdir)
+        ledger.record('tin', 'npi', 2017, 'hash_1')
+        ledger.forget('tin', 'npi', 2017)
+
+        assert ledger.get_hash('tin', 'npi', 2017) is None
+
+    def test_forget_submission(self, tmpdir):
+        ledger = self._get_ledger(tmpdir)
+        ledger.record('tin', 'npi', 2017, 'hash_1')
+        ledger.close()
+
+        submission_ledger.forget_submission('tin', 'npi', 2017, path=ledger.path)
+        assert ledger.get_hash('tin', 'npi', 2017) is None
+
+    def test_forget_submission_without_ledger(self, tmpdir):
+        path = str(tmpdir.join('ledger.sqlite'))
+        submission_ledger.forget_submission('tin', 'npi', 2017, path=path)
+        assert not tmpdir.join('ledger.sqlite').exists()
+
+    def test_get_measurements(self, tmpdir):
+        ledger = self._get_ledger(tmpdir)
+        ledger.record('tin', 'npi', 2017, 'hash_1')
+        assert ledger.get_measurements('tin', 'npi', 2017) is None
+
+        measurements = [{'measureId': '047', 'value': {'performanceMet': 1}}]
+        ledger.record('tin', 'npi', 2017, 'hash_2', measurements=measurements)
+        assert ledger.get_measurements('tin', 'npi', 2017) == measurements
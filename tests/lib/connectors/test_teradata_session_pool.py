@@ -0,0 +1,162 @@
+"""Tests for the Teradata session pool."""
+import threading
+
+from claims_to_quality.lib.connectors import teradata_session_pool
+from claims_to_quality.lib.teradata_methods import teradata_errors
+
+import mock
+
+import pytest
+
+
+class TestTeradataSessionPool():
+    """Tests for the TeradataSessionPool class."""
+
+    def setup(self):
+        """Create a pool with a fake clock, opening mock sessions."""
+        self.now = 0
+        self.pool = teradata_session_pool.TeradataSessionPool(
+            min_size=1, max_size=2, max_idle_seconds=300, max_age_seconds=3600,
+            checkout_timeout=10, clock=lambda: self.now)
+        self.patcher = mock.patch(
+            'claims_to_quality.lib.connectors.teradata_connector.teradata_connection',
+            side_effect=lambda: mock.MagicMock())
+        self.teradata_connection = self.patcher.start()
+
+    def teardown(self):
+        """Stop patching the Teradata connection."""
+        self.patcher.stop()
+
+    def test_sessions_are_reused(self):
+        with self.pool.session() as first_session:
+            pass
+        with self.pool.session() as second_session:
+            pass
+
+        assert first_session is second_session
+        assert self.teradata_connection.call_count == 1
+        assert not first_session.close.called
+
+    def test_sessions_are_opened_up_to_max_size(self):
+        first_session = self.pool.checkout()
+        second_session = self.pool.checkout()
+
+        assert first_session is not second_session
+        assert self.pool.num_open == 2
+
+        # With a zero timeout, the third checkout fails immediately.
+        self.pool.checkout_timeout = 0
+        with pytest.raises(teradata_errors.TeradataError):
+            self.pool.checkout()
+
+    def test_checkout_waits_for_checkin(self):
+        sessions = [self.pool.checkout(), self.pool.checkout()]
+        self.pool.checkout_timeout = None
+        checked_out = []
+
+        thread = threading.Thread(target=lambda: checked_out.append(self.pool.checkout()))
+        thread.start()
+        self.pool.checkin(sessions[0])
+        thread.join(timeout=5)
+
+        assert checked_out == [sessions[0]]
+
+    def test_idle_sessions_are_validated(self):
+        with self.pool.session() as session:
+            pass
+        self.now = 301
+
+        with self.pool.session() as validated_session:
+            pass
+
+        assert validated_session is session
+        cursor = session.cursor.return_value.__enter__.return_value
+        cursor.execute.assert_called_once_with(teradata_session_pool.VALIDATION_QUERY)
+
+    def test_invalid_idle_sessions_are_replaced(self):
+        with self.pool.session() as session:
+            pass
+        session.cursor.side_effect = Exception('Session closed by the database.')
+        self.now = 301
+
+        with self.pool.session() as new_session:
+            pass
+
+        assert new_session is not session
+        assert session.close.called
+        assert self.pool.num_open == 1
+
+    def test_idle_sessions_beyond_min_size_are_closed(self):
+        first_session = self.pool.checkout()
+        second_session = self.pool.checkout()
+        self.pool.checkin(first_session)
+        self.pool.checkin(second_session)
+        self.now = 301
+
+        with self.pool.session() as session:
+            pass
+
+        # The most recently used session is closed, the remaining one is validated and reused.
+        assert second_session.close.called
+        assert session is first_session
+        assert self.pool.num_open == 1
+
+    def test_old_sessions_are_recycled(self):
+        with self.pool.session() as session:
+            self.now = 3600
+
+        assert session.close.called
+        assert self.pool.num_open == 0
+
+        with self.pool.session() as new_session:
+            pass
+        assert new_session is not session
+
+    def test_sessions_are_discarded_after_teradata_errors(self):
+        with pytest.raises(teradata_errors.TeradataError):
+            with self.pool.session() as session:
+                raise teradata_errors.TeradataError('DatabaseError')
+
+        assert session.close.called
+        assert self.pool.num_open == 0
+
+    def test_sessions_are_returned_after_other_errors(self):
+        with pytest.raises(ValueError):
+            with self.pool.session() as session:
+                raise ValueError()
+
+        assert not session.close.called
+        assert self.pool.num_idle == 1
+
+    def test_failed_logon_releases_slot(self):
+        self.teradata_connection.side_effect = teradata_errors.TeradataError('Logon failed.')
+        with pytest.raises(teradata_errors.TeradataError):
+            self.pool.checkout()
+
+        assert self.pool.num_open == 0
+
+    def test_close(self):
+        idle_session = self.pool.checkout()
+        checked_out_session = self.pool.checkout()
+        self.pool.checkin(idle_session)
+
+        self.pool.close()
+        assert idle_session.close.called
+        assert not checked_out_session.close.called
+
+        self.pool.checkin(checked_out_session)
+        assert checked_out_session.close.called
+        assert self.pool.num_open == 0
+
+        with pytest.raises(teradata_errors.TeradataError):
+            self.pool.checkout()
+
+
+def test_get_pool():
+    """The pool should be shared until it is closed."""
+    pool = teradata_session_pool.get_pool()
+    assert teradata_session_pool.get_pool() is pool
+
+    teradata_session_pool.close_pool()
+    assert teradata_session_pool.get_pool() is not pool
+    teradata_session_pool.close_pool()
@@ -0,0 +1,64 @@
+"""Tests for Teradata execute methods."""
+from claims_to_quality.lib.connectors import teradata_session_pool
+from claims_to_quality.lib.teradata_methods import execute, teradata_errors
+
+import mock
+
+import pytest
+
+import teradata
+
+
+def teardown_function(function):
+    """Forget the sessions pooled by each test."""
+    teradata_session_pool.close_pool()
+
+
+def _get_session(batches):
+    session = mock.MagicMock()
+    cursor = session.cursor.return_value.__enter__.return_value
+    cursor.fetchmany.side_effect = batches
+    return session, cursor
+
+
+def test_execute_iterator():
+    """Rows should be yielded across fetches."""
+    session, cursor = _get_session([[1, 2], [3], []])
+    assert list(execute.execute_iterator('query', arraysize=2, session=session)) == [1, 2, 3]
+    cursor.fetchmany.assert_called_with(2)
+    assert not session.close.called
+
+
+@mock.patch('claims_to_quality.lib.connectors.teradata_connector.teradata_connection')
+def test_execute_iterator_returns_pooled_session(teradata_connection):
+    """A session checked out by the iterator should be checked in once it is exhausted."""
+    session, _ = _get_session([[1], []])
+    teradata_connection.return_value = session
+    assert list(execute.execute_iterator('query', arraysize=2)) == [1]
+    assert not session.close.called
+    assert teradata_session_pool.get_pool().num_idle == 1
+
+
+@mock.patch('claims_to_quality.lib.connectors.teradata_connector.teradata_connection')
+def test_execute_reuses_pooled_session(teradata_connection):
+    """Queries executed without a session should share a pooled session."""
+    session = mock.MagicMock()
+    session.cursor.return_value.__enter__.return_value.fetchall.return_value = [1]
+    teradata_connection.return_value = session
+
+    assert execute.execute('query') == [1]
+    assert execute.execute('query') == [1]
+
+    assert teradata_connection.call_count == 1
+    assert not session.close.called
+
+
+@mock.patch('claims_to_quality.lib.connectors.teradata_connector.teradata_connection')
+def test_execute_iterator_database_error(teradata_connection):
+    """Database errors should be raised as TeradataErrors, closing the pooled session."""
+    session, _ = _get_session(teradata.api.DatabaseError(1, 'error'))
+    teradata_connection.return_value = session
+    with pytest.raises(teradata_errors.TeradataError):
+        list(execute.execute_iterator('query', arraysize=2))
+    assert session.close.called
+    assert teradata_session_pool.get_pool().num_open == 0
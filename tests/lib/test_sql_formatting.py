@@ -2,6 +2,8 @@
 from claims_to_quality.lib.teradata_methods import measures_to_sql
 from claims_to_quality.lib.teradata_methods import sql_formatting
 
+import mock
+
 import pytest
 
 
@@ -31,3 +33,14 @@ def test_convert_procedure_codes_to_sql_condition():
     expected = "CLM_LINE_HCPCS_CD IN ('code1', 'code2', 'code3')"
 
     assert output == expected
+
+
+def test_get_relevant_claim_lines_condition():
+    measure_definitions = [
+        mock.Mock(procedure_code_map={'code2': {}, 'code1': {}}),
+        mock.Mock(procedure_code_map={'code1': {}, 'code3': {}}),
+    ]
+    output = measures_to_sql.get_relevant_claim_lines_condition(measure_definitions)
+    expected = "CLM_LINE_HCPCS_CD IN ('code1', 'code2', 'code3')"
+
+    assert output == expected
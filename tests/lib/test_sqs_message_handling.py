@@ -1,5 +1,6 @@
 """Tests for sqs_methods."""
 from claims_to_quality.lib.sqs_methods import message_handling
+from claims_to_quality.lib.sqs_methods.mock_message import MockMessage, MockSQSClient
 
 import mock
 
@@ -159,3 +160,49 @@ class TestSendMessages():
 
         expected = [('test1', 'test2', 'test3'), ('test4', 'filled', 'filled')]
         assert list(output) == expected
+
+
+class TestBatchRequests():
+    """Tests of the batch deletion and visibility changes of received messages."""
+
+    def setup(self):
+        """Create messages received from a mock queue."""
+        self.client = MockSQSClient()
+        self.messages = [MockMessage(body='{}', client=self.client) for _ in range(23)]
+
+    def test_delete_messages(self):
+        """Messages are deleted in groups of BOTO_MAX_SEND_LIMIT."""
+        with mock.patch.object(
+            self.client, 'delete_message_batch', wraps=self.client.delete_message_batch
+        ) as delete_message_batch:
+            failed_messages = message_handling.delete_messages(self.messages)
+
+        assert failed_messages == []
+        assert all(message.deleted for message in self.messages)
+        assert delete_message_batch.call_count == 3
+
+    def test_delete_messages_failures(self):
+        """Messages which could not be deleted are returned."""
+        self.client.delete_message_batch = mock.Mock(return_value={
+            'Successful': [{'Id': '0'}],
+            'Failed': [{'Id': '1', 'SenderFault': True, 'Code': 'ReceiptHandleIsInvalid'}]
+        })
+
+        failed_messages = message_handling.delete_messages(self.messages[:2])
+
+        assert failed_messages == [self.messages[1]]
+
+    def test_delete_messages_request_error(self):
+        """All the messages of a group are returned if the request fails."""
+        self.client.delete_message_batch = mock.Mock(side_effect=Exception('Network error.'))
+
+        failed_messages = message_handling.delete_messages(self.messages[:2])
+
+        assert failed_messages == self.messages[:2]
+
+    def test_change_messages_visibility(self):
+        """The visibility timeout of the messages is changed."""
+        failed_messages = message_handling.change_messages_visibility(self.messages, 300)
+
+        assert failed_messages == []
+        assert all(message.visibility_timeout == 300 for message in self.messages)
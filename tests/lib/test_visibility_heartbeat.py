@@ -0,0 +1,64 @@
+"""Tests for the extension of the visibility timeout of SQS messages."""
+import threading
+
+from claims_to_quality.lib.sqs_methods import visibility_heartbeat
+from claims_to_quality.lib.sqs_methods.mock_message import MockMessage
+
+import mock
+
+
+class TestVisibilityHeartbeat():
+    """Tests for the VisibilityHeartbeat class."""
+
+    def setup(self):
+        """Create a heartbeat with a fake clock."""
+        self.now = 0
+        self.heartbeat = visibility_heartbeat.VisibilityHeartbeat(
+            visibility_timeout=300, interval=3600, max_tracked_seconds=1000,
+            clock=lambda: self.now)
+        self.messages = [MockMessage(body='{}') for _ in range(3)]
+
+    def teardown(self):
+        """Stop the heartbeat thread."""
+        self.heartbeat.stop()
+
+    def test_extend(self):
+        self.heartbeat.track(self.messages)
+        self.heartbeat.extend()
+
+        assert [message.visibility_timeout for message in self.messages] == [300] * 3
+
+    def test_untracked_messages_are_not_extended(self):
+        self.heartbeat.track(self.messages)
+        self.heartbeat.untrack(self.messages[:2])
+        self.heartbeat.extend()
+
+        assert [message.visibility_timeout for message in self.messages] == [None, None, 300]
+        assert len(self.heartbeat) == 1
+
+    def test_messages_are_untracked_after_max_tracked_seconds(self):
+        self.heartbeat.track(self.messages)
+        self.now = 1000
+        self.heartbeat.extend()
+
+        assert len(self.heartbeat) == 0
+        assert [message.visibility_timeout for message in self.messages] == [None] * 3
+
+    @mock.patch('claims_to_quality.lib.sqs_methods.visibility_heartbeat.message_handling')
+    def test_failed_messages_are_untracked(self, mock_message_handling):
+        mock_message_handling.change_messages_visibility.return_value = self.messages[:1]
+        self.heartbeat.track(self.messages)
+        self.heartbeat.extend()
+
+        assert len(self.heartbeat) == 2
+
+    def test_heartbeat_thread_extends_visibility(self):
+        heartbeat = visibility_heartbeat.VisibilityHeartbeat(
+            visibility_timeout=300, interval=0.01, max_tracked_seconds=1000)
+        extended = threading.Event()
+        with mock.patch.object(heartbeat, 'extend', side_effect=extended.set):
+            heartbeat.track(self.messages)
+            assert extended.wait(timeout=5)
+            heartbeat.stop()
+
+        assert len(heartbeat) == 0